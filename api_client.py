@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+
+from ocr_pipeline import cached_result, content_hash
+from rate_limiter import RateLimitExceeded
+
+# When set, main.py explains and OCRs through the API service instead of in-process
+API_URL = os.environ.get("EXPLAINMATE_API_URL")
+TIMEOUT = float(os.environ.get("EXPLAINMATE_LLM_TIMEOUT", 60))
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+class ApiClientError(Exception):
+    pass
+
+
+def _client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            # Only needed when the app talks to the API service
+            import httpx
+            _http_client = httpx.Client(timeout=TIMEOUT)
+        return _http_client
+
+
+def iter_sse(lines):
+    """Parse server-sent event lines into (event, data) pairs, data decoded from JSON"""
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def _request(method, path, access_token, base_url=None, **kwargs):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = _client().request(method, (base_url or API_URL).rstrip("/") + path, headers=headers, **kwargs)
+    if response.is_error:
+        raise ApiClientError(f"HTTP {response.status_code}: {response.text}")
+    return response.json() if response.content else None
+
+
+def _events(path, access_token, base_url=None, **kwargs):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    with _client().stream("POST", (base_url or API_URL).rstrip("/") + path, headers=headers, **kwargs) as response:
+        if response.status_code == 429:
+            response.read()
+            error = response.json()
+            raise RateLimitExceeded(error.get("reason", "user"), float(error.get("retry_after", 1)))
+        if response.is_error:
+            response.read()
+            raise ApiClientError(f"HTTP {response.status_code}: {response.text}")
+        for event, data in iter_sse(response.iter_lines()):
+            if event == "error":
+                raise ApiClientError(data.get("error", "Request failed"))
+            if event == "done":
+                return
+            yield event, data
+
+
+def stream_explain(prompt, style, access_token, base_url=None):
+    """Yield an explanation's text deltas from the API service's /explain/stream"""
+    for event, data in _events("/explain/stream", access_token, base_url, json={"prompt": prompt, "style": style}):
+        if event == "delta":
+            yield data["text"]
+
+
+def extract_text(data, filename, access_token, base_url=None):
+    """OCR an image or document through the API service; returns the text of all pages.
+
+    Results are kept in the local OCR cache so reruns don't upload the file again.
+    """
+    def fetch():
+        pages = [page["text"] for event, page in _events("/ocr/stream", access_token, base_url,
+                                                         content=data, params={"filename": filename})
+                 if event == "page"]
+        return "\n\n".join(text for text in pages if text)
+
+    return cached_result(f"api:{content_hash(data)}", fetch)
+
+
+def load_history(access_token, limit=20, base_url=None):
+    """Return (entries, has_more): the user's most recent explanation history from the API service"""
+    data = _request("GET", "/history", access_token, base_url, params={"limit": limit})
+    return data["entries"], data["next_cursor"] is not None
+
+
+def delete_history_entry(entry_id, access_token, base_url=None):
+    _request("DELETE", f"/history/{entry_id}", access_token, base_url)
@@ -0,0 +1,349 @@
+"""HTTP API for explanations, OCR and notes, served from one asyncio event loop.
+
+Usage:
+    uvicorn api_server:app --host 0.0.0.0 --port 8000 [--workers 2]
+
+Every endpoint except ``/health`` and ``/metrics`` needs an
+``Authorization: Bearer <Supabase access token>`` header.
+
+    POST   /explain              {"prompt", "style"} -> {"explanation"}
+    POST   /explain/stream       same body, answered as server-sent events:
+                                 ``delta`` events with {"text"}, then ``done`` (or ``error``)
+    POST   /ocr?filename=...     raw image, PDF or TIFF body -> {"text", "pages"}
+    POST   /ocr/stream?filename= same body, one ``page`` event {"page", "total", "text"}
+                                 per page as it is read, then ``done``
+    GET    /notes?limit=20       -> {"notes", "has_more"}
+    GET    /notes/search?q=...   -> {"notes"}
+    POST   /notes                {"question", "content"}
+    PUT    /notes/{id}           {"content"}
+    DELETE /notes/{id}
+    GET    /history?limit=20&cursor=...
+                                 -> {"entries", "next_cursor"}: explanations the user was shown,
+                                 most recent first, with their text
+    DELETE /history/{id}
+    GET    /usage?days=7         -> {"usage"}: the user's tokens per day and model
+    GET    /metrics              Prometheus text from profiler.py
+
+Requests over a rate limit or the daily token budget get HTTP 429 with a
+Retry-After header and {"error", "reason", "retry_after"}.
+
+Explanations stream from OpenRouter on the event loop through one
+AsyncLLMClient, so an open stream costs a coroutine rather than a thread.
+OCR, notes and cache lookups are blocking and run in worker threads.
+"""
+import json
+import math
+import os
+from contextlib import asynccontextmanager
+
+from PIL import UnidentifiedImageError
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import notes_store
+import profiler
+from app_config import get_config
+from document_ingest import is_document, ocr_document
+from explainer import astream_explain
+from explanation_history import get_explanation_history
+from llm_client import create_async_client
+from ocr_pipeline import extract_text
+from rate_limiter import RateLimitExceeded
+from session_manager import is_auth_error, session_for_token
+from usage_ledger import get_usage_ledger
+
+STYLES = ("Simple", "Technical")
+MAX_PROMPT_CHARS = int(os.environ.get("EXPLAINMATE_API_MAX_PROMPT", 4000))
+MAX_UPLOAD_BYTES = int(os.environ.get("EXPLAINMATE_API_MAX_UPLOAD", 20 * 1024 * 1024))
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _session(request):
+    """UserSession for the request's bearer token; raises ApiError(401) without a valid one"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise ApiError(401, "Missing bearer token")
+    session = await run_in_threadpool(session_for_token, token.strip())
+    if session is None:
+        raise ApiError(401, "Invalid or expired access token")
+    return session
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ApiError(400, "Request body must be JSON")
+    if not isinstance(body, dict):
+        raise ApiError(400, "Request body must be a JSON object")
+    return body
+
+
+async def _explain_args(request):
+    body = await _json_body(request)
+    prompt = body.get("prompt")
+    style = body.get("style", "Simple")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ApiError(400, "prompt is required")
+    if len(prompt) > MAX_PROMPT_CHARS:
+        raise ApiError(413, f"prompt is longer than {MAX_PROMPT_CHARS} characters")
+    if style not in STYLES:
+        raise ApiError(400, f"style must be one of {', '.join(STYLES)}")
+    return prompt.strip(), style
+
+
+async def _upload(request):
+    if int(request.headers.get("Content-Length") or 0) > MAX_UPLOAD_BYTES:
+        raise ApiError(413, f"Upload is larger than {MAX_UPLOAD_BYTES} bytes")
+    data = await request.body()
+    if not data:
+        raise ApiError(400, "Request body must be the image or document")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ApiError(413, f"Upload is larger than {MAX_UPLOAD_BYTES} bytes")
+    return data, request.query_params.get("filename", "upload")
+
+
+def _note_id(note_id):
+    return int(note_id) if note_id.isdigit() else note_id
+
+
+def endpoint(func):
+    """Turn ApiError and Supabase token rejections into JSON error responses"""
+    async def wrapper(request):
+        try:
+            return await func(request)
+        except ApiError as e:
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+        except RateLimitExceeded as e:
+            return JSONResponse({"error": str(e), "reason": e.reason, "retry_after": round(e.retry_after, 1)},
+                                status_code=429, headers={"Retry-After": str(math.ceil(e.retry_after))})
+        except Exception as e:
+            if is_auth_error(e):
+                return JSONResponse({"error": "Access token was rejected"}, status_code=401)
+            print(f"Error handling {request.method} {request.url.path}: {str(e)}")
+            return JSONResponse({"error": "Internal error"}, status_code=500)
+    return wrapper
+
+
+async def health(request):
+    return JSONResponse({"ok": True})
+
+
+async def metrics(request):
+    return PlainTextResponse(profiler.prometheus_text())
+
+
+@endpoint
+async def explain(request):
+    session = await _session(request)
+    prompt, style = await _explain_args(request)
+    state = request.app.state
+    with profiler.span("api.explain"):
+        output = ""
+        async for delta in astream_explain(prompt, style, state.api_key, state.llm, user_id=session.user_id):
+            output += delta
+    if not output:
+        raise ApiError(502, "Could not generate explanation")
+    return JSONResponse({"explanation": output})
+
+
+@endpoint
+async def explain_stream(request):
+    session = await _session(request)
+    prompt, style = await _explain_args(request)
+    state = request.app.state
+    stream = astream_explain(prompt, style, state.api_key, state.llm, user_id=session.user_id)
+    # Wait for the first delta before answering, so rate limits can still be a 429
+    try:
+        first = await anext(stream)
+    except StopAsyncIteration:
+        raise ApiError(502, "Could not generate explanation")
+
+    async def events():
+        yield sse_event("delta", {"text": first})
+        try:
+            async for delta in stream:
+                yield sse_event("delta", {"text": delta})
+        except Exception as e:
+            print(f"Error streaming explanation: {str(e)}")
+            yield sse_event("error", {"error": "Explanation stream failed"})
+            return
+        yield sse_event("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@endpoint
+async def ocr(request):
+    await _session(request)
+    data, filename = await _upload(request)
+    try:
+        if is_document(filename):
+            pages = await run_in_threadpool(lambda: list(ocr_document(data, filename)))
+            texts = [{"page": number, "text": text} for number, _, text in pages]
+        else:
+            texts = [{"page": 1, "text": await run_in_threadpool(extract_text, data)}]
+    except (UnidentifiedImageError, ValueError) as e:
+        raise ApiError(400, f"Could not read the upload: {str(e)}")
+    return JSONResponse({"text": "\n\n".join(page["text"] for page in texts if page["text"]), "pages": texts})
+
+
+@endpoint
+async def ocr_stream(request):
+    await _session(request)
+    data, filename = await _upload(request)
+
+    async def events():
+        try:
+            if is_document(filename):
+                async for number, total, text in iterate_in_threadpool(ocr_document(data, filename)):
+                    yield sse_event("page", {"page": number, "total": total, "text": text})
+            else:
+                text = await run_in_threadpool(extract_text, data)
+                yield sse_event("page", {"page": 1, "total": 1, "text": text})
+        except Exception as e:
+            print(f"Error processing upload: {str(e)}")
+            yield sse_event("error", {"error": f"Could not read the upload: {str(e)}"})
+            return
+        yield sse_event("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@endpoint
+async def list_notes(request):
+    session = await _session(request)
+    try:
+        limit = max(1, min(int(request.query_params.get("limit", 20)), 1000))
+    except ValueError:
+        raise ApiError(400, "limit must be a number")
+    notes, has_more = await run_in_threadpool(notes_store.load_notes_page, session, limit)
+    return JSONResponse({"notes": notes, "has_more": has_more})
+
+
+@endpoint
+async def search_notes(request):
+    session = await _session(request)
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        raise ApiError(400, "q is required")
+    notes = await run_in_threadpool(notes_store.search_notes, session, query)
+    return JSONResponse({"notes": notes})
+
+
+@endpoint
+async def create_note(request):
+    session = await _session(request)
+    body = await _json_body(request)
+    content = body.get("content")
+    if not isinstance(content, str) or not content.strip():
+        raise ApiError(400, "content is required")
+    if not await run_in_threadpool(notes_store.save_note, session, body.get("question", ""), content):
+        raise ApiError(502, "Failed to save note")
+    return JSONResponse({"ok": True}, status_code=201)
+
+
+@endpoint
+async def update_note(request):
+    session = await _session(request)
+    body = await _json_body(request)
+    content = body.get("content")
+    if not isinstance(content, str):
+        raise ApiError(400, "content is required")
+    note_id = _note_id(request.path_params["note_id"])
+    if not await run_in_threadpool(notes_store.update_note, session, note_id, content):
+        raise ApiError(404, "Note not found")
+    return JSONResponse({"ok": True})
+
+
+@endpoint
+async def delete_note(request):
+    session = await _session(request)
+    note_id = _note_id(request.path_params["note_id"])
+    if not await run_in_threadpool(notes_store.delete_note, session, note_id):
+        raise ApiError(404, "Note not found")
+    return Response(status_code=204)
+
+
+@endpoint
+async def list_history(request):
+    session = await _session(request)
+    try:
+        limit = max(1, min(int(request.query_params.get("limit", 20)), 100))
+    except ValueError:
+        raise ApiError(400, "limit must be a number")
+    try:
+        entries, next_cursor = await run_in_threadpool(get_explanation_history().page, session.user_id, limit,
+                                                       request.query_params.get("cursor"))
+    except ValueError:
+        raise ApiError(400, "Invalid cursor")
+    return JSONResponse({"entries": entries, "next_cursor": next_cursor})
+
+
+@endpoint
+async def delete_history(request):
+    session = await _session(request)
+    entry_id = request.path_params["entry_id"]
+    if not entry_id.isdigit() or not await run_in_threadpool(get_explanation_history().delete, session.user_id,
+                                                             int(entry_id)):
+        raise ApiError(404, "History entry not found")
+    return Response(status_code=204)
+
+
+@endpoint
+async def usage(request):
+    session = await _session(request)
+    try:
+        days = max(1, min(int(request.query_params.get("days", 7)), 366))
+    except ValueError:
+        raise ApiError(400, "days must be a number")
+    rows = await run_in_threadpool(get_usage_ledger().rows, None, session.user_id, days)
+    return JSONResponse({"usage": rows})
+
+
+def create_app(api_key=None):
+    """Build the Starlette app; ``api_key`` defaults to OPENROUTER_API_KEY from the config"""
+    @asynccontextmanager
+    async def lifespan(app):
+        # The async client's pool and semaphore belong to the event loop they were created on
+        app.state.api_key = api_key or get_config().openrouter_api_key
+        app.state.llm = create_async_client()
+        try:
+            yield
+        finally:
+            await app.state.llm.aclose()
+
+    return Starlette(
+        routes=[
+            Route("/health", health),
+            Route("/metrics", metrics),
+            Route("/explain", explain, methods=["POST"]),
+            Route("/explain/stream", explain_stream, methods=["POST"]),
+            Route("/ocr", ocr, methods=["POST"]),
+            Route("/ocr/stream", ocr_stream, methods=["POST"]),
+            Route("/notes", list_notes, methods=["GET"]),
+            Route("/notes", create_note, methods=["POST"]),
+            Route("/notes/search", search_notes, methods=["GET"]),
+            Route("/notes/{note_id}", update_note, methods=["PUT"]),
+            Route("/notes/{note_id}", delete_note, methods=["DELETE"]),
+            Route("/history", list_history, methods=["GET"]),
+            Route("/history/{entry_id}", delete_history, methods=["DELETE"]),
+            Route("/usage", usage),
+        ],
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
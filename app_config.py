@@ -0,0 +1,67 @@
+import os
+import threading
+import tomllib
+
+DEFAULT_SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+KEYS = (
+    "OPENROUTER_API_KEY",
+    "SUPABASE_URL",
+    "SUPABASE_KEY",
+    "SUPABASE_JWT_SECRET",
+    "AIRTABLE_API_KEY",
+    "AIRTABLE_BASE_ID",
+    "AIRTABLE_TABLE_NAME",
+)
+# Placeholders for the settings the stand-ins in local_stubs.py replace when EXPLAINMATE_OFFLINE=1
+OFFLINE_DEFAULTS = {
+    "OPENROUTER_API_KEY": "offline",
+    "SUPABASE_URL": "http://localhost:54321",
+    "SUPABASE_KEY": "offline",
+    "AIRTABLE_API_KEY": "offline",
+    "AIRTABLE_BASE_ID": "offline",
+    "AIRTABLE_TABLE_NAME": "feedback",
+}
+
+_default_config = None
+_default_config_lock = threading.Lock()
+
+
+class Config:
+    """Credentials for the core modules, independent of Streamlit.
+
+    Each setting comes from the environment variable of the same name, or
+    else from the secrets file the Streamlit app reads, so the app, the API
+    service and the CLIs share one set of credentials.
+    """
+
+    def __init__(self, **values):
+        unknown = set(values) - set(KEYS)
+        if unknown:
+            raise TypeError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        for key in KEYS:
+            setattr(self, key.lower(), values.get(key))
+
+    @classmethod
+    def load(cls, secrets_path=None):
+        secrets_path = secrets_path or os.environ.get("EXPLAINMATE_SECRETS_PATH", DEFAULT_SECRETS_PATH)
+        secrets = {}
+        if os.path.exists(secrets_path):
+            with open(secrets_path, "rb") as f:
+                secrets = tomllib.load(f)
+        defaults = OFFLINE_DEFAULTS if os.environ.get("EXPLAINMATE_OFFLINE") == "1" else {}
+        return cls(**{key: os.environ.get(key) or secrets.get(key) or defaults.get(key) for key in KEYS})
+
+    def require(self, *names):
+        """Raise KeyError naming the first of ``names`` (e.g. "supabase_url") that is unset"""
+        for name in names:
+            if not getattr(self, name):
+                raise KeyError(f"{name.upper()} is not set in the environment or secrets file")
+
+
+def get_config():
+    """Return the process-wide Config, loaded on first use"""
+    global _default_config
+    with _default_config_lock:
+        if _default_config is None:
+            _default_config = Config.load()
+        return _default_config
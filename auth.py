@@ -1,6 +1,8 @@
 import streamlit as st
 import urllib.parse
-from supabase_config import supabase
+from supabase_config import SUPABASE_URL, get_session_manager, init_session
+from notes_repository import drop_repository
+from profiler import timed
 
 def validate_url(url):
     """Validate that the URL is properly formatted"""
@@ -15,7 +17,7 @@ def login_form():
     st.title("🔒 Welcome to ExplainMate")
     
     # Check Supabase configuration
-    url = supabase.supabase_url
+    url = SUPABASE_URL
     if not validate_url(url):
         st.error("""
         ⚠️ Invalid Supabase URL configuration! 
@@ -41,8 +43,8 @@ def login_form():
                 
             with st.spinner("Logging in..."):
                 try:
-                    # Sign in and get session
-                    res = supabase.auth.sign_in_with_password({"email": email, "password": password})
+                    # Sign in with this browser session's own client
+                    res = get_session_manager().sign_in(email, password)
                     
                     # Store session in Streamlit session state
                     st.session_state["user"] = res.user
@@ -84,7 +86,7 @@ def login_form():
                 
             with st.spinner("Creating account..."):
                 try:
-                    res = supabase.auth.sign_up({"email": email, "password": password})
+                    res = get_session_manager().sign_up(email, password)
                     st.success("Account created! Please check your email to verify your account.")
                 except Exception as e:
                     error_msg = str(e).lower()
@@ -104,18 +106,22 @@ def logout():
                 if key in st.session_state:
                     st.session_state.pop(key)
             
-            # Sign out from Supabase
-            supabase.auth.sign_out()
+            # Sign out from Supabase, dropping the user's cached notes
+            manager = get_session_manager()
+            if manager.user is not None:
+                drop_repository(manager.user.id)
+            manager.sign_out()
             st.rerun()
 
+@timed("auth.check")
 def check_auth():
-    """Always check the Supabase session for authentication, per user/browser."""
+    """Check this browser session's authentication.
+    
+    Runs on every rerun, so it only checks the token's expiry locally; the
+    session manager refreshes the token shortly before it expires.
+    """
     try:
-        # Always check Supabase session on every request
-        session = supabase.auth.get_session()
-        if session and session.user:
-            st.session_state['user'] = session.user
-            st.session_state['session'] = session
+        if init_session():
             return True
         else:
             # No valid session, show login
@@ -0,0 +1,255 @@
+"""Precompute explanations for a question bank and warm the explanation cache.
+
+Usage:
+    python batch_explain.py run questions.csv --output results.jsonl [--workers 4] [--rate 2]
+    python batch_explain.py load results.jsonl
+
+``run`` reads questions from a CSV (columns ``question`` and optionally
+``style`` and ``id``) or JSONL file (same keys), explains them concurrently
+and appends each result to the output as soon as it is ready. Rerunning the
+same command resumes: items already in the output are skipped. Output ending
+in ``.db``/``.sqlite`` is written to a SQLite table instead of JSONL.
+
+``load`` copies a results file into the explanation cache, e.g. on another
+machine that shares the question bank.
+
+The OpenRouter key is read from OPENROUTER_API_KEY or .streamlit/secrets.toml.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app_config import get_config
+from explainer import explain
+from rate_limiter import RateLimitExceeded
+from explanation_cache import get_default_cache, make_cache_key
+from model_router import get_router
+from prompts import ACTIVE_VERSION, get_prompt
+
+STYLES = ("Simple", "Technical")
+
+
+def item_id(question, style, model):
+    return hashlib.sha1(json.dumps([question, style, model]).encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path, default_style, model):
+    """Yield {"id", "question", "style"} dicts from a CSV or JSONL file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            question = (row.get("question") or "").strip()
+            if not question:
+                continue
+            style = row.get("style") or default_style
+            if style not in STYLES:
+                raise ValueError(f"Unknown style {style!r} for question {question!r}")
+            yield {"id": str(row.get("id") or item_id(question, style, model)), "question": question, "style": style}
+
+
+class JsonlResults:
+    """Append-only JSONL result file; existing rows act as the resume checkpoint"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def completed_ids(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, encoding="utf-8") as f:
+            return {json.loads(line)["id"] for line in f if line.strip()}
+
+    def write(self, result):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def read(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class SQLiteResults:
+    """Result table in a SQLite file; existing rows act as the resume checkpoint"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    id TEXT PRIMARY KEY, question TEXT, style TEXT, model TEXT,
+                    explanation TEXT, latency REAL, created_at TEXT, prompt_version TEXT
+                )"""
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+            if "prompt_version" not in columns:
+                self._conn.execute("ALTER TABLE results ADD COLUMN prompt_version TEXT")
+
+    def completed_ids(self):
+        return {row[0] for row in self._conn.execute("SELECT id FROM results")}
+
+    def write(self, result):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (id, question, style, model, explanation, latency, created_at, prompt_version) "
+                "VALUES (:id, :question, :style, :model, :explanation, :latency, :created_at, :prompt_version)",
+                result,
+            )
+
+    def read(self):
+        cursor = self._conn.execute("SELECT id, question, style, model, explanation, latency, created_at, prompt_version FROM results")
+        columns = [c[0] for c in cursor.description]
+        for row in cursor:
+            yield dict(zip(columns, row))
+
+
+def open_results(path):
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteResults(path)
+    return JsonlResults(path)
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all worker threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+def latency_histogram(latencies):
+    """Text histogram of latencies in power-of-two buckets"""
+    if not latencies:
+        return ""
+    buckets = {}
+    for seconds in latencies:
+        upper = 0.125
+        while seconds > upper:
+            upper *= 2
+        buckets[upper] = buckets.get(upper, 0) + 1
+    width = max(buckets.values())
+    lines = []
+    for upper in sorted(buckets):
+        bar = "#" * max(1, round(40 * buckets[upper] / width))
+        lines.append(f"  <= {upper:7.3f}s {buckets[upper]:6d} {bar}")
+    return "\n".join(lines)
+
+
+def get_api_key():
+    return get_config().openrouter_api_key
+
+
+def run(args):
+    api_key = get_api_key()
+    if not api_key:
+        sys.exit("Set OPENROUTER_API_KEY or add it to .streamlit/secrets.toml")
+
+    results = open_results(args.output)
+    done = results.completed_ids()
+    items = [item for item in read_questions(args.input, args.style, args.model) if item["id"] not in done]
+    print(f"{len(done)} already done, {len(items)} to explain with {args.workers} workers")
+
+    limiter = RateLimiter(args.rate)
+    latencies = []
+    failures = 0
+
+    def work(item):
+        limiter.wait()
+        start = time.perf_counter()
+        try:
+            explanation = explain(item["question"], item["style"], api_key, model=args.model)
+        except RateLimitExceeded as e:
+            # Left out of the output, so rerunning the command retries it
+            print(f"Rate limited: {str(e)}")
+            explanation = None
+        return item, explanation, time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(work, item) for item in items]
+        for i, future in enumerate(as_completed(futures), 1):
+            item, explanation, latency = future.result()
+            if not explanation:
+                failures += 1
+                print(f"[{i}/{len(items)}] failed: {item['question']}")
+                continue
+            latencies.append(latency)
+            results.write(dict(
+                item,
+                model=args.model,
+                prompt_version=ACTIVE_VERSION,
+                explanation=explanation,
+                latency=round(latency, 3),
+                created_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            ))
+            print(f"[{i}/{len(items)}] {latency:6.2f}s {item['question'][:60]}")
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{len(latencies)} explained, {failures} failed in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed if elapsed else 0:.2f} items/s)")
+    if latencies:
+        print(latency_histogram(latencies))
+
+
+def load(args):
+    cache = get_default_cache()
+    count = 0
+    for result in open_results(args.input).read():
+        # Routed answers are cached under the tier's primary model, as explainer does
+        model = result.get("model") or get_router().primary(result["style"])
+        # Results written before prompt versions existed came from the original prompt
+        template = get_prompt(result["style"], result.get("prompt_version") or "v1")
+        key = make_cache_key(result["question"], result["style"], model, template.version)
+        cache.set(key, result["explanation"], prompt=result["question"], style=result["style"], model=model)
+        count += 1
+    print(f"Loaded {count} explanations into the cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute explanations for a question bank")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="explain every question in a CSV/JSONL file")
+    run_parser.add_argument("input", help="CSV or JSONL file with a 'question' column")
+    run_parser.add_argument("--output", required=True, help="results .jsonl or .db file (also the resume checkpoint)")
+    run_parser.add_argument("--style", default="Simple", choices=STYLES, help="style for rows without one")
+    run_parser.add_argument("--model", help="pin one model (default: route through the style's model tier)")
+    run_parser.add_argument("--workers", type=int, default=4)
+    run_parser.add_argument("--rate", type=float, default=0, help="max requests per second (0 = unlimited)")
+    run_parser.set_defaults(func=run)
+
+    load_parser = commands.add_parser("load", help="load a results file into the explanation cache")
+    load_parser.add_argument("input", help="results .jsonl or .db file")
+    load_parser.set_defaults(func=load)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Concurrent SSE explanation streams through the API service on one event loop.
+
+Usage:
+    python benchmarks/bench_api.py [--clients 10 100 400] [--first-token-delay 0.5] [--token-delay 0.02]
+
+Starts the fake OpenRouter server and ``uvicorn api_server:app`` as
+subprocesses, then opens ``--clients`` simultaneous /explain/stream requests
+for distinct questions (so every one is a cache miss and a real upstream
+stream). Reports time to first delta, total stream time and the service
+process's peak thread count (Linux), which stays flat as clients grow.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = "bench-secret-" + "x" * 32
+
+
+def make_token():
+    return jwt.encode({"sub": "bench-user", "aud": "authenticated", "exp": int(time.time()) + 3600},
+                      SECRET, algorithm="HS256")
+
+
+async def one_stream(client, url, token, prompt):
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", url + "/explain/stream", json={"prompt": prompt},
+                             headers={"Authorization": f"Bearer {token}"}) as response:
+        async for line in response.aiter_lines():
+            if first is None and line.startswith("event: delta"):
+                first = time.perf_counter() - start
+            if line.startswith("event: error"):
+                raise RuntimeError("stream failed")
+    return first, time.perf_counter() - start
+
+
+def thread_count(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def wait_for(url):
+    for _ in range(200):
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.05)
+    sys.exit(f"{url} did not start")
+
+
+async def run_level(url, token, clients, run, pid):
+    peak = thread_count(pid)
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        tasks = [asyncio.ensure_future(one_stream(client, url, token, f"question {run}-{i}"))
+                 for i in range(clients)]
+        while not all(task.done() for task in tasks):
+            peak = max(peak, thread_count(pid))
+            await asyncio.sleep(0.05)
+        results = [task.result() for task in tasks]
+    firsts = sorted(first for first, _ in results)
+    totals = sorted(total for _, total in results)
+    return firsts, totals, peak
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 400])
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    fake_port = args.port + 1
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            SUPABASE_URL="http://supabase.invalid", SUPABASE_KEY="anon-key", SUPABASE_JWT_SECRET=SECRET,
+            OPENROUTER_API_KEY="bench-key", OPENROUTER_URL=f"http://127.0.0.1:{fake_port}/api/v1/chat/completions",
+            EXPLAINMATE_CACHE_BACKEND="memory", EXPLAINMATE_LLM_MAX_CONCURRENCY="1000",
+            EXPLAINMATE_LLM_POOL_SIZE="1000", PYTHONPATH=ROOT,
+            # Every client is the same user, and the concurrency under test is the service's, not the limiter's
+            EXPLAINMATE_USER_RATE="1000000", EXPLAINMATE_USER_BURST="1000000", EXPLAINMATE_MAX_CONCURRENT_LLM="1000",
+            # The service's SQLite files default to the app directory; keep the run's in the temporary one
+            EXPLAINMATE_USAGE_PATH=os.path.join(directory, "usage.db"), EXPLAINMATE_HISTORY="0",
+        )
+        fake = subprocess.Popen([sys.executable, os.path.join(ROOT, "benchmarks", "fake_openrouter.py"),
+                                 "--port", str(fake_port), "--first-token-delay", str(args.first_token_delay),
+                                 "--token-delay", str(args.token_delay)], stdout=subprocess.DEVNULL)
+        service = subprocess.Popen([sys.executable, "-m", "uvicorn", "api_server:app", "--port", str(args.port),
+                                    "--log-level", "warning"], cwd=directory, env=env)
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            wait_for(url + "/health")
+            token = make_token()
+            print(f"service threads at start: {thread_count(service.pid)}")
+            for run, clients in enumerate(args.clients):
+                started = time.perf_counter()
+                firsts, totals, peak = asyncio.run(run_level(url, token, clients, run, service.pid))
+                elapsed = time.perf_counter() - started
+                print(f"{clients:5d} clients  first delta p50 {statistics.median(firsts) * 1000:7.0f} ms  "
+                      f"p95 {percentile(firsts, 95) * 1000:7.0f} ms  stream p95 {percentile(totals, 95):5.2f}s  "
+                      f"wall {elapsed:5.2f}s  peak service threads {peak}")
+        finally:
+            service.terminate()
+            fake.terminate()
+            service.wait()
+            fake.wait()
+
+
+if __name__ == "__main__":
+    main()
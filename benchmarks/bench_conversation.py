@@ -0,0 +1,151 @@
+"""Request size and latency of follow-up questions over long sessions, per context strategy.
+
+Usage:
+    python benchmarks/bench_conversation.py [--sessions 10] [--turns 20] [--budget 1500] [--url URL]
+
+Each simulated session asks an opening question from data/questions.txt and
+then ``--turns - 1`` follow-ups through explainer.stream_follow_up, once per
+strategy:
+
+    full       every earlier turn is resent (no budget)
+    digest     turns over ``--budget`` are folded into a local digest
+    summarize  the same, with the digest written by the LLM
+
+Reports per strategy the prompt tokens sent at a few turns, the request
+body size, the share of prompt tokens upstream could serve from its prompt
+cache (``cached_tokens``), time to first token and to the whole answer, and
+the upstream requests made (summaries included).
+
+By default the requests go to the fake OpenRouter server with
+``budget_answers`` on, which caches prompt prefixes at message granularity
+and spends ``--prompt-token-delay`` seconds on each uncached prompt token.
+Pass ``--url`` (and OPENROUTER_API_KEY) to measure a real endpoint.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["EXPLAINMATE_CACHE_BACKEND"] = "memory"
+os.environ["EXPLAINMATE_HISTORY"] = "0"
+
+import explainer  # noqa: E402
+import functions  # noqa: E402
+import llm_client  # noqa: E402
+import rate_limiter  # noqa: E402
+import usage_ledger  # noqa: E402
+from conversation import Conversation  # noqa: E402
+from explanation_cache import get_default_cache  # noqa: E402
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+from prompts import estimate_tokens  # noqa: E402
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "questions.txt")
+FOLLOW_UPS = (
+    "Now explain it with an example.",
+    "Why does that happen?",
+    "How does this relate to what you said before?",
+    "Can you go through the formula step by step?",
+    "What is a common misconception about this?",
+    "Give me a harder example.",
+    "Summarize the key idea in two sentences.",
+)
+STRATEGIES = ("full", "digest", "summarize")
+REPORT_TURNS = (2, 5, 10, 20)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def session(n, strategy, args, opening):
+    budget = 10 ** 9 if strategy == "full" else args.budget
+    conversation = Conversation(args.style, budget=budget)
+    turns = []
+    for turn in range(args.turns):
+        question = opening if turn == 0 else FOLLOW_UPS[(n + turn) % len(FOLLOW_UPS)]
+        request = conversation.messages(question) if turn else None
+        start = time.perf_counter()
+        first = None
+        for _ in explainer.stream_follow_up(conversation, question, args.api_key, user_id=f"user-{n}"):
+            first = first or time.perf_counter() - start
+        turns.append({
+            "turn": turn + 1,
+            "first_token": first,
+            "latency": time.perf_counter() - start,
+            "request_bytes": len(json.dumps(request).encode("utf-8")) if request else None,
+            "prompt_tokens": sum(estimate_tokens(m["content"]) for m in request) if request else None,
+        })
+    return turns
+
+
+def run(strategy, args, server, questions):
+    explainer.SUMMARIZE_CONVERSATIONS = strategy == "summarize"
+    get_default_cache().clear()
+    if server is not None:
+        server.prefixes.clear()
+        before = (len(server.requests), server.prompt_tokens, server.cached_tokens)
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        sessions = list(pool.map(lambda n: session(n, strategy, args, questions[n % len(questions)]),
+                                 range(args.sessions)))
+    follow_ups = [turn for turns in sessions for turn in turns if turn["turn"] > 1]
+    line = f"{strategy:9} " + " ".join(
+        f"t{turn} {statistics.mean(t['prompt_tokens'] for t in follow_ups if t['turn'] == turn):6.0f}"
+        for turn in REPORT_TURNS if turn <= args.turns)
+    if server is not None:
+        prompt_tokens = server.prompt_tokens - before[1]
+        cached = (server.cached_tokens - before[2]) / prompt_tokens if prompt_tokens else 0.0
+        line += f" | upstream {len(server.requests) - before[0]:4d} cached {cached:4.0%} "
+    sizes = [turn["request_bytes"] for turn in follow_ups]
+    first = [turn["first_token"] for turn in follow_ups if turn["first_token"]]
+    latencies = [turn["latency"] for turn in follow_ups]
+    print(f"{line}| body mean {statistics.mean(sizes) / 1024:5.1f} KB max {max(sizes) / 1024:5.1f} KB | "
+          f"first token p50 {statistics.median(first) * 1000:6.0f} ms p95 {percentile(first, 95) * 1000:6.0f} ms | "
+          f"answer p50 {statistics.median(latencies):5.2f}s p95 {percentile(latencies, 95):5.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--budget", type=int, default=1500, help="context tokens for digest/summarize")
+    parser.add_argument("--style", default="Simple", choices=("Simple", "Technical"))
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--url", help="chat completions endpoint (default: a local fake server)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", "key"))
+    parser.add_argument("--token-delay", type=float, default=0.001, help="fake server seconds per output token")
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0002,
+                        help="fake server seconds per uncached prompt token")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        functions.OPENROUTER_URL = args.url
+    else:
+        server, functions.OPENROUTER_URL = start_fake_openrouter(first_token_delay=0.1,
+                                                                 token_delay=args.token_delay)
+        server.config["budget_answers"] = True
+        server.config["prompt_token_delay"] = args.prompt_token_delay
+    llm_client._default_client = llm_client.LLMClient(max_concurrency=args.sessions, pool_size=args.sessions)
+    rate_limiter._default_limiter = rate_limiter.RateLimiter(rate_per_minute=1e9, burst=10**9,
+                                                             max_concurrent=args.sessions * 2)
+    with open(QUESTIONS_PATH, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    print(f"{args.sessions} sessions x {args.turns} turns ({args.style}), context budget {args.budget} tokens; "
+          f"prompt tokens of follow-ups at turn {', '.join(str(t) for t in REPORT_TURNS if t <= args.turns)}")
+    with tempfile.TemporaryDirectory() as directory:
+        usage_ledger._default_ledger = usage_ledger.UsageLedger(os.path.join(directory, "usage.db"))
+        for strategy in args.strategies:
+            run(strategy, args, server, questions)
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
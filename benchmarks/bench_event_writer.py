@@ -0,0 +1,219 @@
+"""Event writer harness: UI-side latency, batching, outages and restarts against fake sinks.
+
+Usage:
+    python benchmarks/bench_event_writer.py [--events 500] [--latency 0.15]
+
+The fake sinks sleep ``--latency`` seconds per request like a remote
+round-trip, and the Airtable one enforces 5 requests per second, answering
+429 beyond that. Scenarios:
+
+  sync       one blocking write per event, as feedback.py and log_feedback did
+  queued     the same events through EventWriter.submit()
+  outage     the sinks fail for a while, then recover; nothing may be lost
+  restart    the writer is closed during an outage and a new one on the same
+             spool file delivers the backlog
+  shared     two writers (as two processes would) deliver one spool file's
+             backlog; no event may be sent twice
+  overload   a stalled worker with a small queue; drops must be counted
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import event_writer  # noqa: E402
+from event_writer import EventSpool, EventWriter  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSinkError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code)
+
+
+class FakeSink:
+    """Records every batch it accepts; can be taken down or rate limited"""
+
+    def __init__(self, latency, batch_size, min_interval=0.0, max_per_second=None):
+        self.latency = latency
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        self.max_per_second = max_per_second
+        self.down = False
+        self.records = []
+        self.requests = 0
+        self.rejected_requests = 0
+        self._recent = []
+        self._lock = threading.Lock()
+
+    def write(self, records):
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if self.down:
+                self.rejected_requests += 1
+                raise FakeSinkError(503)
+            now = time.monotonic()
+            self._recent = [t for t in self._recent if now - t < 1.0]
+            if self.max_per_second and len(self._recent) >= self.max_per_second:
+                self.rejected_requests += 1
+                raise FakeSinkError(429)
+            self._recent.append(now)
+            self.records.extend(records)
+
+
+def make_sinks(latency):
+    return {
+        "feedback": FakeSink(latency, batch_size=100),
+        "airtable": FakeSink(latency, batch_size=10, min_interval=0.2, max_per_second=5),
+    }
+
+
+def events(count):
+    for i in range(count):
+        yield ("feedback" if i % 2 else "airtable"), {"n": i, "message": f"event {i}"}
+
+
+def check_delivered(sinks, count):
+    delivered = sorted(record["n"] for sink in sinks.values() for record in sink.records)
+    lost = count - len(set(delivered))
+    duplicates = len(delivered) - len(set(delivered))
+    return f"delivered {len(set(delivered))}/{count}, lost {lost}, duplicates {duplicates}"
+
+
+def new_writer(path, sinks, **kwargs):
+    writer = EventWriter(EventSpool(path), flush_interval=0.05, **kwargs)
+    for name, sink in sinks.items():
+        writer.add_sink(name, sink)
+    return writer
+
+
+def scenario_sync(args, directory):
+    sinks = make_sinks(args.latency)
+    sinks["airtable"].max_per_second = None
+    start = time.perf_counter()
+    for name, record in events(args.events):
+        sinks[name].write([record])
+    elapsed = time.perf_counter() - start
+    requests = sum(sink.requests for sink in sinks.values())
+    print(f"sync      {elapsed / args.events * 1000:8.2f} ms per event in the UI thread, {requests} requests")
+
+
+def scenario_queued(args, directory):
+    sinks = make_sinks(args.latency)
+    writer = new_writer(os.path.join(directory, "queued.db"), sinks)
+    start = time.perf_counter()
+    for name, record in events(args.events):
+        writer.submit(name, record)
+    submit_elapsed = time.perf_counter() - start
+    writer.flush(timeout=120)
+    drained = time.perf_counter() - start
+    writer.close()
+    requests = sum(sink.requests for sink in sinks.values())
+    print(f"queued    {submit_elapsed / args.events * 1000:8.3f} ms per event in the UI thread, "
+          f"drained in {drained:.1f}s with {requests} requests "
+          f"({sinks['airtable'].rejected_requests} rate limited); {check_delivered(sinks, args.events)}")
+
+
+def scenario_outage(args, directory):
+    sinks = make_sinks(args.latency)
+    event_writer.BACKOFF_BASE, event_writer.BACKOFF_CAP = 0.05, 0.5
+    writer = new_writer(os.path.join(directory, "outage.db"), sinks)
+    for sink in sinks.values():
+        sink.down = True
+    for name, record in events(args.events):
+        writer.submit(name, record)
+    time.sleep(2)
+    spooled = writer.stats()["spooled"]
+    for sink in sinks.values():
+        sink.down = False
+    writer.flush(timeout=120)
+    stats = writer.stats()
+    writer.close()
+    print(f"outage    {spooled} spooled during the outage, {stats['failed_writes']} failed writes retried; "
+          f"{check_delivered(sinks, args.events)}")
+
+
+def scenario_restart(args, directory):
+    path = os.path.join(directory, "restart.db")
+    down = make_sinks(args.latency)
+    for sink in down.values():
+        sink.down = True
+    writer = new_writer(path, down)
+    for name, record in events(args.events):
+        writer.submit(name, record)
+    writer.close(timeout=0.5)
+    writer.spool.close()
+
+    sinks = make_sinks(args.latency)
+    start = time.perf_counter()
+    writer = new_writer(path, sinks)
+    writer.flush(timeout=120)
+    elapsed = time.perf_counter() - start
+    writer.close()
+    print(f"restart   backlog delivered {elapsed:.1f}s after restart; {check_delivered(sinks, args.events)}")
+
+
+def scenario_shared(args, directory):
+    path = os.path.join(directory, "shared.db")
+    spool = EventSpool(path)
+    spool.add(list(events(args.events)))
+    spool.close()
+
+    sinks = make_sinks(args.latency)
+    sinks["airtable"].max_per_second = None
+    start = time.perf_counter()
+    # Each writer has its own connection to the file, like separate processes
+    writers = [new_writer(path, sinks) for _ in range(2)]
+    for writer in writers:
+        writer.flush(timeout=120)
+    elapsed = time.perf_counter() - start
+    for writer in writers:
+        writer.close()
+        writer.spool.close()
+    result = check_delivered(sinks, args.events)
+    print(f"shared    backlog delivered by two writers in {elapsed:.1f}s; {result}")
+    assert result.endswith("lost 0, duplicates 0"), result
+
+
+def scenario_overload(args, directory):
+    class SlowSpool(EventSpool):
+        def add(self, events):
+            time.sleep(0.5)
+            return super().add(events)
+
+    sinks = make_sinks(0)
+    writer = EventWriter(SlowSpool(os.path.join(directory, "overload.db")), max_queue=50, flush_interval=0.05)
+    for name, sink in sinks.items():
+        writer.add_sink(name, sink)
+    accepted = sum(writer.submit(name, record) for name, record in events(args.events))
+    writer.flush(timeout=120)
+    stats = writer.stats()
+    writer.close()
+    delivered = sum(len(sink.records) for sink in sinks.values())
+    print(f"overload  accepted {accepted}, dropped {stats['dropped']} (counted), delivered {delivered}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.15, help="seconds per fake sink request")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scenario in (scenario_sync, scenario_queued, scenario_outage, scenario_restart, scenario_shared,
+                         scenario_overload):
+            scenario(args, directory)
+
+
+if __name__ == "__main__":
+    main()
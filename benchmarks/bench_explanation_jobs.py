@@ -0,0 +1,148 @@
+"""Rapid query edits: inline streaming on the script thread vs the debounced, cancellable job manager.
+
+Usage:
+    python benchmarks/bench_explanation_jobs.py [--sessions 20] [--edits 5] [--edit-interval 0.3]
+
+Each simulated session submits ``--edits`` versions of a question
+``--edit-interval`` seconds apart (a user refining the query), then waits for
+the answer to the last one. Against a slow fake upstream (seconds to first
+token, like free-tier models) it compares:
+
+- inline: each version is streamed where it was submitted, as main.py did
+  before; a superseded stream is abandoned at its next delta but keeps
+  running upstream in the background.
+- jobs: each version is submitted to ExplanationJobs, which debounces edits
+  and cancels superseded streams.
+
+Reports upstream requests started and finished, tokens charged to the usage
+ledger, how long submitting blocks the script, and time from the last edit
+to the finished answer.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Every run asks the same questions again, which the history would answer without going upstream
+os.environ["EXPLAINMATE_HISTORY"] = "0"
+
+import explainer  # noqa: E402
+import functions  # noqa: E402
+import llm_client  # noqa: E402
+import rate_limiter  # noqa: E402
+import usage_ledger  # noqa: E402
+from explanation_cache import MemoryExplanationCache  # noqa: E402
+from explanation_jobs import ExplanationJobs  # noqa: E402
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+from rate_limiter import RateLimiter  # noqa: E402
+
+
+def versions(session, edits):
+    question = f"session {session}: explain how a heat engine converts heat into work"
+    words = question.split(" ")
+    return [" ".join(words[:len(words) - edits + 1 + i]) for i in range(edits)]
+
+
+def inline_session(session, args, cache, blocked, answered):
+    """A superseded script run stops reading at its next delta, as a Streamlit rerun would"""
+    superseded = threading.Event()
+    for prompt in versions(session, args.edits):
+        superseded.set()
+        superseded = threading.Event()
+        last_edit = time.perf_counter()
+
+        def run(prompt=prompt, stop=superseded, started=last_edit):
+            stream = explainer.stream_explain(prompt, "Simple", "key", cache=cache, user_id=f"user-{session}")
+            first = True
+            for _ in stream:
+                if first:
+                    blocked.append(time.perf_counter() - started)
+                    first = False
+                if stop.is_set():
+                    return
+            answered.append((prompt, time.perf_counter()))
+
+        threading.Thread(target=run, daemon=True).start()
+        time.sleep(args.edit_interval)
+    return last_edit, prompt
+
+
+def jobs_session(session, args, cache, jobs, blocked):
+    job = None
+    for prompt in versions(session, args.edits):
+        last_edit = time.perf_counter()
+        job = jobs.submit(
+            session, (prompt, "Simple"),
+            lambda cancel, prompt=prompt: explainer.stream_explain(prompt, "Simple", "key", cache=cache,
+                                                                   user_id=f"user-{session}", cancel=cancel),
+            lambda prompt=prompt: explainer.cached_explanation(prompt, "Simple", cache=cache))
+        blocked.append(time.perf_counter() - last_edit)
+        time.sleep(args.edit_interval)
+    return last_edit, job
+
+
+def run(args, server, mode):
+    with tempfile.TemporaryDirectory() as directory:
+        usage_ledger._default_ledger = ledger = usage_ledger.UsageLedger(os.path.join(directory, "usage.db"))
+        rate_limiter._default_limiter = limiter = RateLimiter(rate_per_minute=1e9, burst=10**9, max_concurrent=10**6)
+        cache = MemoryExplanationCache()
+        server.requests.clear()
+        server.aborted = 0
+        jobs = ExplanationJobs(debounce=args.debounce)
+        blocked, answered, latencies = [], [], []
+        lock = threading.Lock()
+
+        def session(i):
+            if mode == "inline":
+                last_edit, prompt = inline_session(i, args, cache, blocked, answered)
+                while not any(p == prompt for p, _ in answered):
+                    time.sleep(0.02)
+                finished = next(t for p, t in answered if p == prompt)
+            else:
+                last_edit, job = jobs_session(i, args, cache, jobs, blocked)
+                while not job.done:
+                    time.sleep(0.02)
+                finished = time.perf_counter()
+            with lock:
+                latencies.append(finished - last_edit)
+
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Abandoned inline streams keep going upstream; wait for them so their tokens are counted
+        while explainer.flights.stats()["in_flight"] or limiter.stats()["active"]:
+            time.sleep(0.1)
+        time.sleep(0.3)
+
+        started = len(server.requests)
+        tokens = sum(row["total_tokens"] for row in ledger.rows())
+        print(f"{mode:7} upstream {started:4d} started {started - server.aborted:4d} finished | "
+              f"ledger {tokens:6d} tokens | submit blocks p50 {statistics.median(blocked) * 1000:7.1f} ms | "
+              f"last edit to answer p50 {statistics.median(latencies):5.2f}s max {max(latencies):5.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--edits", type=int, default=5)
+    parser.add_argument("--edit-interval", type=float, default=0.3)
+    parser.add_argument("--debounce", type=float, default=0.5)
+    parser.add_argument("--first-token-delay", type=float, default=3.0)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, functions.OPENROUTER_URL = start_fake_openrouter(args.first_token_delay, args.token_delay)
+    llm_client._default_client = llm_client.LLMClient(max_concurrency=256, pool_size=256)
+    run(args, server, "inline")
+    run(args, server, "jobs")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
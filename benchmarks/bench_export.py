@@ -0,0 +1,97 @@
+"""PDF export render time and memory against note count.
+
+Usage:
+    python benchmarks/bench_export.py [--counts 1,10,50,200] [--words 150]
+
+For each note count, times what opening the notes window used to cost
+(one PDF per note, fonts parsed from disk every time), the per-note export
+with fonts parsed once per process, the same with the note PDF cache warm,
+and exporting every note into one PDF both in a single fpdf2 document and
+batched through ``export_all_notes_to_pdf``. Peak Python memory is
+reported for the two single-file exports.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+from fpdf import FPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export_notes  # noqa: E402
+
+WORDS = "the derivative measures how fast ∑ a quantity changes αβγ relative to another".split()
+
+
+def build_notes(count, words):
+    return [
+        {
+            "id": i,
+            "question": f"Question {i}",
+            "content": " ".join(WORDS[(i + j) % len(WORDS)] for j in range(words)),
+            "timestamp": "2024-05-01T12:00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_note_pdf(note):
+    """Single-note export as main.py used to run it for every note"""
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    for style, path in export_notes._font_paths().items():
+        pdf.add_font('DejaVu', style, path)
+    pdf.set_font('DejaVu', '', 16)
+    pdf.cell(0, 10, "ExplainMate Notes", new_x="LMARGIN", new_y="NEXT", align='C')
+    pdf.ln(10)
+    export_notes._write_note(pdf, note)
+    return bytes(pdf.output())
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", default="1,10,50,200", help="comma-separated note counts")
+    parser.add_argument("--words", type=int, default=150, help="words per note")
+    parser.add_argument("--batch-size", type=int, default=export_notes.EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    # Parse the fonts up front so the first row isn't charged for it
+    export_notes._get_font_template()
+
+    print(f"{'notes':>6} {'legacy per-note':>16} {'per-note':>10} {'cached':>10} "
+          f"{'all (one doc)':>14} {'all (batched)':>14} {'peak one doc':>13} {'peak batched':>13}")
+    for count in (int(c) for c in args.counts.split(",")):
+        notes = build_notes(count, args.words)
+        export_notes._pdf_cache.clear()
+        legacy = timed(lambda: [legacy_note_pdf(note) for note in notes])
+        per_note = timed(lambda: [export_notes.note_pdf(note) for note in notes])
+        cached = timed(lambda: [export_notes.note_pdf(note) for note in notes])
+        one_doc = timed(lambda: export_notes.render_notes_pdf(notes))
+        batched = timed(lambda: export_notes.export_all_notes_to_pdf(notes, batch_size=args.batch_size).close())
+        peak_one = peak_memory(lambda: export_notes.render_notes_pdf(notes))
+        peak_batched = peak_memory(
+            lambda: export_notes.export_all_notes_to_pdf(notes, batch_size=args.batch_size).close())
+        print(f"{count:>6} {legacy:>14.2f} s {per_note:>8.2f} s {cached:>8.4f} s "
+              f"{one_doc:>12.2f} s {batched:>12.2f} s {peak_one / 2**20:>10.1f} MB {peak_batched / 2**20:>10.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Explanation history: storage saved by dedup and compression, and revisits served without the LLM.
+
+Usage:
+    python benchmarks/bench_history.py [--users 50] [--questions-per-user 10] [--url URL]
+
+Each simulated user asks ``--questions-per-user`` questions drawn from
+data/questions.txt in both styles (so users overlap, as students of one
+course would), through explainer.stream_explain with a fresh history file.
+The explanation cache is then cleared, as if its entries had expired, and
+every user asks the same questions again and pages through their history.
+
+Reports the time to an answer on the first visit and on the revisit, the
+upstream requests each phase made (the revisits should make none), the
+history page time, and the storage figures from ExplanationHistory.stats().
+
+By default answers come from the fake OpenRouter server with
+``budget_answers`` on; its filler text compresses far better than real
+explanations, so pass ``--url`` (and OPENROUTER_API_KEY) for a realistic
+compression ratio.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import explainer  # noqa: E402
+import explanation_history  # noqa: E402
+import functions  # noqa: E402
+import llm_client  # noqa: E402
+import rate_limiter  # noqa: E402
+import usage_ledger  # noqa: E402
+from explanation_cache import MemoryExplanationCache  # noqa: E402
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "questions.txt")
+STYLES = ("Simple", "Technical")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def ask_all(asks, args, cache):
+    def ask(item):
+        user_id, question, style = item
+        start = time.perf_counter()
+        "".join(explainer.stream_explain(question, style, args.api_key, cache=cache, user_id=user_id))
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        return list(pool.map(ask, asks))
+
+
+def summary(name, latencies, requests):
+    print(f"  {name:10} {len(latencies):5d} answers  p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:8.1f} ms  upstream requests {requests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--questions-per-user", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=explanation_history.PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--url", help="chat completions endpoint (default: a local fake server)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", "key"))
+    parser.add_argument("--token-delay", type=float, default=0.001, help="fake server seconds per token")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        functions.OPENROUTER_URL = args.url
+    else:
+        server, functions.OPENROUTER_URL = start_fake_openrouter(first_token_delay=0.2,
+                                                                 token_delay=args.token_delay)
+        server.config["budget_answers"] = True
+    llm_client._default_client = llm_client.LLMClient(max_concurrency=args.workers, pool_size=args.workers)
+    rate_limiter._default_limiter = rate_limiter.RateLimiter(rate_per_minute=1e9, burst=10**9,
+                                                             max_concurrent=args.workers)
+    with open(QUESTIONS_PATH, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    rng = random.Random(0)
+    asks = [(f"user-{n}", question, style)
+            for n in range(args.users)
+            for question in rng.sample(questions, min(args.questions_per_user, len(questions)))
+            for style in STYLES]
+
+    with tempfile.TemporaryDirectory() as directory:
+        usage_ledger._default_ledger = usage_ledger.UsageLedger(os.path.join(directory, "usage.db"))
+        history = explanation_history._default_history = explanation_history.ExplanationHistory(
+            os.path.join(directory, "history.db"))
+        cache = MemoryExplanationCache()
+        print(f"{args.users} users x {args.questions_per_user} questions x {len(STYLES)} styles "
+              f"against {functions.OPENROUTER_URL}")
+
+        def upstream():
+            return len(server.requests) if server else "?"
+
+        before = upstream()
+        first = ask_all(asks, args, cache)
+        summary("first", first, upstream() - before if server else "?")
+        cache.clear()
+        before = upstream()
+        revisit = ask_all(asks, args, cache)
+        summary("revisit", revisit, upstream() - before if server else "?")
+
+        pages = []
+        for n in range(args.users):
+            cursor = None
+            while True:
+                start = time.perf_counter()
+                _, cursor = history.page(f"user-{n}", args.page_size, cursor)
+                pages.append(time.perf_counter() - start)
+                if cursor is None:
+                    break
+        print(f"  history page ({args.page_size} entries with text): p50 {statistics.median(pages) * 1000:.2f} ms "
+              f"p95 {percentile(pages, 95) * 1000:.2f} ms over {len(pages)} pages")
+
+        stats = history.stats()
+        print(f"  {stats['entries']} entries, {stats['blobs']} distinct explanations: "
+              f"{stats['text_bytes']:,d} bytes of text, {stats['unique_bytes']:,d} after dedup "
+              f"(-{stats['dedup_saved']:,d}), {stats['stored_bytes']:,d} compressed "
+              f"(-{stats['compression_saved']:,d}); {stats['ratio']:.1f}x overall, "
+              f"file {os.path.getsize(history.path) / 1024:.0f} KB")
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Cold import time of the modules main.py imports, from ``python -X importtime``.
+
+Usage:
+    python benchmarks/bench_import.py [--runs 5] [--budget-ms 800] [--output importtime.json]
+
+Each run imports main.py's top-level imports (read from its source, so the
+list follows main.py) in a fresh interpreter with ``-X importtime`` and
+offline mode on. Reports the median total, the slowest modules, and which
+of the heavy dependencies that should only load on first use (OCR, PDF
+export, feedback logging, Supabase) were imported anyway.
+
+Exits with status 1 if the median is over ``--budget-ms`` or a lazy
+dependency was imported, so it can guard against startup regressions in CI.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependencies main.py must not import until the feature that needs them is used
+LAZY = ("numpy", "pandas", "PIL", "pytesseract", "fpdf", "fontTools", "pypdfium2", "pyairtable",
+        "supabase", "google.oauth2", "sentence_transformers")
+
+
+def main_imports(path=os.path.join(ROOT, "main.py")):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure(modules):
+    """One cold import: ({module: cumulative ms}, total ms, lazy dependencies that were loaded)"""
+    code = "; ".join(f"import {module}" for module in modules) + (
+        f"; import sys; print([m for m in {LAZY!r} if m in sys.modules])")
+    env = dict(os.environ, EXPLAINMATE_OFFLINE="1", PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(f"Import failed:\n{result.stderr[-2000:]}")
+    cumulative, total, started = {}, 0.0, False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        top_level = not name[2:].startswith(" ")
+        name = name.strip()
+        cumulative[name] = int(cumulative_us) / 1000
+        # Interpreter startup (site, encodings) comes before the first of main.py's imports
+        started = started or name in modules
+        if started and top_level:
+            total += cumulative[name]
+    loaded = ast.literal_eval(result.stdout.strip().splitlines()[-1])
+    return cumulative, total, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="fail if the median total is above this")
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--output", help="write the results here as JSON")
+    args = parser.parse_args()
+
+    modules = main_imports()
+    totals, runs, loaded = [], [], set()
+    for _ in range(args.runs):
+        cumulative, total, lazy_loaded = measure(modules)
+        totals.append(total)
+        runs.append(cumulative)
+        loaded.update(lazy_loaded)
+    median = statistics.median(totals)
+    # A module's cumulative time counts where it was first imported, so one imported early looks slower
+    slowest = sorted(((statistics.median(run.get(name, 0.0) for run in runs), name) for name in modules),
+                     reverse=True)
+
+    print(f"main.py imports {len(modules)} modules: median {median:.0f} ms over {args.runs} cold runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f})")
+    for ms, name in slowest[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+    print(f"lazy dependencies imported: {', '.join(sorted(loaded)) or 'none'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"modules": modules, "runs_ms": totals, "median_ms": median,
+                       "slowest": [{"module": name, "ms": ms} for ms, name in slowest[:args.top]],
+                       "lazy_loaded": sorted(loaded)}, f, indent=2)
+    failed = bool(loaded)
+    if args.budget_ms and median > args.budget_ms:
+        print(f"Over budget: {median:.0f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Load test: concurrent users running the app's query → explain → save note → export PDF flow offline.
+
+Usage:
+    python benchmarks/bench_load.py [--users 20] [--flows 5] [--output results.json] [--baseline old.json]
+
+Runs with EXPLAINMATE_OFFLINE=1, so Supabase and Airtable are the in-memory
+stand-ins from local_stubs.py, and explanations come from the fake
+OpenRouter server. Each simulated user signs in, then repeats ``--flows``
+times: explain a question from data/questions.txt (streamed through
+explainer, as the app does), save it as a note, load the notes page, export
+the note and all notes to PDF, and send feedback to the Supabase and
+Airtable event sinks.
+
+Reports throughput, p50/p95/p99 latency per stage and peak memory, and
+writes the same figures as JSON to ``--output`` so runs of different
+releases can be compared; ``--baseline`` prints each stage's p95 change
+against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["EXPLAINMATE_OFFLINE"] = "1"
+_spool_dir = tempfile.mkdtemp(prefix="explainmate-load-")
+os.environ.setdefault("EXPLAINMATE_EVENT_SPOOL", os.path.join(_spool_dir, "event_spool.db"))
+os.environ.setdefault("EXPLAINMATE_USAGE_PATH", os.path.join(_spool_dir, "usage.db"))
+os.environ.setdefault("EXPLAINMATE_HISTORY_PATH", os.path.join(_spool_dir, "history.db"))
+
+import explainer  # noqa: E402
+import functions  # noqa: E402
+import llm_client  # noqa: E402
+import local_stubs  # noqa: E402
+import notes_store  # noqa: E402
+import rate_limiter  # noqa: E402
+from event_writer import SupabaseSink, get_event_writer  # noqa: E402
+from explanation_cache import MemoryExplanationCache  # noqa: E402
+from export_notes import export_all_notes_to_pdf, note_pdf  # noqa: E402
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+from session_manager import SessionManager  # noqa: E402
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "questions.txt")
+STAGES = ("sign_in", "explain", "save_note", "load_notes", "export_note", "export_all", "feedback")
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+        self.errors = {stage: 0 for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def time(self, stage, fn, *args):
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors[stage] += 1
+            print(f"{stage} failed: {str(e)}")
+            return None
+        with self._lock:
+            self.samples[stage].append(time.perf_counter() - start)
+        return result
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else None
+
+
+def user_flow(n, args, questions, cache, recorder):
+    rng = random.Random(n)
+    manager = SessionManager(None, None)
+    email = f"user{n}@example.com"
+    manager.client.auth.sign_up({"email": email, "password": "secret"})
+    recorder.time("sign_in", manager.sign_in, email, "secret")
+    session = manager.user_session()
+    writer = get_event_writer()
+    for flow in range(args.flows):
+        question = rng.choice(questions)
+        if args.unique:
+            question = f"{question} ({n}.{flow})"
+        answer = recorder.time("explain", lambda: "".join(
+            explainer.stream_explain(question, "Simple", "key", cache=cache, user_id=session.user_id)))
+        if answer is None:
+            continue
+        recorder.time("save_note", notes_store.save_note, session, question, f"{question}\n{answer}")
+        notes, _ = recorder.time("load_notes", notes_store.load_notes_page, session, 10) or ([], False)
+        if notes:
+            recorder.time("export_note", note_pdf, notes[0])
+        if flow == args.flows - 1:
+            recorder.time("export_all", lambda: export_all_notes_to_pdf(notes_store.load_notes(session)).close())
+
+        def feedback():
+            row = {"user_id": session.user_id, "message": "", "is_helpful": True}
+            writer.submit("feedback", SupabaseSink.event(session.access_token, row))
+            functions.log_feedback("key", "base", "feedback", question, answer, "helpful", "2026-01-01T00:00:00")
+        recorder.time("feedback", feedback)
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\np95 against {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+    for stage, summary in results["stages"].items():
+        old = baseline.get("stages", {}).get(stage, {}).get("p95")
+        if summary["p95"] is None or not old:
+            continue
+        change = (summary["p95"] - old) / old
+        print(f"  {stage:12} {old * 1000:9.1f} ms -> {summary['p95'] * 1000:9.1f} ms  {change:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--flows", type=int, default=5, help="query → explain → save → export rounds per user")
+    parser.add_argument("--unique", action="store_true", help="make every question distinct (no cache hits)")
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--supabase-latency", type=float, default=0.02, help="seconds per Supabase query")
+    parser.add_argument("--airtable-latency", type=float, default=0.1, help="seconds per Airtable request")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report peak Python allocations (tracemalloc; slows the run down)")
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="earlier --output file to compare p95s with")
+    args = parser.parse_args()
+
+    server, functions.OPENROUTER_URL = start_fake_openrouter(args.first_token_delay, args.token_delay)
+    llm_client._default_client = llm_client.LLMClient(max_concurrency=256, pool_size=256)
+    rate_limiter._default_limiter = rate_limiter.RateLimiter(rate_per_minute=1e9, burst=10**9, max_concurrent=256)
+    local_stubs.get_local_supabase().latency = args.supabase_latency
+    airtable = local_stubs.get_local_airtable()
+    airtable.latency = args.airtable_latency
+    get_event_writer().add_sink("feedback", SupabaseSink("feedback"))
+    with open(QUESTIONS_PATH, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    cache = MemoryExplanationCache()
+    recorder = Recorder()
+    rss_start = rss_mb()
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user_flow, args=(n, args, questions, cache, recorder))
+               for n in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    traced_peak = None
+    if args.trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    delivered = get_event_writer().flush(timeout=60)
+    server.shutdown()
+
+    flows = len(recorder.samples["explain"])
+    results = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "duration": round(elapsed, 3),
+        "flows": flows,
+        "flows_per_second": round(flows / elapsed, 3) if elapsed else None,
+        "stages": {
+            stage: {
+                "count": len(samples),
+                "errors": recorder.errors[stage],
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+            }
+            for stage, samples in recorder.samples.items()
+        },
+        "memory": {
+            "rss_start_mb": rss_start,
+            "rss_end_mb": rss_mb(),
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "python_peak_mb": traced_peak,
+        },
+        "upstream": {
+            "openrouter_requests": len(server.requests),
+            "supabase_queries": local_stubs.get_local_supabase().requests,
+            "airtable_requests": airtable.requests,
+            "airtable_rate_limited": airtable.rate_limited,
+            "events_delivered": delivered,
+        },
+    }
+
+    print(f"{args.users} users x {args.flows} flows: {flows} flows in {elapsed:.1f}s "
+          f"({results['flows_per_second']} flows/s)")
+    for stage, summary in results["stages"].items():
+        if summary["count"]:
+            print(f"  {stage:12} n={summary['count']:5d} errors={summary['errors']:3d}  "
+                  + "  ".join(f"{p} {summary[p] * 1000:9.1f} ms" for p in ("p50", "p95", "p99")))
+    memory = results["memory"]
+    traced = f", Python allocations peak {traced_peak:.1f} MB" if traced_peak is not None else ""
+    print(f"  memory: RSS {memory['rss_start_mb']:.0f} -> {memory['rss_end_mb']:.0f} MB "
+          f"(max {memory['max_rss_mb']:.0f} MB){traced}")
+    print(f"  upstream: {results['upstream']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Replay model latency traces through the model router's selection and fallback policy.
+
+Usage:
+    python benchmarks/bench_model_router.py [--trace model_trace.jsonl] [--requests 2000] [--interval 2]
+
+A trace is the JSON lines file the app appends to when
+``EXPLAINMATE_MODEL_TRACE`` is set: one {"time", "model", "style", "seconds",
+"ok"} record per attempt. Without ``--trace`` a synthetic one is generated
+(``--write-trace`` saves it): the primary model has an outage window with
+slow and failing requests, the fallbacks are steady but slower or flakier.
+
+Requests arrive every ``--interval`` simulated seconds. Each attempt at a
+model takes the trace sample nearest to that moment, so no network or
+sleeping is involved, and the real ModelRouter is driven with a simulated
+clock. Policies compared:
+
+- single: the style's primary model only, as before the router
+- fallback: the tier in fixed order, falling back on errors and first-token timeouts
+- router: the same plus latency/error-aware ordering
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_router import ModelRouter, FIRST_TOKEN_TIMEOUT  # noqa: E402
+
+STYLE = "Simple"
+DEADLINE = 60.0
+
+
+def synthetic_trace(duration, seed=0):
+    """Attempt samples for three models over ``duration`` seconds"""
+    rng = random.Random(seed)
+    profiles = {
+        # model: (median seconds, spread, error rate); the primary degrades in its outage window
+        "primary": (4.0, 0.5, 0.02),
+        "fallback-large": (7.0, 0.4, 0.05),
+        "fallback-small": (3.0, 0.3, 0.12),
+    }
+    outage = (duration * 0.3, duration * 0.6)
+    trace = []
+    for model, (median, spread, error_rate) in profiles.items():
+        t = 0.0
+        while t < duration:
+            in_outage = model == "primary" and outage[0] <= t < outage[1]
+            seconds = rng.lognormvariate(0, spread) * (median if not in_outage else 30.0)
+            ok = rng.random() >= (0.6 if in_outage else error_rate)
+            trace.append({"time": t, "model": model, "style": STYLE, "seconds": round(seconds, 3), "ok": ok})
+            t += rng.expovariate(1.0)
+    return trace
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    start = min(record["time"] for record in records)
+    for record in records:
+        record["time"] -= start
+    return records
+
+
+class TraceSampler:
+    """The trace sample of a model nearest to a simulated time, wrapping around the trace's span"""
+
+    def __init__(self, trace):
+        self.span = max(record["time"] for record in trace) or 1.0
+        self.samples = {}
+        for record in sorted(trace, key=lambda r: r["time"]):
+            self.samples.setdefault(record["model"], []).append(record)
+        self.times = {model: [r["time"] for r in records] for model, records in self.samples.items()}
+
+    def attempt(self, model, now):
+        t = now % self.span
+        times = self.times[model]
+        index = min(bisect.bisect_left(times, t), len(times) - 1)
+        if index and abs(times[index - 1] - t) < abs(times[index] - t):
+            index -= 1
+        record = self.samples[model][index]
+        return record["seconds"], record["ok"]
+
+
+def simulate(policy, tier, sampler, args):
+    clock = [0.0]
+    min_samples = 10 ** 9 if policy != "router" else 5
+    router = ModelRouter({STYLE: tier}, first_token_timeout=args.timeout, min_samples=min_samples,
+                         clock=lambda: clock[0])
+    latencies, failures, attempts, served = [], 0, 0, {}
+    for n in range(args.requests):
+        clock[0] = start = n * args.interval
+        models = tier[:1] if policy == "single" else router.candidates(STYLE)
+        for index, model in enumerate(models):
+            attempts += 1
+            timeout = router.timeout_for(models, index) or DEADLINE
+            seconds, ok = sampler.attempt(model, clock[0])
+            if ok and seconds <= timeout:
+                router.record(model, seconds, True)
+                clock[0] += seconds
+                served[model] = served.get(model, 0) + 1
+                latencies.append(clock[0] - start)
+                break
+            spent = min(seconds, timeout)
+            router.record(model, spent, False)
+            clock[0] += spent
+        else:
+            failures += 1
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    share = ", ".join(f"{model} {served.get(model, 0) / args.requests:.0%}" for model in tier)
+    print(f"{policy:9} answered {1 - failures / args.requests:6.1%}  first token p50 "
+          f"{statistics.median(latencies or [0]):5.1f}s p95 {p95:5.1f}s max {max(latencies or [0]):5.1f}s  "
+          f"attempts/request {attempts / args.requests:4.2f}  served: {share}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="recorded trace (JSON lines); default: synthetic")
+    parser.add_argument("--write-trace", help="save the synthetic trace here")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=2.0, help="simulated seconds between requests")
+    parser.add_argument("--timeout", type=float, default=FIRST_TOKEN_TIMEOUT, help="first-token timeout")
+    parser.add_argument("--tier", nargs="+", help="models in order of preference (default: order of first use)")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(args.requests * args.interval)
+        if args.write_trace:
+            with open(args.write_trace, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(record) + "\n" for record in trace)
+    tier = args.tier or list(dict.fromkeys(record["model"] for record in trace))
+    sampler = TraceSampler(trace)
+    print(f"{len(trace)} trace samples over {sampler.span:.0f}s for {', '.join(tier)}")
+    for policy in ("single", "fallback", "router"):
+        simulate(policy, tier, sampler, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Notes search index build and query latency.
+
+Usage:
+    python benchmarks/bench_notes_search.py [--notes 50000] [--queries 200]
+
+Indexes synthetic notes for one user (plus the same number spread over
+other users sharing the index file), then times ranked prefix queries, a
+linear substring scan of the kind a client-side filter would do, and the
+incremental updates notes.py makes on save, update and delete.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notes_search import NotesSearchIndex, note_text  # noqa: E402
+
+SYLLABLES = "ka lo mi ne su ta ri po ve da xi zu fo ma ge hi lu ba co pe".split()
+VOCABULARY_SIZE = 20000
+
+
+def build_vocabulary(seed):
+    """Pseudo-words ranked by frequency; note words follow Zipf's law over this list"""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    vocabulary = sorted(words)
+    rng.shuffle(vocabulary)
+    cumulative, total = [], 0.0
+    for rank in range(1, len(vocabulary) + 1):
+        total += 1 / rank
+        cumulative.append(total)
+    return vocabulary, cumulative
+
+
+def build_notes(count, seed, vocabulary):
+    rng = random.Random(seed)
+    words, cumulative = vocabulary
+    notes = []
+    for i in range(count):
+        content = " ".join(rng.choices(words, cum_weights=cumulative, k=rng.randint(30, 120)))
+        notes.append({
+            "id": i,
+            "created_at": f"2024-01-01T00:00:{i:08d}",
+            # update_note stores notes as lists of points
+            "content": content.split(" ", 8) if i % 3 == 0 else content,
+        })
+    return notes
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def time_queries(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<28} median {statistics.median(timings) * 1000:8.2f} ms   "
+          f"p95 {percentile(timings, 0.95) * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = build_vocabulary(args.seed)
+    notes = build_notes(args.notes, args.seed, vocabulary)
+    others = build_notes(args.notes, args.seed + 1, vocabulary)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = NotesSearchIndex(os.path.join(directory, "search.db"))
+
+        start = time.perf_counter()
+        index.build("user", notes)
+        build_seconds = time.perf_counter() - start
+        for number in range(10):
+            index.build(f"other-{number}", others[number::10])
+        index._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(index.path)
+        print(f"built index for {len(notes)} notes in {build_seconds:.2f}s "
+              f"({len(notes) / build_seconds:,.0f} notes/s), file {size / 2**20:.1f} MB with {len(others)} other notes")
+
+        # Query words are drawn from the top of the vocabulary, i.e. the common ones
+        def query_word():
+            return vocabulary[0][min(int(rng.expovariate(1 / 200)), VOCABULARY_SIZE - 1)]
+
+        prefixes = [query_word()[:rng.randint(3, 5)] for _ in range(args.queries)]
+        pairs = [f"{query_word()} {query_word()[:4]}" for _ in range(args.queries)]
+        report("prefix query", time_queries(lambda q: index.search("user", q), prefixes))
+        report("two-word query", time_queries(lambda q: index.search("user", q), pairs))
+
+        texts = [note_text(note["content"]).lower() for note in notes]
+        report("linear scan (no ranking)", time_queries(
+            lambda q: [text for text in texts if all(word in text for word in q.split())][:20], pairs))
+
+        timings = []
+        for number in range(args.queries):
+            note_id = args.notes + number
+            start = time.perf_counter()
+            index.add("user", {"id": note_id, "created_at": "2025-01-01", "content": "freshly saved note"})
+            index.update("user", note_id, ["edited", "note"])
+            index.remove("user", note_id)
+            timings.append((time.perf_counter() - start) / 3)
+        report("add/update/delete", timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""OCR latency and character accuracy on a corpus of note photos.
+
+Usage:
+    python benchmarks/bench_ocr.py CORPUS_DIR [--repeat 1]
+
+CORPUS_DIR holds images (png/jpg/jpeg) with the ground-truth transcription of
+each in a sibling ``.txt`` file of the same name, e.g. ``page1.jpg`` and
+``page1.txt``. Each image is OCR'd the old way (full-resolution grayscale,
+single call), through the preprocessing/tiling pipeline, and again through
+the content-hash cache. Requires the tesseract binary.
+"""
+import argparse
+import glob
+import io
+import os
+import statistics
+import sys
+import time
+
+import pytesseract
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_pipeline  # noqa: E402
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def char_accuracy(predicted, truth):
+    predicted, truth = " ".join(predicted.split()), " ".join(truth.split())
+    if not truth:
+        return 1.0 if not predicted else 0.0
+    return max(0.0, 1 - edit_distance(predicted, truth) / len(truth))
+
+
+def legacy_ocr(data):
+    return pytesseract.image_to_string(Image.open(io.BytesIO(data)).convert("L")).strip()
+
+
+def pipeline_ocr(data):
+    ocr_pipeline._cache.clear()
+    return ocr_pipeline.extract_text(data)
+
+
+def timed(fn, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = fn(data)
+        timings.append(time.perf_counter() - start)
+    return text, statistics.median(timings)
+
+
+def load_corpus(directory):
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        stem, ext = os.path.splitext(path)
+        if ext.lower() in (".png", ".jpg", ".jpeg") and os.path.exists(stem + ".txt"):
+            with open(path, "rb") as f, open(stem + ".txt", encoding="utf-8") as t:
+                yield os.path.basename(path), f.read(), t.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="directory of images with .txt ground truth")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    modes = {"legacy": legacy_ocr, "pipeline": pipeline_ocr, "cached": ocr_pipeline.extract_text}
+    totals = {name: ([], []) for name in modes}
+    print(f"{'image':<28}" + "".join(f"{name:>20}" for name in modes))
+    for name, data, truth in load_corpus(args.corpus):
+        row = f"{name[:27]:<28}"
+        for mode, fn in modes.items():
+            text, seconds = timed(fn, data, args.repeat)
+            accuracy = char_accuracy(text, truth)
+            totals[mode][0].append(seconds)
+            totals[mode][1].append(accuracy)
+            row += f"{seconds * 1000:10.0f} ms {accuracy:6.1%}"
+        print(row)
+
+    if not totals["legacy"][0]:
+        sys.exit(f"No images with .txt ground truth found in {args.corpus}")
+    print()
+    for mode, (timings, accuracies) in totals.items():
+        print(f"{mode:<10} median {statistics.median(timings) * 1000:8.0f} ms   "
+              f"mean char accuracy {statistics.mean(accuracies):6.1%}")
+
+
+if __name__ == "__main__":
+    main()
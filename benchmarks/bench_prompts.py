@@ -0,0 +1,104 @@
+"""Output tokens, latency and truncation rate of each prompt version over a fixed question set.
+
+Usage:
+    python benchmarks/bench_prompts.py [--versions v1 v2] [--questions data/questions.txt] [--url URL]
+
+Every question in ``--questions`` is explained in both styles with each
+prompt version's compiled template (system prompt, max_tokens,
+temperature), and the answers are summarised per version and style: output
+tokens as OpenRouter counted them and as prompts.estimate_tokens estimates
+them, time to the whole answer, and the share cut off by max_tokens
+(finish_reason "length").
+
+By default the requests go to the fake OpenRouter server with
+``budget_answers`` on, whose answer lengths follow the budget the system
+prompt states, so the run is offline and repeatable but only as realistic
+as that model of the LLM. Pass ``--url`` (and OPENROUTER_API_KEY) to measure
+a real endpoint.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+from llm_client import LLMClient  # noqa: E402
+from model_router import DEFAULT_MODEL  # noqa: E402
+from prompts import VERSIONS, estimate_tokens, get_prompt  # noqa: E402
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "questions.txt")
+STYLES = ("Simple", "Technical")
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def explain(client, url, api_key, model, template, question):
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+    data = {
+        "model": model,
+        "messages": template.messages(question),
+        "temperature": template.temperature,
+        "max_tokens": template.max_tokens,
+        "stream": True,
+    }
+    usage = {}
+    start = time.perf_counter()
+    output = "".join(client.stream(url, headers, data, usage=usage))
+    return output, usage, time.perf_counter() - start
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(client, args, version, style, questions):
+    template = get_prompt(style, version)
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(lambda q: explain(client, args.url, args.api_key, args.model, template, q),
+                                questions))
+    counted = [usage.get("completion_tokens") for _, usage, _ in results]
+    estimated = [estimate_tokens(output) for output, _, _ in results]
+    latencies = [latency for _, _, latency in results]
+    truncated = sum(usage.get("finish_reason") == "length" for _, usage, _ in results)
+    counted_text = f"{statistics.mean(counted):6.0f}" if None not in counted else "     ?"
+    print(f"{version:4} {style:9} budget {template.budget or '-':>4} max_tokens {template.max_tokens:4d} | "
+          f"output tokens mean {counted_text} est {statistics.mean(estimated):6.0f} "
+          f"p95 {percentile(estimated, 95):5d} | latency p50 {statistics.median(latencies):5.2f}s "
+          f"p95 {percentile(latencies, 95):5.2f}s | truncated {truncated / len(results):5.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", nargs="+", default=list(VERSIONS), choices=list(VERSIONS))
+    parser.add_argument("--questions", default=DATA_PATH)
+    parser.add_argument("--url", help="chat completions endpoint (default: a local fake server)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", "key"))
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--token-delay", type=float, default=0.002, help="fake server seconds per token")
+    args = parser.parse_args()
+
+    server = None
+    if not args.url:
+        server, args.url = start_fake_openrouter(first_token_delay=0.05, token_delay=args.token_delay)
+        server.config["budget_answers"] = True
+    client = LLMClient(max_concurrency=args.workers, pool_size=args.workers)
+    questions = load_questions(args.questions)
+    print(f"{len(questions)} questions against {args.url}")
+    for version in args.versions:
+        for style in STYLES:
+            run(client, args, version, style, questions)
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Load test of the rate limiter and token accounting against the fake upstream.
+
+Usage:
+    python benchmarks/bench_rate_limit.py [--users 20] [--typists 3] [--duration 10] [--upstream-rps 8]
+
+Simulated users call explainer.stream_explain() on threads, as Streamlit
+sessions do. Most ask a fresh question every ``--think`` seconds; the
+``--typists`` fire one request per keystroke (a new prefix of a question
+every 0.1s), like editing ``query_input`` without debouncing. The fake
+upstream answers more than ``--upstream-rps`` requests per second with 429.
+
+Each scenario runs once without limits and once with the limiter, and
+reports upstream requests and 429s, answered and rate-limited requests per
+user type, the normal users' latency, and whether the usage ledger's token
+total matches the ``usage`` the fake upstream reported.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Every run asks the same questions again, which the history would answer without going upstream
+os.environ["EXPLAINMATE_HISTORY"] = "0"
+
+import explainer  # noqa: E402
+import functions  # noqa: E402
+import llm_client  # noqa: E402
+import rate_limiter  # noqa: E402
+import usage_ledger  # noqa: E402
+from explanation_cache import MemoryExplanationCache  # noqa: E402
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+from rate_limiter import RateLimiter, RateLimitExceeded  # noqa: E402
+
+QUESTION = "explain the second law of thermodynamics"
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.answered = {"normal": 0, "typist": 0}
+        self.limited = {"normal": 0, "typist": 0}
+        self.failed = {"normal": 0, "typist": 0}
+        self.latencies = []
+
+    def add(self, kind, outcome, latency=None):
+        with self.lock:
+            getattr(self, outcome)[kind] += 1
+            if latency is not None and kind == "normal":
+                self.latencies.append(latency)
+
+
+def ask(results, kind, user_id, prompt, cache):
+    start = time.perf_counter()
+    try:
+        output = "".join(explainer.stream_explain(prompt, "Simple", "key", cache=cache, user_id=user_id))
+    except RateLimitExceeded:
+        results.add(kind, "limited")
+        return
+    except Exception:
+        output = ""
+    results.add(kind, "answered" if output else "failed", time.perf_counter() - start)
+
+
+def normal_user(results, user, stop, think, cache):
+    n = 0
+    while not stop.is_set():
+        ask(results, "normal", f"user-{user}", f"question {n} from user {user}", cache)
+        n += 1
+        stop.wait(think)
+
+
+def typist(results, user, stop, cache):
+    n = 0
+    while not stop.is_set():
+        prefix = QUESTION[:8 + n % (len(QUESTION) - 8)]
+        threading.Thread(target=ask, args=(results, "typist", f"typist-{user}", f"{prefix} ({user}.{n})", cache),
+                         daemon=True).start()
+        n += 1
+        stop.wait(0.1)
+
+
+def run(args, server, limiter, label):
+    rate_limiter._default_limiter = limiter
+    with tempfile.TemporaryDirectory() as directory:
+        usage_ledger._default_ledger = ledger = usage_ledger.UsageLedger(os.path.join(directory, "usage.db"))
+        cache = MemoryExplanationCache()
+        server.requests.clear()
+        server.rate_limited = 0
+        server.total_tokens = 0
+        results = Results()
+        stop = threading.Event()
+        threads = [threading.Thread(target=normal_user, args=(results, i, stop, args.think, cache))
+                   for i in range(args.users)]
+        threads += [threading.Thread(target=typist, args=(results, i, stop, cache)) for i in range(args.typists)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        # Let calls still streaming or queued finish, so their tokens are counted in this run
+        time.sleep(0.5)
+        while explainer.flights.stats()["in_flight"] or limiter.stats()["active"] or limiter.stats()["waiting"]:
+            time.sleep(0.1)
+        time.sleep(0.5)
+
+        ledger_total = sum(row["total_tokens"] for row in ledger.rows())
+        ledger_requests = sum(row["requests"] for row in ledger.rows())
+        latencies = sorted(results.latencies)
+        p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+        print(f"{label:10} upstream {len(server.requests):5d} requests, {server.rate_limited:4d} answered 429 | "
+              f"normal answered {results.answered['normal']:4d} limited {results.limited['normal']:3d} "
+              f"failed {results.failed['normal']:3d} p50 {statistics.median(latencies or [0]):5.2f}s p95 {p95:5.2f}s | "
+              f"typists answered {results.answered['typist']:4d} limited {results.limited['typist']:4d} "
+              f"failed {results.failed['typist']:3d} | ledger {ledger_requests} calls, {ledger_total} tokens "
+              f"(upstream reported {server.total_tokens})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--typists", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--think", type=float, default=3.0, help="seconds between a normal user's questions")
+    parser.add_argument("--upstream-rps", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server, functions.OPENROUTER_URL = start_fake_openrouter(args.first_token_delay, args.token_delay)
+    server.config["max_per_second"] = args.upstream_rps
+    llm_client._default_client = llm_client.LLMClient(max_concurrency=64, pool_size=64, max_retries=3,
+                                                      backoff_base=0.2, backoff_cap=2.0)
+
+    run(args, server, RateLimiter(rate_per_minute=1e9, burst=10**9, max_concurrent=10**6), "unlimited")
+    run(args, server, RateLimiter(max_concurrent=args.upstream_rps, queue_timeout=30), "limited")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Segmentation cost on long multi-formula explanations.
+
+Usage:
+    python benchmarks/bench_segmenter.py [--formulas 200] [--chunk 4] [--repeat 20]
+
+Compares the old per-rerun regex split of the whole output with the
+incremental segmenter: a streamed parse fed chunk by chunk, a cold parse of
+the full text, and a memoized reparse as happens on every Streamlit rerun.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import latex_segmenter  # noqa: E402
+from latex_segmenter import LatexSegmenter, segment_text  # noqa: E402
+
+LATEX_PATTERN = r'```latex\s*([\s\S]*?)```'
+
+
+def build_output(formulas):
+    parts = []
+    for i in range(formulas):
+        parts.append(
+            f"Step {i}: the quantity $x_{{{i}}}$ grows with $\\alpha^{i}$, and costs $5 per unit. "
+            "This paragraph keeps the explanation flowing with a little more prose to read.\n"
+        )
+        parts.append(f"```latex\n\\int_0^{{{i}}} x^2 \\, dx = \\frac{{{i}^3}}{{3}}\n```\n")
+    return "".join(parts)
+
+
+def regex_split(output):
+    segments = []
+    last_end = 0
+    for match in re.finditer(LATEX_PATTERN, output):
+        segments.append(output[last_end:match.start()].strip())
+        segments.append(match.group(1).strip())
+        last_end = match.end()
+    segments.append(output[last_end:].strip())
+    return segments
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def streamed(output, chunk):
+    segmenter = LatexSegmenter()
+    for i in range(0, len(output), chunk):
+        segmenter.feed(output[i:i + chunk])
+    segmenter.close()
+    return segmenter.completed
+
+
+def cold(output):
+    latex_segmenter._memo.clear()
+    return segment_text(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--formulas", type=int, default=200)
+    parser.add_argument("--chunk", type=int, default=4, help="characters per streamed delta")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    output = build_output(args.formulas)
+    assert streamed(output, args.chunk) == cold(output)
+    print(f"output: {len(output)} chars, {len(segment_text(output))} segments")
+    print(f"regex split per rerun:    {timed(lambda: regex_split(output), args.repeat):8.3f} ms")
+    print(f"streamed parse (total):   {timed(lambda: streamed(output, args.chunk), args.repeat):8.3f} ms")
+    print(f"cold full parse:          {timed(lambda: cold(output), args.repeat):8.3f} ms")
+    segment_text(output)
+    print(f"memoized rerun:           {timed(lambda: segment_text(output), args.repeat):8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Recall and latency benchmark for the semantic cache tier.
+
+Usage:
+    python benchmarks/bench_semantic_cache.py [--size 1000000] [--threshold 0.85]
+
+Each labelled pair in data/paraphrases.jsonl is scored: the ``query`` is
+cached, then the ``candidate`` is looked up. Paraphrases (``same: true``)
+should hit and unrelated questions should miss. Lookup latency is then
+measured against an index filled with ``--size`` synthetic questions.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache, get_vectorizer  # noqa: E402
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "paraphrases.jsonl")
+TOPICS = [
+    "entropy", "photosynthesis", "bayes", "theorem", "derivative", "integral", "matrix", "eigenvalue",
+    "force", "energy", "momentum", "cell", "protein", "market", "inflation", "war", "treaty", "poem",
+    "series", "limit", "probability", "variance", "vector", "field", "wave", "atom", "bond", "graph",
+]
+TEMPLATES = ["what is {} {} {}", "explain {} and {} in {}", "how does {} relate to {} {}"]
+
+
+def load_pairs(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def score_pairs(pairs, threshold, vectorizer):
+    true_hits = false_hits = positives = negatives = 0
+    for pair in pairs:
+        cache = SemanticCache(vectorizer, threshold)
+        cache.add(pair["query"], "Simple", "model", "key")
+        hit = cache.lookup(pair["candidate"], "Simple", "model") is not None
+        if pair["same"]:
+            positives += 1
+            true_hits += hit
+        else:
+            negatives += 1
+            false_hits += hit
+    return true_hits / max(positives, 1), false_hits / max(negatives, 1)
+
+
+def synthetic_questions(size, seed=0):
+    rng = np.random.default_rng(seed)
+    words = rng.integers(0, len(TOPICS), size=(size, 3))
+    templates = rng.integers(0, len(TEMPLATES), size=size)
+    for i in range(size):
+        a, b, c = (TOPICS[j] for j in words[i])
+        yield f"{TEMPLATES[templates[i]].format(a, b, c)} {i}"
+
+
+def measure_latency(size, threshold, vectorizer, lookups=2000):
+    cache = SemanticCache(vectorizer, threshold)
+    start = time.perf_counter()
+    cache.load((q, "Simple", "model", i) for i, q in enumerate(synthetic_questions(size)))
+    build_seconds = time.perf_counter() - start
+
+    queries = list(synthetic_questions(lookups, seed=1))
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        cache.lookup(query, "Simple", "model")
+        timings.append((time.perf_counter() - start) * 1000)
+    return build_seconds, np.percentile(timings, [50, 95, 99])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100000, help="number of cached questions for the latency run")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--pairs", default=DATA_PATH)
+    args = parser.parse_args()
+
+    vectorizer = get_vectorizer()
+    recall, false_hit_rate = score_pairs(load_pairs(args.pairs), args.threshold, vectorizer)
+    print(f"vectorizer: {type(vectorizer).__name__} (dim={vectorizer.dim}), threshold={args.threshold}")
+    print(f"paraphrase recall: {recall:.2%}  false hit rate: {false_hit_rate:.2%}")
+
+    build_seconds, (p50, p95, p99) = measure_latency(args.size, args.threshold, vectorizer)
+    print(f"index of {args.size} entries built in {build_seconds:.1f}s")
+    print(f"lookup latency ms: p50={p50:.2f} p95={p95:.2f} p99={p99:.2f}")
+
+
+if __name__ == "__main__":
+    main()
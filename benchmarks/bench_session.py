@@ -0,0 +1,127 @@
+"""Per-rerun auth cost, per-session client cost and refresh coalescing.
+
+Usage:
+    python benchmarks/bench_session.py [--latency 0.08] [--callers 20]
+
+Runs SessionManager against a fake Supabase auth endpoint (an httpx mock
+transport that sleeps ``--latency`` seconds per request) and reports:
+
+  - the cost of the per-rerun check with a fresh token, next to a
+    get_user round-trip as an upper bound on a network check
+  - how long creating each session's client takes with the shared
+    connection pool and with a pool of its own
+  - how many token requests ``--callers`` concurrent refreshes of a
+    near-expiry session make (should be 1)
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+from supabase import ClientOptions, create_client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_manager  # noqa: E402
+from session_manager import SessionManager  # noqa: E402
+
+URL = "https://fake-project.supabase.co"
+KEY = "anon-key"
+USER = {"id": "user-1", "aud": "authenticated", "app_metadata": {}, "user_metadata": {},
+        "created_at": "2024-01-01T00:00:00Z", "email": "student@example.com"}
+
+
+def make_token(expires_in):
+    payload = json.dumps({"sub": USER["id"], "exp": int(time.time() + expires_in)}).encode()
+    return "header." + base64.urlsafe_b64encode(payload).decode().rstrip("=") + ".signature"
+
+
+class FakeAuth:
+    def __init__(self, latency, expires_in):
+        self.latency = latency
+        self.expires_in = expires_in
+        self.token_requests = 0
+        self.used_refresh_tokens = set()
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def handler(self, request):
+        time.sleep(self.latency)
+        if request.url.path.endswith("/token"):
+            body = json.loads(request.content or b"{}")
+            with self._lock:
+                self.token_requests += 1
+                refresh_token = body.get("refresh_token")
+                if refresh_token:
+                    if refresh_token in self.used_refresh_tokens:
+                        return httpx.Response(400, json={"error": "invalid_grant", "error_description": "Refresh token already used"})
+                    self.used_refresh_tokens.add(refresh_token)
+                self._next += 1
+                refresh = f"refresh-{self._next}"
+            return httpx.Response(200, json={
+                "access_token": make_token(self.expires_in), "refresh_token": refresh,
+                "expires_in": self.expires_in, "expires_at": int(time.time() + self.expires_in),
+                "token_type": "bearer", "user": USER,
+            })
+        if request.url.path.endswith("/user"):
+            return httpx.Response(200, json=USER)
+        return httpx.Response(200, json=[])
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds per fake auth request")
+    parser.add_argument("--callers", type=int, default=20)
+    args = parser.parse_args()
+
+    auth = FakeAuth(args.latency, expires_in=3600)
+    http = httpx.Client(transport=httpx.MockTransport(auth.handler))
+    manager = SessionManager(URL, KEY, http_client=http)
+    manager.sign_in("student@example.com", "password")
+
+    check = timed(manager.is_authenticated, 1000)
+    network = timed(lambda: manager.client.auth.get_user(manager.session.access_token), 10)
+    print(f"per-rerun check      {check * 1e6:10.1f} us   (network check {network * 1000:.1f} ms)")
+
+    shared = timed(lambda: SessionManager(URL, KEY, http_client=http), 20)
+    own = timed(lambda: create_client(URL, KEY, options=ClientOptions(
+        persist_session=False, auto_refresh_token=False)), 20)
+    print(f"session client       {shared * 1000:10.2f} ms   (own connection pool {own * 1000:.2f} ms)")
+
+    # A token inside the refresh margin: every caller sees it needs refreshing at once
+    auth.expires_in = session_manager.REFRESH_MARGIN / 2
+    manager.sign_in("student@example.com", "password")
+    auth.expires_in = 3600
+    before = auth.token_requests
+    barrier = threading.Barrier(args.callers)
+    results = []
+
+    def caller():
+        barrier.wait()
+        results.append(manager.refresh())
+
+    threads = [threading.Thread(target=caller) for _ in range(args.callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"concurrent refresh   {args.callers} callers -> {auth.token_requests - before} token request(s), "
+          f"{sum(results)} succeeded, new expiry in {manager.expires_at - time.time():.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Upstream calls and latency for a burst of identical questions.
+
+Usage:
+    python benchmarks/bench_single_flight.py [--sessions 40] [--first-token-delay 0.5]
+
+Simulates a class asking the same question at once against the local fake
+OpenRouter server, with an empty in-memory cache, and reports how many
+upstream requests were made and how many callers were coalesced.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import functions  # noqa: E402
+import explainer  # noqa: E402
+from explanation_cache import MemoryExplanationCache  # noqa: E402
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    server, functions.OPENROUTER_URL = start_fake_openrouter(args.first_token_delay, args.token_delay)
+    cache = MemoryExplanationCache()
+    barrier = threading.Barrier(args.sessions)
+    latencies = []
+
+    def session(i):
+        question = "Explain photosynthesis" if i % 2 else "explain photosynthesis?"
+        barrier.wait()
+        start = time.perf_counter()
+        text = "".join(explainer.stream_explain(question, "Simple", "test-key", cache=cache))
+        assert text
+        latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    print(f"sessions: {args.sessions}  upstream requests: {len(server.requests)}")
+    print(f"single-flight: {explainer.flights.stats()}")
+    print(f"latency p50={statistics.median(latencies) * 1000:.0f} ms  max={max(latencies) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Time-to-first-token vs. total latency for streamed and non-streamed explanations.
+
+Usage:
+    python benchmarks/bench_streaming.py [--runs 20] [--first-token-delay 0.3] [--token-delay 0.01]
+
+Runs against the local fake OpenRouter server, so the numbers isolate the
+client-side cost of each path from real model latency. First checks that a
+stream failing part-way is neither cached nor kept in the history, through
+both explainer.stream_explain and astream_explain.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["EXPLAINMATE_HISTORY"] = "1"
+
+import explainer  # noqa: E402
+import explanation_history  # noqa: E402
+import functions  # noqa: E402
+from explanation_cache import MemoryExplanationCache  # noqa: E402
+from fake_openrouter import start_fake_openrouter  # noqa: E402
+
+CUT_OFF_ANSWER = "The first half of an answer"
+
+
+def time_streaming(prompt):
+    start = time.perf_counter()
+    first = None
+    text = ""
+    for delta in functions.stream_structured_explanation(prompt, "Simple", "test-key"):
+        if first is None:
+            first = time.perf_counter() - start
+        text += delta
+    return first, time.perf_counter() - start, text
+
+
+def time_blocking(prompt):
+    start = time.perf_counter()
+    text = functions.get_structured_explanation(prompt, "Simple", "test-key")
+    total = time.perf_counter() - start
+    # Nothing can be shown before the whole answer arrives
+    return total, total, text
+
+
+def _cut_off_stream(*args, **kwargs):
+    yield CUT_OFF_ANSWER
+    raise ConnectionError("connection reset mid-stream")
+
+
+async def _acut_off_stream(*args, **kwargs):
+    yield CUT_OFF_ANSWER
+    raise ConnectionError("connection reset mid-stream")
+
+
+async def _aread(stream):
+    return "".join([delta async for delta in stream])
+
+
+def check_cut_off_stream():
+    """A stream that fails after its first delta must not be cached or recorded in the history"""
+    streams = explainer.stream_structured_explanation, explainer.astream_structured_explanation
+    explainer.stream_structured_explanation = _cut_off_stream
+    explainer.astream_structured_explanation = _acut_off_stream
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            history = explanation_history._default_history = explanation_history.ExplanationHistory(
+                os.path.join(directory, "history.db"))
+            cache = MemoryExplanationCache()
+            runs = (
+                ("stream_explain", lambda prompt: "".join(
+                    explainer.stream_explain(prompt, "Simple", "test-key", cache=cache, user_id="u")), "sync"),
+                ("astream_explain", lambda prompt: asyncio.run(_aread(
+                    explainer.astream_explain(prompt, "Simple", "test-key", None, cache=cache, user_id="u"))), "async"),
+            )
+            for name, read, prompt in runs:
+                assert read(prompt) == CUT_OFF_ANSWER, f"{name}: the reader should see the cut-off answer"
+                assert explainer.cached_explanation(prompt, "Simple", cache=MemoryExplanationCache(),
+                                                    user_id="u") is None, f"{name}: cut-off answer in the history"
+                assert explainer.cached_explanation(prompt, "Simple", cache=cache) is None, \
+                    f"{name}: cut-off answer cached"
+            assert history.stats()["entries"] == 0
+            explanation_history._default_history = None
+    finally:
+        explainer.stream_structured_explanation, explainer.astream_structured_explanation = streams
+    print("cut-off streams are neither cached nor kept in the history")
+
+
+def summarize(name, samples):
+    ttft = [s[0] * 1000 for s in samples]
+    total = [s[1] * 1000 for s in samples]
+    print(f"{name:<10} ttft p50={statistics.median(ttft):7.1f} ms  total p50={statistics.median(total):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    check_cut_off_stream()
+    server, functions.OPENROUTER_URL = start_fake_openrouter(args.first_token_delay, args.token_delay)
+    try:
+        streamed = [time_streaming(f"question {i}") for i in range(args.runs)]
+        blocking = [time_blocking(f"question {i}") for i in range(args.runs)]
+    finally:
+        server.shutdown()
+
+    assert streamed[0][2] == blocking[0][2], "streamed and blocking answers differ"
+    summarize("streaming", streamed)
+    summarize("blocking", blocking)
+
+
+if __name__ == "__main__":
+    main()
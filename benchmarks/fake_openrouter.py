@@ -0,0 +1,208 @@
+"""Local stand-in for the OpenRouter chat completions endpoint.
+
+Serves both the JSON and the server-sent-events (``"stream": true``) forms of
+``POST /api/v1/chat/completions`` with configurable latency, so the app and
+the benchmarks can run without network access or an API key.
+
+Run standalone and point the app at it:
+    python benchmarks/fake_openrouter.py --port 8765
+    OPENROUTER_URL=http://127.0.0.1:8765/api/v1/chat/completions streamlit run main.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "Entropy measures how many microscopic arrangements are consistent with a macroscopic state. "
+    "```latex\nS = k_B \\ln \\Omega\n``` "
+    "A gas spreading through a room is the classic example: there are far more ways for the "
+    "molecules to be spread out than bunched up, so the spread-out state is overwhelmingly likely."
+)
+
+_BUDGET = re.compile(r"(\d+) tokens")
+# Filler for budget-sized answers; one word is one token to the fake server
+_WORDS = ("the", "energy", "system", "state", "because", "each", "particle", "so", "more", "ways",
+          "which", "means", "heat", "flows", "from", "hot", "to", "cold", "and", "entropy", "grows.")
+
+
+def budget_answer(body):
+    """An answer whose length follows the token budget stated in the system prompt.
+
+    The length is drawn around the budget (models miss it both ways), seeded by
+    the question so every prompt version is measured on the same draws.
+    """
+    messages = body.get("messages") or [{}]
+    match = _BUDGET.search(messages[0].get("content", ""))
+    if not match:
+        return None
+    question = messages[-1].get("content", "")
+    rng = random.Random(hashlib.sha256(question.encode("utf-8")).hexdigest())
+    length = max(1, int(int(match.group(1)) * rng.lognormvariate(0, 0.3)))
+    return " ".join(rng.choice(_WORDS) for _ in range(length))
+
+
+def cached_prefix_tokens(server, messages):
+    """Prompt tokens of the longest run of leading messages sent before, remembering this request's.
+
+    Stands in for upstream prompt caching, at message granularity.
+    """
+    digest, cached, counting = hashlib.sha256(), 0, True
+    with server.lock:
+        for message in messages:
+            digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            key = digest.hexdigest()
+            counting = counting and key in server.prefixes
+            if counting:
+                cached += len(message.get("content", "")) // 4
+            server.prefixes.add(key)
+    return cached
+
+
+class FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.config
+        with self.server.lock:
+            self.server.requests.append(body)
+            fail = config.get("fail_next", 0) > 0
+            if fail:
+                config["fail_next"] -= 1
+            fail = fail or body.get("model") in config.get("failing_models", ())
+            limited = False
+            if config.get("max_per_second"):
+                now = time.monotonic()
+                recent = self.server.recent = [t for t in self.server.recent if now - t < 1.0]
+                limited = len(recent) >= config["max_per_second"]
+                if limited:
+                    self.server.rate_limited += 1
+                else:
+                    recent.append(now)
+        if fail or limited:
+            self.send_response(429 if limited else 503)
+            if limited:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        answer = (config.get("budget_answers") and budget_answer(body)) or config["answer"]
+        tokens = answer.split(" ")
+        tokens = [token + " " for token in tokens[:-1]] + tokens[-1:]
+        finish_reason = "stop"
+        if body.get("max_tokens") and len(tokens) > body["max_tokens"]:
+            tokens, finish_reason = tokens[:body["max_tokens"]], "length"
+            answer = "".join(tokens)
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "")) // 4 for m in body.get("messages", [])),
+            "completion_tokens": len(tokens),
+            "prompt_tokens_details": {"cached_tokens": cached_prefix_tokens(self.server, body.get("messages", []))},
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self.server.lock:
+            self.server.total_tokens += usage["total_tokens"]
+            self.server.prompt_tokens += usage["prompt_tokens"]
+            self.server.cached_tokens += usage["prompt_tokens_details"]["cached_tokens"]
+
+        uncached = usage["prompt_tokens"] - usage["prompt_tokens_details"]["cached_tokens"]
+        time.sleep(config.get("model_delays", {}).get(body.get("model"), config["first_token_delay"])
+                   + config.get("prompt_token_delay", 0) * uncached)
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            try:
+                self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(config["token_delay"])
+                    chunk = {"model": body.get("model"), "choices": [{"delta": {"content": token}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                final = {"model": body.get("model"), "choices": [{"delta": {}, "finish_reason": finish_reason}],
+                         "usage": usage}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the stream early, e.g. a cancelled request
+                with self.server.lock:
+                    self.server.aborted += 1
+            self.close_connection = True
+            return
+
+        time.sleep(config["token_delay"] * max(len(tokens) - 1, 0))
+        payload = json.dumps({
+            "model": body.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": answer}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }).encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            with self.server.lock:
+                self.server.aborted += 1
+
+
+def start_fake_openrouter(first_token_delay=0.3, token_delay=0.01, answer=DEFAULT_ANSWER, port=0):
+    """Start the fake server on a background thread.
+
+    ``server.config`` can be changed while running; set ``fail_next`` to make
+    the next N requests fail with HTTP 503, and ``max_per_second`` to answer
+    requests beyond that rate with HTTP 429 (counted in ``server.rate_limited``).
+    Streams the client closed early are counted in ``server.aborted``.
+    ``failing_models`` (model ids answered with 503) and ``model_delays``
+    (first-token delay per model id) simulate an unhealthy model. With
+    ``budget_answers`` set, answer lengths follow the "N tokens" budget in
+    the system prompt instead of repeating ``answer``. Answers longer than
+    the request's ``max_tokens`` are cut off with finish_reason "length".
+    Prompt tokens in a prefix of messages already sent are reported as
+    ``cached_tokens``; the rest add ``prompt_token_delay`` seconds each
+    before the first token, as prompt processing would.
+
+    Returns:
+        tuple: (server, url) - call ``server.shutdown()`` when done
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenRouterHandler)
+    server.daemon_threads = True
+    server.config = {"first_token_delay": first_token_delay, "token_delay": token_delay, "answer": answer}
+    server.requests = []
+    server.recent = []
+    server.rate_limited = 0
+    server.aborted = 0
+    server.total_tokens = 0
+    server.prefixes = set()
+    server.prompt_tokens = 0
+    server.cached_tokens = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenRouter endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    server, url = start_fake_openrouter(args.first_token_delay, args.token_delay, port=args.port)
+    print(f"Fake OpenRouter listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
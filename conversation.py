@@ -0,0 +1,127 @@
+import os
+
+from prompts import estimate_tokens, get_prompt
+
+# Tokens of earlier conversation (digest plus recent turns) sent along with a follow-up
+BUDGET = int(os.environ.get("EXPLAINMATE_CONVERSATION_BUDGET", 1500))
+# Size the digest of compacted turns is kept under
+DIGEST_BUDGET = int(os.environ.get("EXPLAINMATE_CONVERSATION_DIGEST", 200))
+# With EXPLAINMATE_CONVERSATION_SUMMARIZE=1 compacted turns are summarized by the LLM instead of locally
+SUMMARIZE = os.environ.get("EXPLAINMATE_CONVERSATION_SUMMARIZE") == "1"
+# Tokens of each answer kept in the local digest
+DIGEST_ANSWER_TOKENS = 40
+
+SUMMARY_PROMPT = (
+    "You summarize a tutoring conversation so it can continue without the full transcript. "
+    "Keep the concepts covered, definitions, formulas, examples and anything the student said they "
+    "did not understand. Write terse notes, in at most {budget} tokens."
+)
+
+
+def _first_sentence(text, max_tokens):
+    text = " ".join((text or "").split())
+    sentence = text.split(". ")[0]
+    words = []
+    for word in sentence.split(" "):
+        words.append(word)
+        if estimate_tokens(" ".join(words)) > max_tokens:
+            words[-1] = "..."
+            break
+    return " ".join(words)
+
+
+def local_digest(digest, turns, budget=DIGEST_BUDGET):
+    """Fold turns into the digest as one line each (question and the answer's opening), oldest lines dropped first"""
+    lines = [line for line in (digest or "").splitlines() if line]
+    lines += [f"- {question}: {_first_sentence(answer, DIGEST_ANSWER_TOKENS)}" for question, answer in turns]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def summary_messages(digest, turns, budget=DIGEST_BUDGET):
+    """Messages asking the LLM to summarize the digest and turns into a new digest"""
+    transcript = "\n\n".join(f"Student: {question}\nTutor: {answer}" for question, answer in turns)
+    if digest:
+        transcript = f"Summary so far:\n{digest}\n\n{transcript}"
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT.format(budget=budget)},
+        {"role": "user", "content": transcript},
+    ]
+
+
+class Conversation:
+    """One browser session's explanation and its follow-up questions, with bounded context.
+
+    A follow-up is sent with the style's system prompt, a digest of
+    compacted turns and the recent turns in full. Once the digest and turns
+    pass ``budget`` tokens, the oldest turns are folded into the digest until
+    the rest fit in half the budget. Compacting in steps rather than sliding
+    the window every turn keeps the start of the request the same from one
+    follow-up to the next, so upstream prompt caching can reuse it.
+
+    ``transcript`` keeps every (question, answer) for display.
+    """
+
+    def __init__(self, style, key=None, budget=BUDGET, digest_budget=DIGEST_BUDGET):
+        self.style = style
+        self.key = key
+        self.budget = budget
+        self.digest_budget = digest_budget
+        self.digest = ""
+        self.turns = []
+        self.transcript = []
+        self.compactions = 0
+
+    def _user_content(self, question):
+        if not self.transcript:
+            # The opening question is worded as a plain explanation request is, so it can come from the cache
+            return get_prompt(self.style).messages(question)[1]["content"]
+        return question
+
+    def context_tokens(self):
+        """Estimated tokens of the digest and turns sent with the next follow-up"""
+        return estimate_tokens(self.digest) + sum(tokens for _, _, tokens in self.turns)
+
+    def messages(self, question):
+        """The chat messages for asking ``question`` next"""
+        messages = [{"role": "system", "content": get_prompt(self.style).text}]
+        if self.digest:
+            messages.append({"role": "system", "content": f"Earlier in this conversation:\n{self.digest}"})
+        for content, answer, _ in self.turns:
+            messages.append({"role": "user", "content": content})
+            messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": self._user_content(question)})
+        return messages
+
+    def add(self, question, answer, summarize=None):
+        """Record an answered question, compacting older turns if the context is over budget.
+
+        ``summarize(digest, turns)`` may return a new digest for the compacted
+        turns; the local digest is used when it is not given or returns nothing.
+        """
+        content = self._user_content(question)
+        self.transcript.append((question, answer))
+        self.turns.append((content, answer, estimate_tokens(content) + estimate_tokens(answer)))
+        if self.context_tokens() > self.budget:
+            self.compact(summarize)
+
+    def compact(self, summarize=None):
+        """Fold the oldest turns into the digest until the rest fit in half the budget (the last turn stays)"""
+        keep, kept_tokens = len(self.turns), 0
+        while keep > 0 and (keep == len(self.turns)
+                            or kept_tokens + self.turns[keep - 1][2] <= self.budget // 2):
+            kept_tokens += self.turns[keep - 1][2]
+            keep -= 1
+        folded = [(content, answer) for content, answer, _ in self.turns[:keep]]
+        if not folded:
+            return
+        digest = None
+        if summarize is not None:
+            try:
+                digest = summarize(self.digest, folded)
+            except Exception as e:
+                print(f"Error summarizing conversation: {str(e)}")
+        self.digest = digest or local_digest(self.digest, folded, self.digest_budget)
+        self.turns = self.turns[keep:]
+        self.compactions += 1
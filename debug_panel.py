@@ -0,0 +1,62 @@
+import streamlit as st
+
+import profiler
+from explanation_cache import get_default_cache
+from explanation_jobs import get_explanation_jobs
+from model_router import get_router
+from rate_limiter import get_rate_limiter
+
+RERUNS_SHOWN = 20
+
+
+def render_debug_panel(session=None, limit=RERUNS_SHOWN):
+    """Expander with the stage breakdown of recent reruns and cache hit rates"""
+    with st.expander("🛠️ Rerun profile"):
+        reruns = profiler.recent(limit, session=session)
+        if reruns:
+            stages = sorted({name for rerun in reruns for name in rerun["stages"]})
+            rows = []
+            for rerun in reruns:
+                row = {"rerun": rerun["rerun"], "total ms": rerun["duration_ms"],
+                       "stopped early": rerun["interrupted"]}
+                for name in stages:
+                    stage = rerun["stages"].get(name)
+                    row[name] = stage["ms"] if stage else None
+                rows.append(row)
+            st.caption(f"Last {len(rows)} reruns of this session, newest first (ms per stage)")
+            st.dataframe(rows, hide_index=True)
+        else:
+            st.caption("No finished reruns yet")
+
+        rates = {name: f"{rate:.0%}" for name, rate in profiler.hit_rates().items()}
+        try:
+            explanation_stats = get_default_cache().stats()
+            rates["explanation_cache (all workers)"] = f"{explanation_stats['hit_rate']:.0%}"
+        except Exception as e:
+            print(f"Error reading cache stats: {str(e)}")
+        if rates:
+            st.caption("Cache hit rates")
+            st.table(rates)
+
+        limits = get_rate_limiter().stats()
+        st.caption(f"Upstream calls: {limits['active']} of {limits['max_concurrent']} slots in use, "
+                   f"{limits['waiting']} queued")
+        jobs = get_explanation_jobs().stats()
+        st.caption(f"Explanation jobs: {jobs['running']} running across {jobs['sessions']} sessions")
+
+        models = get_router().stats()
+        if models:
+            st.caption("Models (first delta or answer, last 5 minutes)")
+            st.dataframe([{"model": name, "requests": s["requests"],
+                           "p50 s": round(s["p50"], 2) if s["p50"] is not None else None,
+                           "p95 s": round(s["p95"], 2) if s["p95"] is not None else None,
+                           "errors": f"{s['error_rate']:.0%}", "healthy": s["healthy"]}
+                          for name, s in models.items()], hide_index=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Reruns (JSON lines)", data=profiler.to_jsonl(reruns),
+                               file_name="reruns.jsonl", mime="application/jsonl", key="profile_jsonl")
+        with col2:
+            st.download_button("Metrics (Prometheus)", data=profiler.prometheus_text(),
+                               file_name="metrics.prom", mime="text/plain", key="profile_prom")
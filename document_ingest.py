@@ -0,0 +1,119 @@
+import io
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ocr_pipeline import TARGET_DPI, cached_result, content_hash, ocr_image
+
+DOCUMENT_EXTENSIONS = (".pdf", ".tif", ".tiff")
+MAX_PAGES_IN_FLIGHT = int(os.environ.get("EXPLAINMATE_OCR_PAGES_IN_FLIGHT", 2))
+
+_page_executor = None
+_page_executor_lock = threading.Lock()
+
+
+def is_document(filename):
+    return filename.lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def _iter_pdf_pages(data, dpi):
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(data)
+    try:
+        total = len(pdf)
+        for index in range(total):
+            page = pdf[index]
+            try:
+                yield total, page.render(scale=dpi / 72, grayscale=True).to_pil()
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+
+
+def _iter_tiff_pages(data):
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    total = getattr(img, "n_frames", 1)
+    for index in range(total):
+        img.seek(index)
+        # copy() decodes just this frame; the next seek() reuses the file handle
+        yield total, img.copy()
+
+
+def iter_pages(data, filename, dpi=TARGET_DPI):
+    """Lazily decode the pages of a PDF or TIFF, yielding (page_count, PIL image)"""
+    if filename.lower().endswith(".pdf"):
+        return _iter_pdf_pages(data, dpi)
+    return _iter_tiff_pages(data)
+
+
+def _get_page_executor():
+    # Separate from the tile pool in ocr_pipeline, which page workers submit to
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None:
+            _page_executor = ThreadPoolExecutor(max_workers=MAX_PAGES_IN_FLIGHT, thread_name_prefix="ocr-page")
+        return _page_executor
+
+
+def ocr_document(data, filename, max_in_flight=MAX_PAGES_IN_FLIGHT):
+    """OCR a multi-page PDF or TIFF, yielding (page_number, page_count, text) in page order.
+
+    Pages are decoded one at a time and at most ``max_in_flight`` are decoded
+    or being OCR'd at once, so memory stays bounded however long the
+    document is. Each page is yielded as soon as it and every earlier page
+    are done. Page results are cached by document content.
+    """
+    doc_hash = content_hash(data)
+    executor = _get_page_executor()
+    pending = deque()
+
+    def ocr_page(number, img):
+        return cached_result(f"{doc_hash}:{number}", lambda: ocr_image(img))
+
+    for number, (total, img) in enumerate(iter_pages(data, filename), 1):
+        pending.append((number, total, executor.submit(ocr_page, number, img)))
+        del img
+        while len(pending) >= max_in_flight:
+            number_done, total_done, future = pending.popleft()
+            yield number_done, total_done, future.result().strip()
+    while pending:
+        number_done, total_done, future = pending.popleft()
+        yield number_done, total_done, future.result().strip()
+
+
+class DocumentJob:
+    """Runs ``ocr_document`` on a background thread so the UI can poll its progress.
+
+    Streamlit reruns the script on every interaction; keeping the job in
+    session state lets the page show finished pages (and explain page 1)
+    while later pages are still being processed.
+    """
+
+    def __init__(self, data, filename):
+        self.key = content_hash(data)
+        self.filename = filename
+        self.pages = {}
+        self.total = None
+        self.error = None
+        self.done = False
+        self._thread = threading.Thread(target=self._run, args=(data,), daemon=True)
+        self._thread.start()
+
+    def _run(self, data):
+        try:
+            for number, total, text in ocr_document(data, self.filename):
+                self.total = total
+                self.pages[number] = text
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    def text(self):
+        """Text of all finished pages, in page order"""
+        return "\n\n".join(self.pages[number] for number in sorted(self.pages) if self.pages[number])
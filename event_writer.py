@@ -0,0 +1,343 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from llm_client import backoff_delay
+from local_stubs import OFFLINE, get_local_airtable
+
+DEFAULT_SPOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "event_spool.db")
+MAX_QUEUE = int(os.environ.get("EXPLAINMATE_EVENT_QUEUE", 1000))
+MAX_SPOOLED = int(os.environ.get("EXPLAINMATE_EVENT_SPOOL_MAX", 50000))
+FLUSH_INTERVAL = 1.0
+# Seconds a batch being delivered stays claimed by one writer; a writer that dies mid-write loses the claim
+CLAIM_SECONDS = 60
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 300.0
+
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+
+class SupabaseSink:
+    """Inserts event batches into a Supabase table as the users who submitted them.
+
+    Events are submitted as ``SupabaseSink.event(access_token, row)`` and
+    inserted with a client carrying that access token, so row-level security
+    applies as it does to the user's own requests. A batch only holds
+    consecutive events with the same token (see ``batch_key``). Pass
+    ``client`` to insert every row with that client instead.
+    """
+
+    batch_size = 100
+    min_interval = 0.0
+
+    def __init__(self, table, client=None):
+        self.table = table
+        self.client = client
+
+    @staticmethod
+    def event(access_token, row):
+        return {"access_token": access_token, "row": row}
+
+    @staticmethod
+    def batch_key(record):
+        return record.get("access_token")
+
+    def write(self, records):
+        client = self.client
+        if client is None:
+            from session_manager import client_for_token
+            client = client_for_token(records[0].get("access_token"))
+        client.table(self.table).insert([record.get("row", record) for record in records]).execute()
+
+
+class AirtableSink:
+    """Creates Airtable records, 10 per request (the API maximum).
+
+    Airtable allows 5 requests per second per base, so requests are spaced
+    ``min_interval`` apart.
+    """
+
+    batch_size = 10
+    min_interval = 0.2
+
+    def __init__(self, api_key, base_id, table_name, table=None):
+        if table is None and OFFLINE:
+            table = get_local_airtable().table(base_id, table_name)
+        elif table is None:
+            from pyairtable import Api
+            table = Api(api_key).table(base_id, table_name)
+        self.table = table
+
+    def write(self, records):
+        self.table.batch_create(records)
+
+
+class EventSpool:
+    """SQLite file holding events until every sink has accepted them.
+
+    Several processes may share one spool (the app next to the API service,
+    or several API workers). A batch is claimed for ``CLAIM_SECONDS`` in the
+    transaction that reads it, so only one of them sends it.
+    """
+
+    def __init__(self, path=DEFAULT_SPOOL_PATH, max_events=MAX_SPOOLED):
+        self.path = path
+        self.max_events = max_events
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by the writer thread and callers of flush()/stats(), so every use takes the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sink TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    claimed_until REAL NOT NULL DEFAULT 0
+                )"""
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(events)")]
+            if "claimed_until" not in columns:
+                # Spool files written before claims existed
+                self._conn.execute("ALTER TABLE events ADD COLUMN claimed_until REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_events_sink ON events(sink, id)")
+
+    def add(self, events):
+        """Spool (sink, record) pairs; returns how many old events were dropped to stay under the cap"""
+        now = time.time()
+        rows = [(sink, json.dumps(record, ensure_ascii=False, default=str), now) for sink, record in events]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO events (sink, payload, created_at) VALUES (?, ?, ?)", rows)
+            excess = self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] - self.max_events
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM events WHERE id IN (SELECT id FROM events ORDER BY id LIMIT ?)", (excess,))
+        return max(0, excess)
+
+    def claim(self, sink, limit, batch_key=None):
+        """Claim up to ``limit`` of the sink's unclaimed events; returns (ids, records).
+
+        With ``batch_key`` only the leading events whose key matches the first
+        one's are claimed, e.g. one user's.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # Taking the write lock before reading keeps another process from claiming the same rows
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, payload FROM events WHERE sink = ? AND claimed_until < ? ORDER BY id LIMIT ?",
+                (sink, now, limit)).fetchall()
+            ids, records = [row[0] for row in rows], [json.loads(row[1]) for row in rows]
+            if batch_key is not None and records:
+                size = 1
+                while size < len(records) and batch_key(records[size]) == batch_key(records[0]):
+                    size += 1
+                ids, records = ids[:size], records[:size]
+            self._conn.executemany("UPDATE events SET claimed_until = ? WHERE id = ?",
+                                   [(now + CLAIM_SECONDS, event_id) for event_id in ids])
+        return ids, records
+
+    def release(self, ids):
+        """Put back claimed events whose delivery failed"""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE events SET claimed_until = 0 WHERE id = ?",
+                                   [(event_id,) for event_id in ids])
+
+    def remove(self, ids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM events WHERE id = ?", [(event_id,) for event_id in ids])
+
+    def count(self, sink=None):
+        with self._lock:
+            if sink is None:
+                return self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM events WHERE sink = ?", (sink,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EventWriter:
+    """Writes analytics and feedback events from a background thread.
+
+    ``submit()`` only puts the event on a bounded in-memory queue, so the UI
+    never waits on Supabase or Airtable. A worker thread moves queued events
+    into the spool file in batches and delivers each sink's spooled events
+    in batches of ``sink.batch_size``. Events stay in the spool until their
+    sink accepts them, so they survive outages and restarts; a failing sink
+    is retried with exponential backoff without holding up the others.
+
+    When the queue is full, ``submit()`` waits up to ``timeout`` seconds
+    and then drops the event; drops are counted in ``stats()``.
+    """
+
+    def __init__(self, spool=None, max_queue=MAX_QUEUE, flush_interval=FLUSH_INTERVAL):
+        self.spool = spool or EventSpool()
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._sinks = {}
+        self._sinks_lock = threading.Lock()
+        self._retry_at = {}
+        self._failures = {}
+        self._last_write = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "dropped": 0, "spool_dropped": 0, "delivered": 0, "rejected": 0,
+                       "failed_writes": 0, "worker_errors": 0}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self._thread.start()
+
+    def add_sink(self, name, sink):
+        """Register a sink; events already spooled for ``name`` are delivered to it"""
+        with self._sinks_lock:
+            self._sinks.setdefault(name, sink)
+
+    def has_sink(self, name):
+        with self._sinks_lock:
+            return name in self._sinks
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def submit(self, sink, record, timeout=0):
+        """Queue a record for ``sink``; returns False if it was dropped because the queue is full"""
+        try:
+            if timeout:
+                self._queue.put((sink, record), timeout=timeout)
+            else:
+                self._queue.put_nowait((sink, record))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("submitted")
+        return True
+
+    def _drain(self, wait):
+        events = []
+        try:
+            events.append(self._queue.get(timeout=wait) if wait else self._queue.get_nowait())
+            while True:
+                events.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if events:
+            try:
+                self._count("spool_dropped", self.spool.add(events))
+            except Exception:
+                self._count("spool_dropped", len(events))
+                raise
+            finally:
+                for _ in events:
+                    self._queue.task_done()
+        return len(events)
+
+    def _deliver(self, name, sink):
+        """Send one batch of spooled events to ``sink``; returns how many were delivered"""
+        now = time.monotonic()
+        if now < self._retry_at.get(name, 0):
+            return 0
+        ids, records = self.spool.claim(name, sink.batch_size, getattr(sink, "batch_key", None))
+        if not ids:
+            return 0
+        wait = self._last_write.get(name, 0) + sink.min_interval - now
+        if wait > 0:
+            time.sleep(wait)
+        self._last_write[name] = time.monotonic()
+        try:
+            sink.write(records)
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status and 400 <= status < 500 and status not in (408, 429):
+                # The sink rejected the records themselves (or, for a user's events, their expired
+                # token); retrying cannot help
+                print(f"Dropping {len(records)} events rejected by {name}: {str(e)}")
+                self.spool.remove(ids)
+                self._count("rejected", len(ids))
+                return len(ids)
+            self.spool.release(ids)
+            failures = self._failures.get(name, 0)
+            self._failures[name] = failures + 1
+            self._retry_at[name] = time.monotonic() + backoff_delay(failures, BACKOFF_BASE, BACKOFF_CAP)
+            self._count("failed_writes")
+            print(f"Error writing {len(records)} events to {name}: {str(e)}")
+            return 0
+        self._failures.pop(name, None)
+        self.spool.remove(ids)
+        self._count("delivered", len(ids))
+        return len(ids)
+
+    def _deliver_all(self):
+        """Deliver batches round-robin until nothing more can be sent right now"""
+        with self._sinks_lock:
+            sinks = list(self._sinks.items())
+        delivered = True
+        while delivered and not self._stop.is_set():
+            delivered = False
+            for name, sink in sinks:
+                if self._deliver(name, sink):
+                    delivered = True
+                # Keep the queue from filling up while a long backlog is sent
+                self._drain(wait=0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._drain(wait=self.flush_interval)
+                self._deliver_all()
+            except Exception as e:
+                # e.g. a locked spool file; the events are still queued or spooled, so keep going
+                self._count("worker_errors")
+                print(f"Error in event writer: {str(e)}")
+                self._stop.wait(self.flush_interval)
+
+    def flush(self, timeout=10.0):
+        """Block until queued events are spooled and delivered, or ``timeout`` passes.
+
+        Returns True if nothing is left to deliver to the registered sinks.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._sinks_lock:
+                names = list(self._sinks)
+            # unfinished_tasks also covers events taken off the queue but not yet spooled
+            if not self._queue.unfinished_tasks and not any(self.spool.count(name) for name in names):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def close(self, timeout=2.0):
+        """Stop the worker, spooling whatever is still queued for the next run"""
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+        self._drain(wait=0)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["spooled"] = self.spool.count()
+        return stats
+
+
+def get_event_writer():
+    """Return the process-wide event writer, spooling to ``EXPLAINMATE_EVENT_SPOOL``"""
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            spool = EventSpool(os.environ.get("EXPLAINMATE_EVENT_SPOOL", DEFAULT_SPOOL_PATH))
+            _default_writer = EventWriter(spool)
+            atexit.register(_default_writer.close)
+        return _default_writer
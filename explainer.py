@@ -0,0 +1,374 @@
+import asyncio
+import os
+
+from functions import (
+    get_structured_explanation,
+    stream_structured_explanation,
+    aget_structured_explanation,
+    astream_structured_explanation,
+)
+from conversation import SUMMARIZE as SUMMARIZE_CONVERSATIONS, summary_messages
+from explanation_cache import get_default_cache, make_cache_key
+from explanation_history import ENABLED as HISTORY_ENABLED, get_explanation_history
+from model_router import get_router
+from single_flight import AsyncSingleFlight, SingleFlight
+from profiler import count, span
+from prompts import estimate_tokens, get_prompt
+from rate_limiter import get_rate_limiter
+from usage_ledger import get_usage_ledger
+
+# Concurrent misses for the same cache key share one upstream call
+flights = SingleFlight()
+# The same for astream_explain(), which runs on the API service's event loop
+async_flights = AsyncSingleFlight()
+# Yielded last, instead of the answer being cached, by a shared stream that failed part-way; its readers
+# drop it and keep the cut-off answer out of the history
+_CUT_OFF = object()
+# Semantic matches tried per lookup when the closest ones have left the exact cache
+SEMANTIC_ATTEMPTS = 3
+
+
+def _default_semantic_cache(cache):
+    """The process-wide semantic tier if EXPLAINMATE_SEMANTIC_CACHE is set, else None.
+
+    semantic_cache (and numpy with it) is only imported once the tier is enabled.
+    """
+    if os.environ.get("EXPLAINMATE_SEMANTIC_CACHE", "").lower() not in ("1", "true", "yes"):
+        return None
+    from semantic_cache import get_default_semantic_cache
+    return get_default_semantic_cache(cache)
+
+
+def _cache_model(style, model):
+    """Model name answers are cached under: the pinned model, or the style tier's primary model"""
+    return model or get_router().primary(style)
+
+
+def _lookup(prompt, style, model, cache, semantic_cache, count_miss=True):
+    """Return (cache_key, cached_output) for the prompt; output is None on a miss"""
+    model = _cache_model(style, model)
+    with span("cache.lookup"):
+        key = make_cache_key(prompt, style, model, get_prompt(style).version)
+        output = cache.get(key)
+        if output is None and semantic_cache is not None:
+            for _ in range(SEMANTIC_ATTEMPTS):
+                similar_key = semantic_cache.lookup(prompt, style, model)
+                output = cache.get(similar_key) if similar_key else None
+                if output is not None or similar_key is None:
+                    break
+                # Expired or evicted from the exact cache since it was indexed; try the next closest
+                semantic_cache.discard(similar_key)
+    if output is not None:
+        count("explanation_cache.hits")
+    elif count_miss:
+        count("explanation_cache.misses")
+    return key, output
+
+
+def _remember(user_id, prompt, style, model, output):
+    """Add an explanation the user was shown to their history"""
+    if not (HISTORY_ENABLED and user_id and output):
+        return
+    try:
+        with span("history.record"):
+            get_explanation_history().record(user_id, prompt, style, output, model=_cache_model(style, model))
+    except Exception as e:
+        print(f"Error recording explanation history: {str(e)}")
+
+
+def _recall(user_id, prompt, style):
+    """The explanation the user was last shown for the question, from their history, or None"""
+    if not (HISTORY_ENABLED and user_id):
+        return None
+    try:
+        with span("history.lookup"):
+            output = get_explanation_history().lookup(user_id, prompt, style)
+    except Exception as e:
+        print(f"Error reading explanation history: {str(e)}")
+        return None
+    if output is not None:
+        count("explanation_history.hits")
+    return output
+
+
+def _answer(prompt, style, model, cache, semantic_cache, user_id, count_miss=True):
+    """Like ``_lookup``, falling back to the user's history; cache hits are added to the history.
+
+    The history keeps answers the cache has expired or evicted, so a user
+    revisiting a question never needs another upstream call.
+    """
+    key, output = _lookup(prompt, style, model, cache, semantic_cache, count_miss)
+    if output is not None:
+        _remember(user_id, prompt, style, model, output)
+    else:
+        output = _recall(user_id, prompt, style)
+    return key, output
+
+
+def _store(key, output, prompt, style, model, cache, semantic_cache):
+    model = _cache_model(style, model)
+    cache.set(key, output, prompt=prompt, style=style, model=model)
+    if semantic_cache is not None:
+        semantic_cache.add(prompt, style, model, key)
+
+
+def _account(user_id, prompt, style, model, usage, output):
+    """Add a call's tokens to the daily usage ledger, estimated locally if OpenRouter sent none"""
+    if not usage and not output:
+        return
+    if usage.get("finish_reason") == "length":
+        # Cut off by the template's max_tokens; a high rate means the style's budget is too tight
+        count("explain.truncated")
+    try:
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = get_prompt(style).tokens + estimate_tokens(prompt)
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(output)
+        # Charged to the model that answered, which the router may have picked
+        get_usage_ledger().record(user_id, usage.get("model") or _cache_model(style, model), prompt_tokens,
+                                  completion_tokens)
+    except Exception as e:
+        print(f"Error recording token usage: {str(e)}")
+
+
+def cached_explanation(prompt, style, model=None, cache=None, semantic_cache=None, user_id=None):
+    """Return the cached (or, given ``user_id``, remembered) explanation, or None without calling OpenRouter.
+
+    A miss is not counted here, since the caller goes on to ``stream_explain``
+    (which looks again and counts it).
+    """
+    cache = cache or get_default_cache()
+    semantic_cache = semantic_cache or _default_semantic_cache(cache)
+    return _answer(prompt, style, model, cache, semantic_cache, user_id, count_miss=False)[1]
+
+
+def explain(prompt, style, api_key, model=None, cache=None, semantic_cache=None, user_id=None):
+    """Return an explanation for the prompt, serving repeat questions from the cache.
+
+    Exact repeats are answered from the explanation cache. When the semantic
+    tier is enabled, paraphrases of earlier questions are answered from the
+    entry of the closest earlier question. Questions the user asked before
+    that are no longer cached are answered from their history.
+
+    Args:
+        prompt: The user's question or concept
+        style: "Simple" or "Technical"
+        api_key: OpenRouter API key
+        model: Pin one OpenRouter model; by default the model router picks one from the style's tier
+        cache: ExplanationCache to use, defaults to the process-wide cache
+        semantic_cache: SemanticCache to use, defaults to the process-wide tier (if enabled)
+        user_id: User to rate limit, charge the tokens to and keep the history of; None skips all three
+
+    Returns:
+        str: The explanation, or None if it could not be generated
+
+    Raises:
+        RateLimitExceeded: If a fresh answer is needed and a limit does not allow it
+    """
+    cache = cache or get_default_cache()
+    semantic_cache = semantic_cache or _default_semantic_cache(cache)
+    key, output = _answer(prompt, style, model, cache, semantic_cache, user_id)
+    if output is not None:
+        return output
+    limiter = get_rate_limiter()
+    if not flights.in_flight(key):
+        # Joining a call already in flight costs nothing upstream
+        limiter.check(user_id)
+
+    def generate():
+        usage = {}
+        with limiter.slot():
+            output = get_structured_explanation(prompt, style, api_key, model=model, usage=usage)
+        if output:
+            _store(key, output, prompt, style, model, cache, semantic_cache)
+        _account(user_id, prompt, style, model, usage, output)
+        return output
+
+    output = flights.do(key, generate)
+    _remember(user_id, prompt, style, model, output)
+    return output
+
+
+def stream_explain(prompt, style, api_key, model=None, cache=None, semantic_cache=None, user_id=None,
+                   cancel=None):
+    """Yield an explanation as text deltas, serving cached answers as a single chunk.
+
+    Fresh answers are streamed token by token from OpenRouter and only cached
+    once the stream completes. If streaming fails before the first delta the
+    request is retried once without streaming; a stream that fails part-way
+    simply ends, and nothing is cached. Concurrent requests for the same
+    question share one upstream stream. Limits are applied as in ``explain``,
+    so RateLimitExceeded is raised before the first delta.
+
+    Setting the optional ``cancel`` event ends the stream early and, if no
+    one else is reading it, stops the upstream request (see
+    ``SingleFlight.stream``); otherwise an abandoned stream finishes in the
+    background and is cached.
+    """
+    cache = cache or get_default_cache()
+    semantic_cache = semantic_cache or _default_semantic_cache(cache)
+    key, output = _answer(prompt, style, model, cache, semantic_cache, user_id)
+    if output is not None:
+        yield output
+        return
+
+    limiter = get_rate_limiter()
+    if not flights.in_flight(key):
+        limiter.check(user_id)
+
+    output = ""
+    cut_off = False
+    for delta in flights.stream(
+            key, lambda: _generate_stream(prompt, style, api_key, model, key, cache, semantic_cache, user_id,
+                                          limiter),
+            cancel=cancel):
+        if delta is _CUT_OFF:
+            cut_off = True
+            continue
+        output += delta
+        yield delta
+    # Not reached if the reader stopped early, so abandoned answers stay out of the history
+    if not cut_off:
+        _remember(user_id, prompt, style, model, output)
+
+
+def _generate_stream(prompt, style, api_key, model, key, cache, semantic_cache, user_id, limiter):
+    output = ""
+    usage = {}
+    cut_off = False
+    try:
+        with limiter.slot():
+            try:
+                for delta in stream_structured_explanation(prompt, style, api_key, model, usage=usage):
+                    output += delta
+                    yield delta
+            except Exception as e:
+                print(f"Error streaming explanation: {str(e)}")
+                if output:
+                    cut_off = True
+                else:
+                    output = get_structured_explanation(prompt, style, api_key, model=model, usage=usage) or ""
+                    if output:
+                        yield output
+    finally:
+        # A cancelled stream is closed at a yield and never cached, but its tokens were still spent
+        _account(user_id, prompt, style, model, usage, output)
+
+    if cut_off:
+        yield _CUT_OFF
+    elif output:
+        _store(key, output, prompt, style, model, cache, semantic_cache)
+
+
+def _summarizer(conversation, api_key, model, user_id, limiter):
+    """``summarize`` for Conversation.add: an LLM summary of compacted turns, charged to the user"""
+    def summarize(digest, turns):
+        messages = summary_messages(digest, turns, conversation.digest_budget)
+        usage = {}
+        with limiter.slot(), span("conversation.summarize"):
+            output = get_structured_explanation(None, conversation.style, api_key, model=model, usage=usage,
+                                                messages=messages)
+        _account(user_id, messages[-1]["content"], conversation.style, model, usage, output)
+        return output
+    return summarize
+
+
+def stream_follow_up(conversation, question, api_key, model=None, user_id=None, cancel=None):
+    """Yield the answer to the next question of a Conversation as text deltas, and add it to the conversation.
+
+    The opening question goes through ``stream_explain`` (and so the cache
+    and history). Follow-ups depend on the conversation, so they are never
+    cached: each is sent with the conversation's bounded context, under the
+    same rate limits. The answer is only added once it is complete, and the
+    stream ends at the next delta after ``cancel`` is set.
+    """
+    if not conversation.transcript:
+        output = ""
+        for delta in stream_explain(question, conversation.style, api_key, model=model, user_id=user_id,
+                                    cancel=cancel):
+            output += delta
+            yield delta
+        if output and not (cancel is not None and cancel.is_set()):
+            conversation.add(question, output)
+        return
+
+    limiter = get_rate_limiter()
+    limiter.check(user_id)
+    messages = conversation.messages(question)
+    count("conversation.follow_ups")
+    output = ""
+    usage = {}
+    try:
+        with limiter.slot():
+            for delta in stream_structured_explanation(question, conversation.style, api_key, model, usage=usage,
+                                                       messages=messages):
+                if cancel is not None and cancel.is_set():
+                    return
+                output += delta
+                yield delta
+    finally:
+        _account(user_id, "\n".join(m["content"] for m in messages[1:]), conversation.style, model, usage, output)
+    if output:
+        summarize = (_summarizer(conversation, api_key, model, user_id, limiter)
+                     if SUMMARIZE_CONVERSATIONS else None)
+        conversation.add(question, output, summarize)
+
+
+async def astream_explain(prompt, style, api_key, client, model=None, cache=None, semantic_cache=None,
+                          user_id=None):
+    """asyncio form of ``stream_explain`` for the API service.
+
+    ``client`` is an AsyncLLMClient. Cache reads and writes are run in a
+    worker thread so they never block the event loop.
+    """
+    cache = cache or get_default_cache()
+    semantic_cache = semantic_cache or _default_semantic_cache(cache)
+    key, output = await asyncio.to_thread(_answer, prompt, style, model, cache, semantic_cache, user_id)
+    if output is not None:
+        yield output
+        return
+    limiter = get_rate_limiter()
+    if not async_flights.in_flight(key):
+        await asyncio.to_thread(limiter.check, user_id)
+
+    stream = async_flights.stream(
+        key, lambda: _agenerate_stream(prompt, style, api_key, client, model, key, cache, semantic_cache,
+                                       user_id, limiter))
+    output = ""
+    cut_off = False
+    async for delta in stream:
+        if delta is _CUT_OFF:
+            cut_off = True
+            continue
+        output += delta
+        yield delta
+    if not cut_off:
+        await asyncio.to_thread(_remember, user_id, prompt, style, model, output)
+
+
+async def _agenerate_stream(prompt, style, api_key, client, model, key, cache, semantic_cache, user_id, limiter):
+    output = ""
+    usage = {}
+    cut_off = False
+    async with limiter.aslot():
+        try:
+            async for delta in astream_structured_explanation(prompt, style, api_key, client, model, usage=usage):
+                output += delta
+                yield delta
+        except Exception as e:
+            print(f"Error streaming explanation: {str(e)}")
+            if output:
+                cut_off = True
+            else:
+                output = await aget_structured_explanation(prompt, style, api_key, client, model=model,
+                                                           usage=usage) or ""
+                if output:
+                    yield output
+
+    await asyncio.to_thread(_account, user_id, prompt, style, model, usage, output)
+    if cut_off:
+        yield _CUT_OFF
+    elif output:
+        await asyncio.to_thread(_store, key, output, prompt, style, model, cache, semantic_cache)
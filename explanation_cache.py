@@ -0,0 +1,245 @@
+import abc
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "explanations.db")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?.!]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """Normalize a user query so trivially different spellings share a cache entry"""
+    text = unicodedata.normalize("NFKC", prompt or "").lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def make_cache_key(prompt, style, model, prompt_version):
+    """Build a stable cache key over (prompt, style, model, prompt template version hash)"""
+    raw = json.dumps([normalize_prompt(prompt), style, model, prompt_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ExplanationCache(abc.ABC):
+    """Interface shared by the explanation cache backends.
+
+    Backends store explanation text by key, expire entries after ``ttl`` seconds
+    and evict the least recently used entries beyond ``max_entries``.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @abc.abstractmethod
+    def get(self, key):
+        pass
+
+    @abc.abstractmethod
+    def set(self, key, value, prompt="", style="", model=""):
+        pass
+
+    @abc.abstractmethod
+    def stats(self):
+        pass
+
+    @abc.abstractmethod
+    def iter_entries(self):
+        """Yield (prompt, style, model, key) for every live entry"""
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+    def _is_expired(self, created_at, now):
+        return bool(self.ttl) and now - created_at > self.ttl
+
+
+class MemoryExplanationCache(ExplanationCache):
+    """In-process LRU cache, useful for tests and single-worker setups"""
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry["created_at"], now):
+                self._entries.pop(key, None)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry["value"]
+
+    def set(self, key, value, prompt="", style="", model=""):
+        with self._lock:
+            self._entries[key] = {
+                "value": value,
+                "prompt": prompt,
+                "style": style,
+                "model": model,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return _build_stats(self._hits, self._misses, len(self._entries))
+
+    def iter_entries(self):
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, entry in entries:
+            yield entry["prompt"], entry["style"], entry["model"], key
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteExplanationCache(ExplanationCache):
+    """On-disk cache shared by every worker process pointing at the same file.
+
+    Hit/miss counters are kept in the database as well, so ``stats()`` reports
+    totals across all workers rather than just the current process.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS explanations (
+                    key TEXT PRIMARY KEY,
+                    prompt TEXT,
+                    style TEXT,
+                    model TEXT,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_explanations_accessed ON explanations(accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO cache_stats VALUES ('hits', 0), ('misses', 0)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, conn, name):
+        conn.execute("UPDATE cache_stats SET value = value + 1 WHERE name = ?", (name,))
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT value, created_at FROM explanations WHERE key = ?", (key,)).fetchone()
+            if row is None or self._is_expired(row[1], now):
+                if row is not None:
+                    conn.execute("DELETE FROM explanations WHERE key = ?", (key,))
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE explanations SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count(conn, "hits")
+            return row[0]
+
+    def set(self, key, value, prompt="", style="", model=""):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, prompt, style, model, value, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl:
+            conn.execute("DELETE FROM explanations WHERE created_at < ?", (now - self.ttl,))
+        overflow = conn.execute("SELECT COUNT(*) FROM explanations").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM explanations WHERE key IN "
+                "(SELECT key FROM explanations ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def stats(self):
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM cache_stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        return _build_stats(counters.get("hits", 0), counters.get("misses", 0), entries)
+
+    def iter_entries(self):
+        conn = self._connect()
+        yield from conn.execute("SELECT prompt, style, model, key FROM explanations").fetchall()
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM explanations")
+            conn.execute("UPDATE cache_stats SET value = 0")
+
+
+def _build_stats(hits, misses, entries):
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "entries": entries,
+        "hit_rate": hits / total if total else 0.0,
+    }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Return the process-wide cache configured from the environment.
+
+    ``EXPLAINMATE_CACHE_BACKEND`` selects ``sqlite`` (default) or ``memory``;
+    ``EXPLAINMATE_CACHE_PATH``, ``EXPLAINMATE_CACHE_TTL`` and
+    ``EXPLAINMATE_CACHE_MAX_ENTRIES`` tune the backend.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            ttl = int(os.environ.get("EXPLAINMATE_CACHE_TTL", DEFAULT_TTL_SECONDS))
+            max_entries = int(os.environ.get("EXPLAINMATE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+            if os.environ.get("EXPLAINMATE_CACHE_BACKEND", "sqlite") == "memory":
+                _default_cache = MemoryExplanationCache(ttl, max_entries)
+            else:
+                path = os.environ.get("EXPLAINMATE_CACHE_PATH", DEFAULT_CACHE_PATH)
+                _default_cache = SQLiteExplanationCache(path, ttl, max_entries)
+        return _default_cache
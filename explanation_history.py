@@ -0,0 +1,281 @@
+"""Per-user explanation history over content-addressed, compressed explanation bodies.
+
+Usage:
+    python explanation_history.py [--user <user id>]
+
+Prints the history's size and how much storage deduplication and
+compression save.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from explanation_cache import normalize_prompt
+
+# On by default; EXPLAINMATE_HISTORY=0 stops recording and serving history
+ENABLED = os.environ.get("EXPLAINMATE_HISTORY", "1") != "0"
+DEFAULT_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "history.db")
+# Entries kept per user; the least recently viewed go first
+DEFAULT_MAX_ENTRIES = 500
+PAGE_SIZE = 20
+ENTRY_COLUMNS = "id, prompt, style, model, size, created_at, viewed_at"
+
+_default_history = None
+_default_history_lock = threading.Lock()
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compress(data):
+    """Return (codec, compressed bytes): zstd if the zstandard package is installed, else zlib"""
+    try:
+        import zstandard
+    except ImportError:
+        return "zlib", zlib.compress(data, 6)
+    return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+
+
+def decompress(codec, data):
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class ExplanationHistory:
+    """SQLite history of the explanations each user was shown.
+
+    Explanation bodies are stored once per distinct text in ``blobs``, keyed
+    by their SHA-256 and compressed, so the same answer shown to many users
+    (or to one user in both a history entry and a later revisit) takes one
+    blob. ``history`` has one small row per (user, normalized question,
+    style) pointing at a blob; asking again moves the row to the top. Each
+    user keeps their ``max_entries`` most recently viewed entries.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    prompt_key TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    style TEXT NOT NULL,
+                    model TEXT,
+                    blob_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    viewed_at REAL NOT NULL,
+                    UNIQUE (user_id, prompt_key, style)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_viewed ON history(user_id, viewed_at DESC, id DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_blob ON history(blob_hash)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _drop_orphan(self, conn, blob_hash):
+        conn.execute("DELETE FROM blobs WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM history WHERE blob_hash = ?)",
+                     (blob_hash, blob_hash))
+
+    def _has_blob(self, conn, blob_hash):
+        return conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (blob_hash,)).fetchone() is not None
+
+    def _trim(self, conn, user_id):
+        """Delete the user's least recently viewed entries beyond ``max_entries``"""
+        rows = conn.execute(
+            "SELECT id, blob_hash FROM history WHERE user_id = ? ORDER BY viewed_at DESC, id DESC LIMIT -1 OFFSET ?",
+            (user_id, self.max_entries),
+        ).fetchall()
+        for entry_id, blob_hash in rows:
+            conn.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+            self._drop_orphan(conn, blob_hash)
+
+    def record(self, user_id, prompt, style, text, model=""):
+        """Add the explanation the user was shown, or move their earlier entry for the question to the top"""
+        data = text.encode("utf-8")
+        blob_hash = content_hash(text)
+        conn = self._connect()
+        stored = None
+        if not self._has_blob(conn, blob_hash):
+            # Compressed before taking the write lock
+            codec, stored = compress(data)
+        now = time.time()
+        prompt_key = normalize_prompt(prompt)
+        with conn:
+            # The blob and the row pointing at it are written under one write lock, so a concurrent
+            # delete() cannot drop the blob as an orphan in between
+            conn.execute("BEGIN IMMEDIATE")
+            if not self._has_blob(conn, blob_hash):
+                if stored is None:
+                    codec, stored = compress(data)
+                conn.execute("INSERT INTO blobs VALUES (?, ?, ?, ?, ?)",
+                             (blob_hash, codec, len(data), len(stored), stored))
+            previous = conn.execute(
+                "SELECT blob_hash FROM history WHERE user_id = ? AND prompt_key = ? AND style = ?",
+                (user_id, prompt_key, style),
+            ).fetchone()
+            conn.execute(
+                """INSERT INTO history (user_id, prompt_key, prompt, style, model, blob_hash, size, created_at,
+                                        viewed_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, prompt_key, style) DO UPDATE SET
+                       prompt = excluded.prompt,
+                       model = excluded.model,
+                       blob_hash = excluded.blob_hash,
+                       size = excluded.size,
+                       viewed_at = excluded.viewed_at""",
+                (user_id, prompt_key, prompt, style, model or "", blob_hash, len(data), now, now),
+            )
+            if previous and previous[0] != blob_hash:
+                self._drop_orphan(conn, previous[0])
+            self._trim(conn, user_id)
+
+    def _text(self, conn, blob_hash):
+        row = conn.execute("SELECT codec, data FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        return decompress(row[0], row[1]).decode("utf-8") if row else None
+
+    def lookup(self, user_id, prompt, style):
+        """Return the explanation the user was last shown for the question, or None"""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT id, blob_hash FROM history WHERE user_id = ? AND prompt_key = ? AND style = ?",
+            (user_id, normalize_prompt(prompt), style),
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE history SET viewed_at = ? WHERE id = ?", (time.time(), row[0]))
+        return self._text(conn, row[1])
+
+    def get(self, user_id, entry_id):
+        """One history entry of the user's, with its ``text``, or None"""
+        conn = self._connect()
+        row = conn.execute(f"SELECT {ENTRY_COLUMNS}, blob_hash FROM history WHERE user_id = ? AND id = ?",
+                           (user_id, entry_id)).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(ENTRY_COLUMNS.split(", "), row[:-1]))
+        entry["text"] = self._text(conn, row[-1])
+        return entry
+
+    def page(self, user_id, limit=PAGE_SIZE, cursor=None):
+        """Return (entries, next_cursor): the user's entries, most recently viewed first, with their text.
+
+        Pass ``next_cursor`` back as ``cursor`` for the following page; it is
+        None after the last one.
+        """
+        query = f"SELECT {ENTRY_COLUMNS}, blob_hash FROM history WHERE user_id = ?"
+        params = [user_id]
+        if cursor:
+            viewed_at, entry_id = cursor.split(":")
+            query += " AND (viewed_at < ? OR (viewed_at = ? AND id < ?))"
+            params += [float(viewed_at), float(viewed_at), int(entry_id)]
+        query += " ORDER BY viewed_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        conn = self._connect()
+        rows = conn.execute(query, params).fetchall()
+        entries = []
+        for row in rows[:limit]:
+            entry = dict(zip(ENTRY_COLUMNS.split(", "), row[:-1]))
+            entry["text"] = self._text(conn, row[-1])
+            entries.append(entry)
+        next_cursor = f"{entries[-1]['viewed_at']!r}:{entries[-1]['id']}" if len(rows) > limit else None
+        return entries, next_cursor
+
+    def delete(self, user_id, entry_id):
+        """Remove one of the user's entries; its blob goes too once no entry points at it"""
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT blob_hash FROM history WHERE user_id = ? AND id = ?",
+                               (user_id, entry_id)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+            self._drop_orphan(conn, row[0])
+        return True
+
+    def stats(self, user_id=None):
+        """Sizes in bytes and what deduplication and compression save.
+
+        ``text_bytes`` is what storing every entry's text would take,
+        ``unique_bytes`` the distinct texts and ``stored_bytes`` those
+        compressed. With ``user_id`` the entry figures are the user's and
+        the blob figures the blobs their entries point at.
+        """
+        conn = self._connect()
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id else ("", ())
+        entries, text_bytes = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM history {where}",
+                                           params).fetchone()
+        blobs, unique_bytes, stored_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs "
+            f"WHERE hash IN (SELECT blob_hash FROM history {where})", params).fetchone()
+        return {
+            "entries": entries,
+            "blobs": blobs,
+            "text_bytes": text_bytes,
+            "unique_bytes": unique_bytes,
+            "stored_bytes": stored_bytes,
+            "dedup_saved": text_bytes - unique_bytes,
+            "compression_saved": unique_bytes - stored_bytes,
+            "ratio": text_bytes / stored_bytes if stored_bytes else 0.0,
+        }
+
+
+def get_explanation_history():
+    """Return the process-wide history, stored at ``EXPLAINMATE_HISTORY_PATH``"""
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            _default_history = ExplanationHistory(
+                os.environ.get("EXPLAINMATE_HISTORY_PATH", DEFAULT_HISTORY_PATH),
+                int(os.environ.get("EXPLAINMATE_HISTORY_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            )
+        return _default_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", help="only this user id")
+    args = parser.parse_args()
+
+    stats = get_explanation_history().stats(args.user)
+    print(f"{stats['entries']} entries over {stats['blobs']} distinct explanations")
+    print(f"  text:        {stats['text_bytes']:12,d} bytes")
+    print(f"  deduplicated:{stats['unique_bytes']:12,d} bytes  (saves {stats['dedup_saved']:,d})")
+    print(f"  compressed:  {stats['stored_bytes']:12,d} bytes  (saves {stats['compression_saved']:,d})")
+    print(f"  overall {stats['ratio']:.1f}x smaller than storing each entry's text")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiler import count, record
+from rate_limiter import RateLimitExceeded
+
+# Seconds a new query has to stay current before it is sent upstream
+DEBOUNCE = float(os.environ.get("EXPLAINMATE_EXPLAIN_DEBOUNCE", 0.5))
+# Explanation jobs running at once across all sessions of this process
+WORKERS = int(os.environ.get("EXPLAINMATE_EXPLAIN_WORKERS", 32))
+# Per-user limits shorter than this are waited out in the queue instead of failing the job
+MAX_QUEUE_WAIT = 15
+# Finished jobs of sessions that submitted nothing for this long are forgotten
+IDLE_TIMEOUT = 3600
+
+PENDING = "pending"
+QUEUED = "queued"
+STREAMING = "streaming"
+DONE = "done"
+CANCELLED = "cancelled"
+
+_default_jobs = None
+_default_jobs_lock = threading.Lock()
+
+
+class ExplanationJob:
+    """One explanation request, streamed on a worker thread so the page can poll it.
+
+    ``output`` grows as deltas arrive. ``status`` is "pending" (debouncing or
+    waiting for a worker), "queued" (waiting out a per-user rate limit until
+    ``resume_at``), "streaming", "done" or "cancelled"; ``error`` is set if
+    the request failed.
+    """
+
+    def __init__(self, key, output=None):
+        self.key = key
+        self.output = output or ""
+        self.status = DONE if output is not None else PENDING
+        self.error = None
+        self.resume_at = None
+        self.submitted = time.monotonic()
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in (DONE, CANCELLED)
+
+    def cancel(self):
+        """Stop the job at its next delta; a job still debouncing never goes upstream"""
+        self._cancel.set()
+
+    def _run(self, make_stream, max_queue_wait):
+        status = CANCELLED
+        try:
+            if not self._cancel.is_set() and self._run_queued(make_stream, max_queue_wait):
+                status = DONE
+        except Exception as e:
+            self.error, status = e, DONE
+        finally:
+            self.status = status
+            count(f"explanation_jobs.{status}")
+
+    def _run_queued(self, make_stream, max_queue_wait):
+        while True:
+            try:
+                return self._stream(make_stream)
+            except RateLimitExceeded as e:
+                if e.reason != "user" or e.retry_after > max_queue_wait:
+                    raise
+                self.status, self.resume_at = QUEUED, time.monotonic() + e.retry_after
+                if self._cancel.wait(e.retry_after):
+                    return False
+
+    def _stream(self, make_stream):
+        """Read the stream into ``output``; False if the job was cancelled part-way"""
+        started = time.perf_counter()
+        stream = make_stream(self._cancel)
+        try:
+            for delta in stream:
+                if self._cancel.is_set():
+                    return False
+                if not self.output:
+                    record("explain.first_chunk", time.perf_counter() - started)
+                self.status = STREAMING
+                self.output += delta
+        finally:
+            # Closing an abandoned generator also ends its HTTP request, e.g. api_client's
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        record("explain.total", time.perf_counter() - started)
+        return True
+
+
+class ExplanationJobs:
+    """The current ExplanationJob of each browser session, run on a shared thread pool.
+
+    The script calls ``submit`` on every rerun with the session's query. The
+    same request gets the job already running; a different one cancels the
+    previous job and starts after ``debounce`` seconds, unless it is itself
+    replaced first. Cached answers come back as finished jobs right away.
+    """
+
+    def __init__(self, debounce=DEBOUNCE, workers=WORKERS, max_queue_wait=MAX_QUEUE_WAIT):
+        self.debounce = debounce
+        self.max_queue_wait = max_queue_wait
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="explain-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session, key, make_stream, lookup=None, restart=False):
+        """Return the session's job for ``key``, starting one if needed.
+
+        Args:
+            session: Id of the browser session
+            key: Identifies the request, e.g. (query, style)
+            make_stream: Called on a worker thread with the job's cancel event; returns an iterator
+                of text deltas, which should end soon after the event is set
+            lookup: Optional; returns the cached answer, or None, without going upstream
+            restart: Start a new job even if the session's finished job is for ``key``
+        """
+        job = self.current(session)
+        if job is not None and job.key == key and not (restart and job.done):
+            return job
+        cached = lookup() if lookup is not None else None
+        job = ExplanationJob(key, cached)
+        with self._lock:
+            previous = self._jobs.get(session)
+            if previous is not None:
+                previous.cancel()
+            self._jobs[session] = job
+            self._forget_idle(job.submitted)
+        if cached is None:
+            # Debounce on a timer so jobs replaced within the window never take a worker
+            timer = threading.Timer(self.debounce, self._start, args=(job, make_stream))
+            timer.daemon = True
+            timer.start()
+        return job
+
+    def _start(self, job, make_stream):
+        if job._cancel.is_set():
+            job.status = CANCELLED
+            count("explanation_jobs.cancelled")
+        else:
+            self._executor.submit(job._run, make_stream, self.max_queue_wait)
+
+    def current(self, session):
+        with self._lock:
+            return self._jobs.get(session)
+
+    def cancel(self, session):
+        """Cancel and forget the session's job, e.g. when its query is cleared"""
+        with self._lock:
+            job = self._jobs.pop(session, None)
+        if job is not None:
+            job.cancel()
+
+    def _forget_idle(self, now):
+        idle = [session for session, job in self._jobs.items()
+                if job.done and now - job.submitted > IDLE_TIMEOUT]
+        for session in idle:
+            del self._jobs[session]
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "sessions": len(jobs),
+            "running": sum(not job.done for job in jobs),
+        }
+
+
+def get_explanation_jobs():
+    """Return the process-wide ExplanationJobs"""
+    global _default_jobs
+    with _default_jobs_lock:
+        if _default_jobs is None:
+            _default_jobs = ExplanationJobs()
+        return _default_jobs
@@ -0,0 +1,76 @@
+import time
+
+import streamlit as st
+from latex_segmenter import LatexSegmenter, LATEX, MATH
+from explanation_jobs import QUEUED
+
+
+class ExplanationView:
+    """Render an explanation into the page incrementally as text deltas arrive.
+
+    Prose and inline math are collected into one markdown paragraph per slot,
+    and each completed LaTeX block closes the current paragraph and is drawn
+    with ``st.latex``. Only the paragraph being written is redrawn per delta.
+    """
+
+    def __init__(self, container=None):
+        self.container = container or st.container()
+        self.segmenter = LatexSegmenter()
+        self.output = ""
+        self._paragraph = ""
+        self._slot = None
+
+    def _paragraph_slot(self):
+        if self._slot is None:
+            self._slot = self.container.empty()
+        return self._slot
+
+    def _add(self, kind, content):
+        if kind == LATEX:
+            if self._paragraph.strip():
+                self._paragraph_slot().markdown(self._paragraph.strip())
+            self._paragraph, self._slot = "", None
+            self.container.latex(content)
+        elif kind == MATH:
+            self._paragraph += f"${content}$"
+        else:
+            self._paragraph += content
+
+    def feed(self, delta, cursor=" ▌"):
+        self.output += delta
+        for kind, content in self.segmenter.feed(delta):
+            self._add(kind, content)
+        text = (self._paragraph + self.segmenter.pending_text).strip()
+        if text or cursor:
+            self._paragraph_slot().markdown(text + cursor)
+
+    def close(self):
+        """Draw the final tail and return the full explanation text"""
+        for kind, content in self.segmenter.close():
+            self._add(kind, content)
+        if self._paragraph.strip():
+            self._paragraph_slot().markdown(self._paragraph.strip())
+        elif self._slot is not None:
+            self._slot.empty()
+        return self.output
+
+
+def render_explanation(deltas):
+    """Render an iterable of text deltas and return the complete explanation"""
+    view = ExplanationView()
+    for delta in deltas:
+        view.feed(delta)
+    return view.close()
+
+
+def render_job(job):
+    """Draw an ExplanationJob's output so far; returns the full text once the job is done"""
+    if job.status == QUEUED:
+        remaining = max(0.0, job.resume_at - time.monotonic())
+        st.caption(f"Queued: you're asking quickly, starting in {remaining:.0f}s...")
+    elif not job.output and not job.done:
+        st.caption("Thinking...")
+    view = ExplanationView()
+    if job.output:
+        view.feed(job.output, cursor="" if job.done else " ▌")
+    return view.close() if job.done else None
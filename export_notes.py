@@ -1,46 +1,197 @@
-from fpdf import FPDF
 from io import BytesIO
 from datetime import datetime
+from collections import OrderedDict
+import copy
+import hashlib
+import itertools
 import os
+import tempfile
+import threading
 
-def export_notes_to_pdf(notes, filename="ExplainMate_Notes.pdf"):
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    # Add a Unicode font (DejaVuSans)
-    font_dir = os.path.join(os.path.dirname(__file__), "dejavu-fonts-ttf-2.37", "ttf")
-    font_regular = os.path.join(font_dir, "DejaVuSans.ttf")
-    font_bold = os.path.join(font_dir, "DejaVuSans-Bold.ttf")
-    if not os.path.exists(font_regular) or not os.path.exists(font_bold):
+from profiler import count, span, timed
+
+FONT_DIR = os.path.join(os.path.dirname(__file__), "dejavu-fonts-ttf-2.37", "ttf")
+FONT_FILES = {'': "DejaVuSans.ttf", 'B': "DejaVuSans-Bold.ttf"}
+PDF_CACHE_SIZE = int(os.environ.get("EXPLAINMATE_PDF_CACHE_SIZE", 128))
+EXPORT_BATCH_SIZE = 500
+
+_font_template = None
+_font_lock = threading.Lock()
+_pdf_cache = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+
+
+def _font_paths():
+    paths = {style: os.path.join(FONT_DIR, name) for style, name in FONT_FILES.items()}
+    if not all(os.path.exists(path) for path in paths.values()):
         raise FileNotFoundError(
-            f"DejaVuSans.ttf or DejaVuSans-Bold.ttf not found in {font_dir}. "
+            f"DejaVuSans.ttf or DejaVuSans-Bold.ttf not found in {FONT_DIR}. "
             "Please ensure both files exist."
         )
-    pdf.add_font('DejaVu', '', font_regular, uni=True)
-    pdf.add_font('DejaVu', 'B', font_bold, uni=True)
-    pdf.set_font('DejaVu', '', 16)
-    pdf.cell(0, 10, "ExplainMate Notes", ln=True, align='C')
-    pdf.ln(10)
+    return paths
+
+
+def _get_font_template():
+    """Parse the DejaVu fonts once per process.
+
+    Returns the parsed fonts (metrics, cmap and glyph ids) plus the raw font
+    file bytes, which each document needs its own fontTools reader for:
+    fpdf2 subsets the font tables in place when it writes a PDF.
+    """
+    global _font_template
+    with _font_lock, span("pdf.fonts"):
+        if _font_template is None:
+            from fpdf import FPDF
+            template = FPDF()
+            for style, path in _font_paths().items():
+                template.add_font('DejaVu', style, path)
+            font_bytes = {}
+            for font in template.fonts.values():
+                with open(font.ttffile, 'rb') as f:
+                    font_bytes[font.fontkey] = f.read()
+            _font_template = (template.fonts, font_bytes)
+        return _font_template
+
+
+def _clone_font(font, data, index):
+    from fontTools import ttLib
+    from fpdf.fonts import SubsetMap
+
+    clone = copy.copy(font)
+    clone.i = index
+    clone.ttfont = ttLib.TTFont(BytesIO(data), recalcTimestamp=False, lazy=True)
+    # Everything fpdf2 mutates while rendering or writing gets a fresh copy
+    clone.desc = copy.copy(font.desc)
+    clone.missing_glyphs = []
+    clone.biggest_size_pt = 0
+    clone.subset = SubsetMap(clone)
+    return clone
+
+
+def _add_fonts(pdf):
+    fonts, font_bytes = _get_font_template()
+    try:
+        for key, font in fonts.items():
+            pdf.fonts[key] = _clone_font(font, font_bytes[key], len(pdf.fonts) + 1)
+    except (AttributeError, TypeError) as e:
+        # Font internals differ in this fpdf2 version, parse the files instead
+        print(f"Falling back to loading fonts from disk: {str(e)}")
+        pdf.fonts.clear()
+        for style, path in _font_paths().items():
+            pdf.add_font('DejaVu', style, path)
+
+
+def _new_pdf(title=True):
+    # fpdf2 (and fontTools under it) is only imported once a PDF is exported
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    _add_fonts(pdf)
+    pdf.add_page()
+    if title:
+        pdf.set_font('DejaVu', '', 16)
+        pdf.cell(0, 10, "ExplainMate Notes", new_x="LMARGIN", new_y="NEXT", align='C')
+        pdf.ln(10)
+    return pdf
+
+
+def _write_note(pdf, note):
+    question = note.get('question', '')
+    content = note.get('content', '')
+    # If content is a list (bullet points), join as lines for PDF
+    if isinstance(content, list):
+        content = '\n'.join(content)
+    pdf.set_font('DejaVu', 'B', 12)
+    pdf.cell(0, 10, f"Q: {question}", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font('DejaVu', '', 10)
+    date_str = note.get('timestamp', '')
+    if date_str:
+        try:
+            date_str = datetime.fromisoformat(date_str).strftime('%Y-%m-%d %H:%M')
+        except ValueError:
+            date_str = "Invalid date format"
+    pdf.cell(0, 8, f"Date: {date_str}", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font('DejaVu', '', 12)
+    pdf.multi_cell(0, 8, content)
+    pdf.ln(5)
+
+
+@timed("pdf.render")
+def render_notes_pdf(notes, title=True):
+    """Render notes into one PDF and return its bytes"""
+    pdf = _new_pdf(title)
     for note in notes:
-        question = note.get('question', '')
-        content = note.get('content', '')
-        # If content is a list (bullet points), join as lines for PDF
-        if isinstance(content, list):
-            content = '\n'.join(content)
-        pdf.set_font('DejaVu', 'B', 12)
-        pdf.cell(0, 10, f"Q: {question}", ln=True)
-        pdf.set_font('DejaVu', '', 10)
-        date_str = note.get('timestamp', '')
-        if date_str:
+        _write_note(pdf, note)
+    return bytes(pdf.output())
+
+
+def export_notes_to_pdf(notes, filename="ExplainMate_Notes.pdf"):
+    return BytesIO(render_notes_pdf(notes))
+
+
+def _note_cache_key(note):
+    digest = hashlib.sha256()
+    for field in ('question', 'content', 'timestamp'):
+        digest.update(repr(note.get(field, '')).encode('utf-8'))
+    return note.get('id'), digest.hexdigest()
+
+
+def note_pdf(note):
+    """PDF bytes for a single note, cached by note id and content hash.
+
+    Safe to call from Streamlit's download thread; editing a note changes
+    its hash, so a stale PDF is never served.
+    """
+    key = _note_cache_key(note)
+    with _pdf_cache_lock:
+        if key in _pdf_cache:
+            _pdf_cache.move_to_end(key)
+            count("pdf_cache.hits")
+            return _pdf_cache[key]
+    count("pdf_cache.misses")
+    data = render_notes_pdf([note])
+    with _pdf_cache_lock:
+        _pdf_cache[key] = data
+        if len(_pdf_cache) > PDF_CACHE_SIZE:
+            _pdf_cache.popitem(last=False)
+    return data
+
+
+@timed("pdf.export_all")
+def export_all_notes_to_pdf(notes, output=None, batch_size=EXPORT_BATCH_SIZE):
+    """Write every note into one PDF, ``batch_size`` notes at a time.
+
+    ``notes`` may be any iterable. Each batch is rendered by fpdf2 on its
+    own and appended to the output document, so fpdf2 only ever holds one
+    batch of pages; the merged pages are kept compressed by pdfium until
+    they are written. ``output`` is a path or binary file object and
+    defaults to a new temporary file.
+
+    Returns:
+        The output path or file object, positioned at the start if it is a file
+    """
+    import pypdfium2 as pdfium
+
+    if output is None:
+        output = tempfile.TemporaryFile()
+    merged = pdfium.PdfDocument.new()
+    try:
+        notes = iter(notes)
+        first = True
+        while True:
+            batch = list(itertools.islice(notes, batch_size))
+            if not batch and not first:
+                break
+            part = pdfium.PdfDocument(render_notes_pdf(batch, title=first))
             try:
-                date_str = datetime.fromisoformat(date_str).strftime('%Y-%m-%d %H:%M')
-            except ValueError:
-                date_str = "Invalid date format"
-        pdf.cell(0, 8, f"Date: {date_str}", ln=True)
-        pdf.set_font('DejaVu', '', 12)
-        pdf.multi_cell(0, 8, content)
-        pdf.ln(5)
-    pdf_output = BytesIO()
-    pdf.output(pdf_output, 'F')
-    pdf_output.seek(0)
-    return pdf_output
+                merged.import_pages(part)
+            finally:
+                part.close()
+            first = False
+        merged.save(output)
+    finally:
+        merged.close()
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return output
@@ -1,28 +1,40 @@
 import streamlit as st
 from datetime import datetime
-from supabase_config import supabase, get_user_id
+from supabase_config import get_user_session
+from event_writer import get_event_writer, SupabaseSink
 
 def submit_feedback(message: str, is_helpful: bool) -> bool:
-    """Submit feedback to Supabase.
+    """Queue feedback for Supabase.
+    
+    The insert happens on the event writer's background thread, as the
+    signed-in user, so this returns as soon as the feedback is queued.
     
     Args:
         message: User's feedback message
         is_helpful: Whether feedback was marked helpful
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if queued, False otherwise
     """
     try:
-        user_id = get_user_id()
+        session = get_user_session()
+        if session is None or not session.access_token:
+            st.error("Please sign in again to send feedback.")
+            return False
         
         data = {
-            "user_id": user_id,
+            "user_id": session.user_id,
             "message": message,
             "is_helpful": is_helpful,
             "created_at": datetime.now().isoformat()
         }
         
-        response = supabase.table('feedback').insert(data).execute()
+        writer = get_event_writer()
+        if not writer.has_sink('feedback'):
+            writer.add_sink('feedback', SupabaseSink('feedback'))
+        if not writer.submit('feedback', SupabaseSink.event(session.access_token, data)):
+            st.error("Too much feedback is being sent right now, please try again shortly.")
+            return False
         return True
     except Exception as e:
         st.error(f"Failed to submit feedback: {str(e)}")
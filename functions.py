@@ -1,89 +1,121 @@
-import json
-import requests
-import pandas as pd
-from google.oauth2 import service_account
-import streamlit as st
-from pyairtable import Table
-
-def get_structured_explanation(prompt, style, api_key, stream_callback=None):
+import os
+from llm_client import get_client
+from model_router import DEFAULT_MODEL, get_router
+from profiler import span
+from prompts import get_prompt
+from event_writer import get_event_writer, AirtableSink
+
+OPENROUTER_URL = os.environ.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+def build_system_prompt(style):
+    """The tutor system prompt for the given explanation style (precompiled in prompts.py)"""
+    return get_prompt(style).text
+
+def build_request(prompt, style, api_key, model=DEFAULT_MODEL, stream=False, messages=None):
+    """Build the OpenRouter headers and JSON body for an explanation request.
+
+    ``messages`` replaces the single-question messages, e.g. for a follow-up with conversation context.
+    """
     headers = {
         "HTTP-Referer": "https://explainmate.streamlit.app",
         "Authorization": f"Bearer {api_key}"
     }
 
-    system_prompt = """You are an expert tutor that explains concepts clearly and precisely. 
-    When explaining mathematical concepts:
-    important = Never show your thought process, reasoning steps, or any chain-of-thought. Only output the final explanation in clear paragraphs.
-    1. Write in a discrete paragraph format, do not output your thought process
-    2. For mathematical formulas, enclose them in ```latex ... ``` tags
-    3. use separate blocks or bullet points
-    4. Keep explanations flowing naturally with formulas with latex.
-    5. Use proper LaTeX syntax for formulas
-    when explaining other concepts:
-    6. Use clear and detailed explaination with headings and points
-    7. Avoid jargon and complex terms
-    8. Provide examples and analogies to illustrate points
-    9. Use simple language and focus on intuitive understanding
-    10. Keep explanations flowing naturally with examples integrated into the text
-    11. explain in just 512 tokens"""
-
-    if style == "Technical":
-        system_prompt += "\nUse technical language and provide detailed mathematical explanations."
-    else:
-        system_prompt += "\nUse simple language and focus on intuitive understanding."
+    template = get_prompt(style)
 
     data = {
-        "model": "nvidia/llama-3.3-nemotron-super-49b-v1:free",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Explain this concept: {prompt}"}
-        ],
-        "temperature": 0.4,
-        "max_tokens": 800,
-        "stream": True if stream_callback else False
+        "model": model,
+        "messages": messages or template.messages(prompt),
+        "temperature": template.temperature,
+        "max_tokens": template.max_tokens,
+        "stream": stream
     }
+    return headers, data
+
+def _note_model(usage, model):
+    if usage is not None:
+        usage["model"] = model
+
+def stream_structured_explanation(prompt, style, api_key, model=None, timeout=60, usage=None, messages=None):
+    """Stream an explanation from OpenRouter, yielding text deltas as they arrive.
+
+    ``model`` pins one model; by default the model router picks from the
+    style's tier and falls back to the next model if one fails before its
+    first delta. ``usage``, if given, is filled in with OpenRouter's token
+    counts and the ``model`` that answered. ``messages`` is passed on to
+    ``build_request``.
+
+    Raises:
+        LLMError: If the request fails or passes its deadline
+        requests.RequestException: If the request is rejected
+    """
+    def open_stream(candidate, first_token_timeout):
+        _note_model(usage, candidate)
+        headers, data = build_request(prompt, style, api_key, candidate, stream=True, messages=messages)
+        return get_client().stream(OPENROUTER_URL, headers, data, deadline=timeout, usage=usage,
+                                   first_token_timeout=first_token_timeout)
+
+    with span("llm.stream"):
+        yield from get_router().stream(style, open_stream, model)
 
+async def astream_structured_explanation(prompt, style, api_key, client, model=None, timeout=60, usage=None):
+    """asyncio form of stream_structured_explanation using an AsyncLLMClient"""
+    def open_stream(candidate, first_token_timeout):
+        _note_model(usage, candidate)
+        headers, data = build_request(prompt, style, api_key, candidate, stream=True)
+        return client.stream(OPENROUTER_URL, headers, data, deadline=timeout, usage=usage,
+                             first_token_timeout=first_token_timeout)
+
+    with span("llm.stream"):
+        async for delta in get_router().astream(style, open_stream, model):
+            yield delta
+
+async def aget_structured_explanation(prompt, style, api_key, client, model=None, usage=None):
+    """asyncio form of get_structured_explanation without streaming; returns None on failure"""
+    async def call(candidate):
+        _note_model(usage, candidate)
+        headers, data = build_request(prompt, style, api_key, candidate)
+        return await client.complete(OPENROUTER_URL, headers, data)
+
+    try:
+        with span("llm.complete"):
+            response = await get_router().acomplete(style, call, model)
+        if usage is not None:
+            usage.update(response.get("usage") or {})
+            usage["finish_reason"] = response["choices"][0].get("finish_reason")
+        return response["choices"][0]["message"]["content"]
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return None
+
+def get_structured_explanation(prompt, style, api_key, stream_callback=None, model=None, usage=None, messages=None):
     # Streaming logic
     if stream_callback:
+        buffer = ""
         try:
-            with requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=data,
-                stream=True,
-                timeout=60
-            ) as response:
-                response.raise_for_status()
-                buffer = ""
-                for line in response.iter_lines(decode_unicode=True):
-                    if line and line.startswith('data: '):
-                        payload = line[6:]
-                        if payload.strip() == '[DONE]':
-                            break
-                        try:
-                            chunk = json.loads(payload)
-                            delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                            if delta:
-                                buffer += delta
-                                # Streamlit UI update: accumulate and update placeholder
-                                stream_callback(delta)
-                                st.experimental_rerun()  # Force Streamlit to update UI after each chunk
-                        except Exception:
-                            continue
-                return buffer if buffer else None
-        except Exception:
+            for delta in stream_structured_explanation(prompt, style, api_key, model, usage=usage, messages=messages):
+                buffer += delta
+                stream_callback(delta)
+            return buffer if buffer else None
+        except Exception as e:
+            if buffer:
+                # Part of the answer was already shown, don't silently request it again
+                print(f"Error: stream interrupted: {str(e)}")
+                return None
             # Fallback to normal (non-streaming) mode
-            pass
     # Fallback: normal response
+    def call(candidate):
+        _note_model(usage, candidate)
+        headers, data = build_request(prompt, style, api_key, candidate, messages=messages)
+        return get_client().complete(OPENROUTER_URL, headers, data)
+
     try:
-        data["stream"] = False
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        with span("llm.complete"):
+            response = get_router().complete(style, call, model)
+        if usage is not None:
+            usage.update(response.get("usage") or {})
+            usage["finish_reason"] = response["choices"][0].get("finish_reason")
+        return response["choices"][0]["message"]["content"]
     except Exception as e:
         print(f"Error: {str(e)}")
         return None
@@ -92,12 +124,17 @@ def log_feedback(airtable_api_key, base_id, table_name, query, explanation, feed
     try:
         # Only use the date part (YYYY-MM-DD) for the timestamp field
         date_only = timestamp.split("T")[0] if "T" in timestamp else timestamp
-        table = Table(airtable_api_key, base_id, table_name)
-        table.create({
+        sink = f"airtable:{base_id}/{table_name}"
+        writer = get_event_writer()
+        if not writer.has_sink(sink):
+            writer.add_sink(sink, AirtableSink(airtable_api_key, base_id, table_name))
+        # Sent in batches of 10 by the event writer's background thread
+        if not writer.submit(sink, {
             "timestamp": date_only,
             "query": query,
             "explanation": explanation,
             "feedback": feedback
-        })
+        }):
+            print("Dropped feedback event: event queue is full")
     except Exception as e:
         print(f"Error logging feedback to Airtable: {str(e)}")
@@ -1,12 +1,14 @@
-import io
-import pytesseract
-from PIL import Image
-import numpy as np
+from ocr_pipeline import extract_text
+from profiler import timed
 
+@timed("ocr.image")
 def extract_text_from_image(image):
     """
     Extract text from an image using OCR
     
+    Results are cached by image content, so reruns while the same file stays
+    uploaded do not OCR it again.
+    
     Args:
         image: Uploaded image file (from Streamlit file_uploader)
         
@@ -14,15 +16,7 @@ def extract_text_from_image(image):
         str: Extracted text from the image
     """
     try:
-        # Convert the uploaded file to PIL Image
-        img = Image.open(io.BytesIO(image.read()))
-        
-        # Convert to grayscale for better OCR
-        img = img.convert('L')
-        
-        # Perform OCR using Tesseract
-        text = pytesseract.image_to_string(img)
-        
-        return text.strip()
+        data = image.getvalue() if hasattr(image, "getvalue") else image.read()
+        return extract_text(data).strip()
     except Exception as e:
         raise Exception(f"Error processing image: {str(e)}")
@@ -0,0 +1,157 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+TEXT = "text"
+LATEX = "latex"
+MATH = "math"
+
+_OPENING = re.compile(r"```latex|\$\$|\$")
+_MEMO_SIZE = 256
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+class LatexSegmenter:
+    """Split explanation text into prose, LaTeX blocks and inline math as it streams in.
+
+    Feed chunks with ``feed()``; each call returns the segments completed by
+    that chunk. Completed segments never change, so a renderer can draw them
+    once and only redraw the pending tail. Segments are ``(kind, content)``
+    tuples where kind is ``"text"``, ``"latex"`` (```latex fences and $$...$$)
+    or ``"math"`` (inline $...$).
+
+    Parsing the first chunk is memoized by content hash, so feeding a whole
+    cached answer again on a Streamlit rerun reuses the earlier parse.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.completed = []
+        self._text_start = 0
+        self._scan = 0
+        self._waiting = None
+        self._closed = False
+
+    def feed(self, chunk):
+        if not chunk:
+            return []
+        if not self.buffer:
+            digest = hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+            with _memo_lock:
+                snapshot = _memo.get(digest)
+                if snapshot is not None:
+                    _memo.move_to_end(digest)
+            if snapshot is not None:
+                segments, self._text_start, self._scan, self._waiting = snapshot
+                self.buffer = chunk
+                self.completed = list(segments)
+                return list(segments)
+            new = self._feed(chunk)
+            with _memo_lock:
+                _memo[digest] = (tuple(self.completed), self._text_start, self._scan, self._waiting)
+                if len(_memo) > _MEMO_SIZE:
+                    _memo.popitem(last=False)
+            return new
+        return self._feed(chunk)
+
+    def _feed(self, chunk):
+        self.buffer += chunk
+        before = len(self.completed)
+        self._parse()
+        return self.completed[before:]
+
+    @property
+    def pending_text(self):
+        """The displayable part of the pending tail (prose before any unfinished formula)"""
+        end = len(self.buffer) if self._waiting is None else self._waiting
+        return self.buffer[self._text_start:end]
+
+    def close(self):
+        """Flush the pending tail as prose and return the segments it produced"""
+        if self._closed:
+            return []
+        self._closed = True
+        before = len(self.completed)
+        self._emit_text(len(self.buffer))
+        return self.completed[before:]
+
+    def segments(self):
+        """Completed segments plus the displayable pending prose"""
+        tail = self.pending_text
+        return self.completed + ([(TEXT, tail)] if tail.strip() else [])
+
+    def _emit_text(self, end):
+        text = self.buffer[self._text_start:end]
+        if text.strip():
+            self.completed.append((TEXT, text))
+
+    def _parse(self):
+        buffer = self.buffer
+        self._waiting = None
+        while True:
+            match = _OPENING.search(buffer, self._scan)
+            if match is None:
+                # Keep the last few characters in scan range, a ```latex fence may be split across chunks
+                self._scan = max(self._text_start, len(buffer) - 7)
+                return
+            start, token = match.start(), match.group(0)
+            if token == "```latex":
+                end = buffer.find("```", match.end())
+                if end == -1:
+                    self._scan = self._waiting = start
+                    return
+                self._emit_text(start)
+                self.completed.append((LATEX, buffer[match.end():end].strip()))
+                self._text_start = self._scan = end + 3
+            elif token == "$$":
+                end = buffer.find("$$", match.end())
+                if end == -1:
+                    self._scan = self._waiting = start
+                    return
+                self._emit_text(start)
+                self.completed.append((LATEX, buffer[match.end():end].strip()))
+                self._text_start = self._scan = end + 2
+            else:
+                end = self._find_inline_end(start)
+                if end is None:
+                    self._scan = self._waiting = start
+                    return
+                if end == -1:
+                    # Not math (e.g. a price), keep it as prose
+                    self._scan = start + 1
+                    continue
+                self._emit_text(start)
+                self.completed.append((MATH, buffer[start + 1:end]))
+                self._text_start = self._scan = end + 1
+
+    def _find_inline_end(self, start):
+        """Index of the closing $ for inline math at ``start``; -1 if not math, None if undecided"""
+        buffer = self.buffer
+        if start and buffer[start - 1] == "\\":
+            return -1
+        if start + 1 >= len(buffer):
+            return None
+        first = buffer[start + 1]
+        if first.isspace() or first.isdigit():
+            return -1
+        i = start + 1
+        while True:
+            dollar = buffer.find("$", i)
+            newline = buffer.find("\n", i)
+            if newline != -1 and (dollar == -1 or newline < dollar):
+                return -1
+            if dollar == -1:
+                return None
+            if not buffer[dollar - 1].isspace() and buffer[dollar - 1] != "\\":
+                return dollar
+            i = dollar + 1
+
+
+def segment_text(text):
+    """Segment a complete explanation, e.g. one served from the cache"""
+    segmenter = LatexSegmenter()
+    segmenter.feed(text)
+    segmenter.close()
+    return segmenter.completed
@@ -0,0 +1,436 @@
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when an LLM request fails after all retries or passes its deadline"""
+
+
+def iter_sse_deltas(lines, usage=None):
+    """Yield the content deltas from OpenRouter server-sent event lines.
+
+    If ``usage`` is a dict it is updated with the token counts OpenRouter
+    sends in the stream's final chunk, and with its ``finish_reason``
+    ("length" when max_tokens cut the answer off).
+    """
+    for line in lines:
+        if not line or not line.startswith('data: '):
+            # Blank separators and ": OPENROUTER PROCESSING" keep-alive comments
+            continue
+        payload = line[6:]
+        if payload.strip() == '[DONE]':
+            return
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            continue
+        if usage is not None and chunk.get("usage"):
+            usage.update(chunk["usage"])
+        choices = chunk.get("choices") or [{}]
+        if usage is not None and choices[0].get("finish_reason"):
+            usage["finish_reason"] = choices[0]["finish_reason"]
+        delta = (choices[0].get("delta") or {}).get("content")
+        if delta:
+            yield delta
+
+
+def backoff_delay(attempt, base, cap, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than a server Retry-After"""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+class LatencyTracker:
+    """Rolling window of request latencies used to pick the hedging delay"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples=20):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class _Deadline:
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        remaining = self.expires - time.monotonic()
+        if remaining <= 0:
+            raise LLMError("Request deadline exceeded")
+        return remaining
+
+    def sooner(self, seconds):
+        """A deadline ``seconds`` from now, or at this one if that is earlier"""
+        if not seconds:
+            return self
+        deadline = _Deadline(seconds)
+        deadline.expires = min(deadline.expires, self.expires)
+        return deadline
+
+
+class _OpenStream:
+    """A streaming response holding one concurrency slot until closed"""
+
+    def __init__(self, response, slots):
+        self.response = response
+        self.first = None
+        self.deltas = iter(())
+        self._slots = slots
+        self._closed = False
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.response.close()
+            self._slots.release()
+
+
+class LLMClient:
+    """Pooled, keep-alive HTTP client for chat completions.
+
+    One ``requests.Session`` is shared by every caller so TCP/TLS connections
+    are reused, and a semaphore bounds how many requests are in flight. Each
+    request has an overall deadline; 429/5xx responses and connection errors
+    are retried with jittered exponential backoff until the deadline or
+    ``max_retries`` is reached. When ``hedge_model`` is set, a request still
+    waiting after the ``hedge_percentile`` of recent latencies is raced
+    against the same request to the secondary model, and the first answer wins.
+    """
+
+    def __init__(self, pool_size=20, max_concurrency=8, timeout=60, max_retries=3,
+                 backoff_base=0.5, backoff_cap=8.0, hedge_model=None, hedge_percentile=95,
+                 hedge_min_samples=20):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_model = hedge_model
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.latency = LatencyTracker()
+        self.first_token_latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+
+    def _acquire(self, deadline):
+        if not self._slots.acquire(timeout=deadline.remaining()):
+            raise LLMError("Request deadline exceeded waiting for a free request slot")
+
+    def _post(self, url, headers, data, deadline, stream):
+        """POST with retries; returns a response whose status is known to be OK.
+
+        Each attempt holds one concurrency slot, waiting for it no longer than
+        ``deadline``; the slot is given back during backoff sleeps. The
+        returned response still holds its slot, for the caller to release.
+        """
+        attempt = 0
+        while True:
+            self._acquire(deadline)
+            try:
+                timeout = min(self.timeout, deadline.remaining())
+                try:
+                    response = self.session.post(url, headers=headers, json=data, stream=stream, timeout=timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error, retry_after = e, None
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response
+                    error = LLMError(f"HTTP {response.status_code} from {url}")
+                    retry_after = response.headers.get("Retry-After")
+                    response.close()
+            except BaseException:
+                self._slots.release()
+                raise
+            self._slots.release()
+            if attempt >= self.max_retries:
+                raise LLMError(f"Giving up after {attempt + 1} attempts: {str(error)}")
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after)
+            if delay >= deadline.remaining():
+                raise LLMError(f"Deadline too short to retry: {str(error)}")
+            attempt += 1
+            self.retries += 1
+            time.sleep(delay)
+
+    def _complete_once(self, url, headers, data, deadline):
+        start = time.monotonic()
+        response = self._post(url, headers, data, deadline, stream=False)
+        # The body has been read, so the slot is free again
+        self._slots.release()
+        self.latency.add(time.monotonic() - start)
+        return response.json()
+
+    def complete(self, url, headers, data, deadline=None):
+        """Send a non-streaming completion request and return the decoded JSON body"""
+        deadline = _Deadline(deadline or self.timeout)
+        primary = lambda: self._complete_once(url, headers, data, deadline)
+        return self._hedged(primary, self._hedge_call(self._complete_once, url, headers, data, deadline),
+                            self.latency)
+
+    def _open_stream(self, url, headers, data, deadline, usage=None, first_token_timeout=None):
+        """Open a stream and wait for its first delta, for at most ``first_token_timeout`` seconds if given"""
+        start = time.monotonic()
+        waiting = deadline.sooner(first_token_timeout)
+        response = self._post(url, headers, data, waiting, stream=True)
+        opened = _OpenStream(response, self._slots)
+        try:
+            opened.deltas = iter_sse_deltas(self._iter_lines(response, waiting), usage)
+            opened.first = next(opened.deltas, None)
+        except BaseException:
+            opened.close()
+            raise
+        # The rest of the stream only has to finish by the request's deadline
+        waiting.expires = deadline.expires
+        self.first_token_latency.add(time.monotonic() - start)
+        return opened
+
+    def _iter_lines(self, response, deadline):
+        for line in response.iter_lines(decode_unicode=True):
+            deadline.remaining()
+            yield line
+
+    def stream(self, url, headers, data, deadline=None, usage=None, first_token_timeout=None):
+        """Send a streaming request and yield content deltas as they arrive.
+
+        ``usage``, if given, is filled in with the stream's token counts.
+        With ``first_token_timeout``, LLMError is raised if no delta arrives
+        within that many seconds (the model router then tries another model).
+        """
+        deadline = _Deadline(deadline or self.timeout)
+        open_stream = lambda *args: self._open_stream(*args, usage=usage, first_token_timeout=first_token_timeout)
+        primary = lambda: open_stream(url, headers, data, deadline)
+        hedge = self._hedge_call(open_stream, url, headers, data, deadline)
+        opened = self._hedged(primary, hedge, self.first_token_latency, _OpenStream.close)
+        try:
+            if opened.first is not None:
+                yield opened.first
+            yield from opened.deltas
+        finally:
+            opened.close()
+
+    def _hedge_call(self, fn, url, headers, data, deadline):
+        if not self.hedge_model or data.get("model") == self.hedge_model:
+            return None
+        hedge_data = dict(data, model=self.hedge_model)
+        return lambda: fn(url, headers, hedge_data, deadline)
+
+    def _hedged(self, primary, hedge, tracker, discard=None):
+        """Run primary; if it is slower than the hedge percentile, race the hedge against it"""
+        delay = tracker.percentile(self.hedge_percentile, self.hedge_min_samples) if hedge else None
+        if delay is None:
+            return primary()
+
+        results = queue.Queue()
+
+        def run(fn):
+            try:
+                results.put((fn(), None))
+            except Exception as e:
+                results.put((None, e))
+
+        threading.Thread(target=run, args=(primary,), daemon=True).start()
+        outstanding = 1
+        try:
+            result, error = results.get(timeout=delay)
+            outstanding -= 1
+        except queue.Empty:
+            self.hedges += 1
+            threading.Thread(target=run, args=(hedge,), daemon=True).start()
+            outstanding += 1
+            result, error = results.get()
+            outstanding -= 1
+        while error is not None and outstanding:
+            result, error = results.get()
+            outstanding -= 1
+        if outstanding and discard is not None:
+            threading.Thread(target=self._discard_loser, args=(results, discard), daemon=True).start()
+        if error is not None:
+            raise error
+        return result
+
+    @staticmethod
+    def _discard_loser(results, discard):
+        result, error = results.get()
+        if error is None:
+            discard(result)
+
+
+class AsyncLLMClient:
+    """asyncio counterpart of ``LLMClient`` built on a shared ``httpx.AsyncClient``"""
+
+    def __init__(self, pool_size=20, max_concurrency=8, timeout=60, max_retries=3,
+                 backoff_base=0.5, backoff_cap=8.0, hedge_model=None, hedge_percentile=95,
+                 hedge_min_samples=20):
+        import httpx
+
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_model = hedge_model
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout,
+        )
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _acquire(self, deadline):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), deadline.remaining())
+        except asyncio.TimeoutError:
+            raise LLMError("Request deadline exceeded waiting for a free request slot")
+
+    async def _send(self, url, headers, data, deadline, stream):
+        """``LLMClient._post`` for httpx: the returned response holds a slot for the caller to release"""
+        attempt = 0
+        while True:
+            await self._acquire(deadline)
+            try:
+                timeout = min(self.timeout, deadline.remaining())
+                request = self.client.build_request("POST", url, headers=headers, json=data, timeout=timeout)
+                try:
+                    response = await self.client.send(request, stream=stream)
+                except (self._httpx.TransportError, self._httpx.TimeoutException) as e:
+                    error, retry_after = e, None
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        if response.is_error:
+                            await response.aclose()
+                            response.raise_for_status()
+                        return response
+                    error = LLMError(f"HTTP {response.status_code} from {url}")
+                    retry_after = response.headers.get("Retry-After")
+                    await response.aclose()
+            except BaseException:
+                self._slots.release()
+                raise
+            self._slots.release()
+            if attempt >= self.max_retries:
+                raise LLMError(f"Giving up after {attempt + 1} attempts: {str(error)}")
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after)
+            if delay >= deadline.remaining():
+                raise LLMError(f"Deadline too short to retry: {str(error)}")
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _complete_once(self, url, headers, data, deadline):
+        start = time.monotonic()
+        response = await self._send(url, headers, data, deadline, stream=False)
+        self._slots.release()
+        self.latency.add(time.monotonic() - start)
+        return response.json()
+
+    async def complete(self, url, headers, data, deadline=None):
+        """Send a non-streaming completion request and return the decoded JSON body"""
+        deadline = _Deadline(deadline or self.timeout)
+        primary = asyncio.ensure_future(self._complete_once(url, headers, data, deadline))
+        delay = self.latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+        if not self.hedge_model or data.get("model") == self.hedge_model or delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        self.hedges += 1
+        hedge = asyncio.ensure_future(self._complete_once(url, headers, dict(data, model=self.hedge_model), deadline))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    async def stream(self, url, headers, data, deadline=None, usage=None, first_token_timeout=None):
+        """Send a streaming request and yield content deltas as they arrive"""
+        deadline = _Deadline(deadline or self.timeout)
+        waiting = deadline.sooner(first_token_timeout)
+        response = await self._send(url, headers, data, waiting, stream=True)
+        try:
+            async for line in response.aiter_lines():
+                waiting.remaining()
+                for delta in iter_sse_deltas([line], usage):
+                    waiting = deadline
+                    yield delta
+                if line.strip() == "data: [DONE]":
+                    break
+        finally:
+            self._slots.release()
+            await response.aclose()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def _client_settings():
+    # Room for every call the rate limiter admits (EXPLAINMATE_MAX_CONCURRENT_LLM) plus a hedge for each, so
+    # the limiter's queue, with its timeout and "busy" answer, is what callers wait in
+    max_concurrency = os.environ.get("EXPLAINMATE_LLM_MAX_CONCURRENCY") or \
+        2 * int(os.environ.get("EXPLAINMATE_MAX_CONCURRENT_LLM", 16))
+    return {
+        "pool_size": int(os.environ.get("EXPLAINMATE_LLM_POOL_SIZE", max_concurrency)),
+        "max_concurrency": int(max_concurrency),
+        "timeout": float(os.environ.get("EXPLAINMATE_LLM_TIMEOUT", 60)),
+        "max_retries": int(os.environ.get("EXPLAINMATE_LLM_MAX_RETRIES", 3)),
+        "hedge_model": os.environ.get("EXPLAINMATE_HEDGE_MODEL") or None,
+        "hedge_percentile": float(os.environ.get("EXPLAINMATE_HEDGE_PERCENTILE", 95)),
+    }
+
+
+def get_client():
+    """Return the process-wide LLMClient configured from the environment"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = LLMClient(**_client_settings())
+        return _default_client
+
+
+def create_async_client():
+    """Create an AsyncLLMClient with the same environment settings (one per event loop)"""
+    return AsyncLLMClient(**_client_settings())
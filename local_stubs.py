@@ -0,0 +1,343 @@
+import base64
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# With EXPLAINMATE_OFFLINE=1 Supabase and Airtable are replaced by the in-memory
+# stand-ins below, so the app, the API service and the load benchmark run
+# without credentials or network access (point OPENROUTER_URL at
+# benchmarks/fake_openrouter.py for the explanations).
+OFFLINE = os.environ.get("EXPLAINMATE_OFFLINE") == "1"
+ACCESS_TOKEN_TTL = 3600
+# Columns the database sets to now() on every insert and update (see the notes migration in README.md)
+SERVER_TIMESTAMPS = {"notes": ("synced_at",)}
+
+_default_supabase = None
+_default_airtable = None
+_default_lock = threading.Lock()
+
+
+class LocalError(Exception):
+    """Raised like the Supabase/Airtable clients' errors, with an HTTP ``response.status_code``"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+def _token(user_id, expires_at):
+    def encode(value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).rstrip(b"=").decode("ascii")
+    return f"{encode({'alg': 'none'})}.{encode({'sub': user_id, 'exp': expires_at})}.local"
+
+
+class _Record:
+    """Attribute access for the auth responses, like the supabase-py models"""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class LocalSupabase:
+    """In-memory tables and users shared by every LocalSupabaseClient.
+
+    Rows get an integer ``id`` and a ``created_at`` if they have none.
+    ``latency`` seconds are slept per query to stand in for the network.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.users = {}
+        self.requests = 0
+        self._refresh_tokens = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def client(self):
+        return LocalSupabaseClient(self)
+
+    def _wait(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def _split_filters(text):
+    """Split a PostgREST logic filter list on the commas outside parentheses and quotes"""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _compare(value, operator, operand):
+    if value is None:
+        return False
+    if not isinstance(value, str):
+        operand = type(value)(operand)
+    return {"eq": value == operand, "lt": value < operand, "gt": value > operand,
+            "lte": value <= operand, "gte": value >= operand}[operator]
+
+
+def _logic_filter(text):
+    """A row predicate for PostgREST ``or``/``and`` syntax, e.g. ``a.lt.1,and(a.eq.1,id.lt.5)``"""
+    tests = []
+    for part in _split_filters(text):
+        for logic in ("or", "and"):
+            if part.startswith(f"{logic}(") and part.endswith(")"):
+                tests.append(_logic_filter(part[len(logic) + 1:-1]) if logic == "or"
+                             else _all_filter(part[len(logic) + 1:-1]))
+                break
+        else:
+            column, operator, operand = part.split(".", 2)
+            tests.append(lambda row, c=column, o=operator, v=operand.strip('"'): _compare(row.get(c), o, v))
+    return lambda row: any(test(row) for test in tests)
+
+
+def _all_filter(text):
+    tests = [_logic_filter(part) for part in _split_filters(text)]
+    return lambda row: all(test(row) for test in tests)
+
+
+class _Query:
+    """The subset of the PostgREST query builder the app uses"""
+
+    def __init__(self, store, table):
+        self.store = store
+        self.table = table
+        self.action = "select"
+        self.columns = None
+        self.values = None
+        self.filters = []
+        self.ordering = []
+        self.count = None
+
+    def select(self, columns="*"):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self.action, self.values = "insert", rows if isinstance(rows, list) else [rows]
+        return self
+
+    def update(self, values):
+        self.action, self.values = "update", values
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def or_(self, filters):
+        self.filters.append(_logic_filter(filters))
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def _stamp(self, row):
+        now = datetime.now(timezone.utc).isoformat()
+        for column in SERVER_TIMESTAMPS.get(self.table, ()):
+            row[column] = now
+
+    def _project(self, row):
+        return dict(row) if self.columns is None else {c: row.get(c) for c in self.columns}
+
+    def execute(self):
+        self.store._wait()
+        with self.store._lock:
+            rows = self.store.tables.setdefault(self.table, [])
+            if self.action == "insert":
+                data = []
+                for values in self.values:
+                    row = dict(values)
+                    row.setdefault("id", next(self.store._ids))
+                    row.setdefault("created_at", datetime.now().isoformat())
+                    self._stamp(row)
+                    rows.append(row)
+                    data.append(dict(row))
+                return _Record(data=data)
+            matched = [row for row in rows if all(f(row) for f in self.filters)]
+            if self.action == "update":
+                for row in matched:
+                    row.update(self.values)
+                    self._stamp(row)
+            elif self.action == "delete":
+                deleted = {id(row) for row in matched}
+                self.store.tables[self.table] = [row for row in rows if id(row) not in deleted]
+            else:
+                # Stable sorts, last key first, give the ORDER BY of all the keys
+                for column, desc in reversed(self.ordering):
+                    matched.sort(key=lambda row: row.get(column) or "", reverse=desc)
+                if self.count is not None:
+                    matched = matched[:self.count]
+                return _Record(data=[self._project(row) for row in matched])
+            return _Record(data=[dict(row) for row in matched])
+
+
+class _LocalAuth:
+    """Email/password sign-in issuing unsigned JWT-shaped tokens"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _session(self, user):
+        expires_at = int(time.time()) + ACCESS_TOKEN_TTL
+        refresh_token = uuid.uuid4().hex
+        with self.store._lock:
+            self.store._refresh_tokens[refresh_token] = user.id
+        session = _Record(access_token=_token(user.id, expires_at), refresh_token=refresh_token,
+                          expires_at=expires_at, user=user)
+        return _Record(user=user, session=session)
+
+    def sign_up(self, credentials):
+        self.store._wait()
+        with self.store._lock:
+            if credentials["email"] in self.store.users:
+                raise LocalError("User already registered", 422)
+            user = _Record(id=str(uuid.uuid4()), email=credentials["email"])
+            self.store.users[credentials["email"]] = (user, credentials["password"])
+        return self._session(user)
+
+    def sign_in_with_password(self, credentials):
+        self.store._wait()
+        with self.store._lock:
+            user, password = self.store.users.get(credentials["email"], (None, None))
+        if user is None or password != credentials["password"]:
+            raise LocalError("Invalid login credentials", 400)
+        return self._session(user)
+
+    def refresh_session(self, refresh_token):
+        self.store._wait()
+        with self.store._lock:
+            # Single use, like Supabase's
+            user_id = self.store._refresh_tokens.pop(refresh_token, None)
+            user = next((u for u, _ in self.store.users.values() if u.id == user_id), None)
+        if user is None:
+            raise LocalError("Invalid Refresh Token", 400)
+        return self._session(user)
+
+    def get_user(self, access_token):
+        self.store._wait()
+        try:
+            payload = access_token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        except (AttributeError, IndexError, ValueError):
+            return None
+        if claims.get("exp", 0) < time.time():
+            return None
+        user = next((u for u, _ in self.store.users.values() if u.id == claims.get("sub")), None)
+        return _Record(user=user) if user else None
+
+    def sign_out(self):
+        pass
+
+
+class LocalSupabaseClient:
+    """Stands in for a supabase-py Client: ``table()`` queries and ``auth``"""
+
+    def __init__(self, store):
+        self.store = store
+        self.auth = _LocalAuth(store)
+
+    def table(self, name):
+        return _Query(self.store, name)
+
+
+class LocalAirtable:
+    """In-memory Airtable bases; tables created on first use keep every record sent to them.
+
+    Like Airtable, more than ``max_per_second`` requests a second are
+    answered with HTTP 429 and a batch may hold at most 10 records.
+    """
+
+    def __init__(self, latency=0.0, max_per_second=5):
+        self.latency = latency
+        self.max_per_second = max_per_second
+        self.records = {}
+        self.requests = 0
+        self.rate_limited = 0
+        self._recent = []
+        self._lock = threading.Lock()
+
+    def table(self, base_id, table_name):
+        return LocalAirtableTable(self, f"{base_id}/{table_name}")
+
+
+class LocalAirtableTable:
+    """Stands in for a pyairtable Table"""
+
+    def __init__(self, airtable, name):
+        self.airtable = airtable
+        self.name = name
+
+    def batch_create(self, records):
+        airtable = self.airtable
+        if len(records) > 10:
+            raise LocalError("At most 10 records per request", 422)
+        with airtable._lock:
+            airtable.requests += 1
+            now = time.monotonic()
+            airtable._recent = [t for t in airtable._recent if now - t < 1.0]
+            if airtable.max_per_second and len(airtable._recent) >= airtable.max_per_second:
+                airtable.rate_limited += 1
+                raise LocalError("Rate limit exceeded", 429)
+            airtable._recent.append(now)
+        if airtable.latency:
+            time.sleep(airtable.latency)
+        with airtable._lock:
+            created = [{"id": f"rec{uuid.uuid4().hex[:14]}", "fields": dict(fields)} for fields in records]
+            airtable.records.setdefault(self.name, []).extend(created)
+        return created
+
+
+def get_local_supabase():
+    """Return the process-wide LocalSupabase"""
+    global _default_supabase
+    with _default_lock:
+        if _default_supabase is None:
+            _default_supabase = LocalSupabase()
+        return _default_supabase
+
+
+def get_local_airtable():
+    """Return the process-wide LocalAirtable"""
+    global _default_airtable
+    with _default_lock:
+        if _default_airtable is None:
+            _default_airtable = LocalAirtable()
+        return _default_airtable
@@ -1,19 +1,33 @@
 import streamlit as st
-import re
-import requests
-import datetime
-from functions import get_structured_explanation, log_feedback
-from notes import save_note, load_notes, delete_note, update_note
+import os
+import uuid
+from conversation import Conversation
+from explainer import cached_explanation, stream_explain, stream_follow_up
+from explanation_history import get_explanation_history
+from explanation_jobs import get_explanation_jobs
+from explanation_view import render_job
+from model_router import get_router
+from rate_limiter import RateLimitExceeded
+from notes import save_note, all_notes_loader, load_notes_page, search_notes, delete_note
 from image_processing import extract_text_from_image
-from export_notes import export_notes_to_pdf
+from document_ingest import DocumentJob, is_document
+from ocr_pipeline import content_hash
+from export_notes import note_pdf, export_all_notes_to_pdf
 from auth import check_auth, logout
+from debug_panel import render_debug_panel
+from app_config import get_config
+import profiler
+import api_client
 
 # --- CONFIG ---
 st.set_page_config(page_title="ExplainMate AI", layout="wide")
-openrouter_api_key = st.secrets["OPENROUTER_API_KEY"] if "OPENROUTER_API_KEY" in st.secrets else "your-api-key-here"
-airtable_api_key = st.secrets["AIRTABLE_API_KEY"]
-airtable_base_id = st.secrets["AIRTABLE_BASE_ID"]
-airtable_table_name = st.secrets["AIRTABLE_TABLE_NAME"]
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex[:8])
+profiler.start_rerun(session_id)
+config = get_config()
+openrouter_api_key = config.openrouter_api_key or "your-api-key-here"
+airtable_api_key = config.airtable_api_key
+airtable_base_id = config.airtable_base_id
+airtable_table_name = config.airtable_table_name
 
 # Force logout on new session to prevent session leakage
 if 'user' not in st.session_state:
@@ -30,12 +44,19 @@ with col_user:
 with col_btn:
     if st.button("📝 View Notes"):
         st.session_state["show_notes_window"] = True
+    if st.button("🕘 History"):
+        st.session_state["show_history_window"] = True
     logout()
 
 # Show notes window if requested
 if st.session_state.get("show_notes_window", False):
     st.title("📝 Saved Notes")
-    notes = load_notes()
+    notes_query = st.text_input("🔍 Search notes", key="notes_query")
+    if notes_query.strip():
+        notes, has_more_notes = search_notes(notes_query), False
+    else:
+        notes_shown = st.session_state.setdefault("notes_shown", 20)
+        notes, has_more_notes = load_notes_page(notes_shown)
     if notes:
         for note in notes:
             with st.expander(f"📌 {note['content'][:50]}..."):
@@ -46,17 +67,64 @@ if st.session_state.get("show_notes_window", False):
                         if delete_note(note['id']):
                             st.rerun()
                 with col2:
-                    pdf_bytes = export_notes_to_pdf([note])
+                    # The PDF is only rendered when the button is clicked
                     st.download_button(
                         label="Download PDF",
-                        data=pdf_bytes,
+                        data=lambda note=note: note_pdf(note),
                         file_name=f"note_{note['id']}.pdf",
                         mime="application/pdf",
                         key=f"pdf_{note['id']}")
+        if has_more_notes and st.button("Load older notes"):
+            st.session_state["notes_shown"] = notes_shown + 20
+            st.rerun()
+        if not st.session_state.get("export_all_ready", False):
+            if st.button("Export all notes"):
+                st.session_state["export_all_ready"] = True
+                st.rerun()
+        else:
+            # Fetched when the download is clicked, not on every rerun while the button is shown
+            load_all_notes = all_notes_loader()
+            st.download_button(
+                label="Download all notes as PDF",
+                data=lambda: export_all_notes_to_pdf(load_all_notes()),
+                file_name="ExplainMate_Notes.pdf",
+                mime="application/pdf",
+                key="pdf_all")
+    elif notes_query.strip():
+        st.info("No notes match your search")
     else:
         st.info("No saved notes yet")
     if st.button("Close"):
         st.session_state["show_notes_window"] = False
+        st.session_state["export_all_ready"] = False
+        st.rerun()
+
+# Show the explanation history if requested; entries come from storage and are never regenerated
+if st.session_state.get("show_history_window", False):
+    st.title("🕘 Explanation History")
+    history_shown = st.session_state.setdefault("history_shown", 20)
+    if api_client.API_URL:
+        history, has_more_history = api_client.load_history(st.session_state["session"].access_token, history_shown)
+    else:
+        history, next_cursor = get_explanation_history().page(st.session_state["user"].id, history_shown)
+        has_more_history = next_cursor is not None
+    if history:
+        for entry in history:
+            with st.expander(f"🕘 {entry['prompt'][:50]}... ({entry['style']})"):
+                st.markdown(entry["text"] or "")
+                if st.button("🗑️ Delete", key=f"delete_history_{entry['id']}"):
+                    if api_client.API_URL:
+                        api_client.delete_history_entry(entry["id"], st.session_state["session"].access_token)
+                    else:
+                        get_explanation_history().delete(st.session_state["user"].id, entry["id"])
+                    st.rerun()
+        if has_more_history and st.button("Load older explanations"):
+            st.session_state["history_shown"] = history_shown + 20
+            st.rerun()
+    else:
+        st.info("No explanations yet")
+    if st.button("Close", key="close_history"):
+        st.session_state["show_history_window"] = False
         st.rerun()
 
 if not st.session_state.get("main_content_hidden", False):
@@ -91,10 +159,51 @@ if not st.session_state.get("main_content_hidden", False):
             st.session_state.input_reset = False
 
     with tab2:
-        uploaded_image = st.file_uploader("Upload handwritten notes or image", type=["png", "jpg", "jpeg"])
-        if uploaded_image:
+        uploaded_image = st.file_uploader(
+            "Upload handwritten notes, an image or a scanned document",
+            type=["png", "jpg", "jpeg", "pdf", "tif", "tiff"]
+        )
+        if uploaded_image and is_document(uploaded_image.name):
+            # Multi-page documents are OCR'd in the background, page by page
+            document_data = uploaded_image.getvalue()
+            job = st.session_state.get("document_job")
+            if job is None or job.key != content_hash(document_data):
+                job = st.session_state["document_job"] = DocumentJob(document_data, uploaded_image.name)
+            st.session_state["document_pages_seen"] = len(job.pages)
+
+            @st.fragment(run_every=1.0)
+            def document_progress():
+                total = job.total or 0
+                st.progress(len(job.pages) / total if total else 0.0,
+                            text=f"Reading {job.filename}: {len(job.pages)} of {total or '?'} pages")
+                if len(job.pages) != st.session_state.get("document_pages_seen") or job.done:
+                    st.rerun()
+
+            if not job.done:
+                document_progress()
+            if job.error:
+                st.error(f"Error processing document: {str(job.error)}")
+            elif job.pages:
+                pages = sorted(job.pages) + ["all"]
+                page = st.selectbox(
+                    "Page to explain", pages,
+                    format_func=lambda p: "All finished pages" if p == "all" else f"Page {p}"
+                )
+                page_text = job.text() if page == "all" else job.pages[page]
+                if page_text:
+                    query = st.text_area("Extracted text (edit if needed):", value=page_text)
+                else:
+                    st.warning("Couldn't extract text from this page. Please try another page or enter text manually.")
+            elif job.done:
+                st.warning("Couldn't extract text from this document. Please try another file or enter text manually.")
+        elif uploaded_image:
             try:
-                extracted_text = extract_text_from_image(uploaded_image)
+                if api_client.API_URL:
+                    extracted_text = api_client.extract_text(
+                        uploaded_image.getvalue(), uploaded_image.name,
+                        st.session_state["session"].access_token).strip()
+                else:
+                    extracted_text = extract_text_from_image(uploaded_image)
                 if extracted_text:
                     query = st.text_area("Extracted text (edit if needed):", value=extracted_text)
                 else:
@@ -104,38 +213,79 @@ if not st.session_state.get("main_content_hidden", False):
 
     mode = st.selectbox("Choose explanation type", ["Simple", "Technical"])
 
-    # --- Cache Wrapper ---
-    @st.cache_data(show_spinner=False)
-    def cached_explanation(prompt, style, api_key):
-        return get_structured_explanation(prompt, style, api_key)
-
     # --- Display Output ---
+    explanation_jobs = get_explanation_jobs()
     if query:
-        with st.spinner("Thinking..."):
-            try:
-                output = cached_explanation(query, mode, openrouter_api_key)
+        try:
+            # The explanation is generated on a worker thread; the page polls it instead of waiting
+            if api_client.API_URL:
+                # Thin client: the API service generates (and caches) the explanation
+                access_token = st.session_state["session"].access_token
+                make_stream = lambda cancel: api_client.stream_explain(query, mode, access_token)
+                lookup = None
+            else:
+                user_id = st.session_state["user"].id
+                make_stream = lambda cancel: stream_explain(query, mode, openrouter_api_key, user_id=user_id,
+                                                            cancel=cancel)
+                lookup = lambda: cached_explanation(query, mode, user_id=user_id)
+            job = explanation_jobs.submit(session_id, (query, mode), make_stream, lookup,
+                                          restart=st.session_state.pop("retry_explanation", False))
+
+            @st.fragment(run_every=0.3)
+            def explanation_progress():
+                with profiler.span("render.explanation"):
+                    render_job(job)
+                if job.done:
+                    st.rerun()
+
+            if not job.done:
+                # Notes and feedback are shown once the explanation has finished
+                explanation_progress()
+            elif job.error is not None:
+                raise job.error
+            else:
+                with profiler.span("render.explanation"):
+                    output = render_job(job)
                 if not output:
                     st.error("Could not generate explanation. Please try again.")
                     with st.expander("Debug Information"):
-                        st.info("• API Key: ✓ Found in secrets.toml\n• Model: gryphe/mythomist-7b:free\n• Status: Failed to get response")
+                        st.info(f"• API Key: ✓ Found in secrets.toml\n• Models: {', '.join(get_router().tier(mode))}"
+                                "\n• Status: Failed to get response")
                 else:
-                    # Process the text with inline LaTeX
-                    current_text = ""
-                    latex_pattern = r'```latex\s*([\s\S]*?)```'
-                    last_end = 0
-                    
-                    for match in re.finditer(latex_pattern, output):
-                        current_text += output[last_end:match.start()].strip()
-                        if current_text:
-                            st.write(current_text)
-                            current_text = ""
-                        latex_content = match.group(1).strip()
-                        st.latex(latex_content)
-                        last_end = match.end()
-                    
-                    remaining_text = output[last_end:].strip()
-                    if remaining_text:
-                        st.write(remaining_text)
+                    # Follow-up questions, answered with the conversation so far (in-process only)
+                    if not api_client.API_URL:
+                        conversation = st.session_state.get("conversation")
+                        if conversation is None or conversation.key != (query, mode):
+                            conversation = st.session_state["conversation"] = Conversation(mode, key=(query, mode))
+                            conversation.add(query, output)
+                        for follow_up_question, follow_up_answer in conversation.transcript[1:]:
+                            st.markdown(f"**{follow_up_question}**")
+                            st.markdown(follow_up_answer)
+                        asked = len(conversation.transcript)
+                        # A new input for each question, so it is empty once the last one is answered
+                        follow_up = st.text_input("Ask a follow-up question", key=f"follow_up_{asked}")
+                        if follow_up.strip():
+                            follow_up_job = explanation_jobs.submit(
+                                f"{session_id}:follow-up", (query, mode, asked, follow_up.strip()),
+                                lambda cancel: stream_follow_up(conversation, follow_up.strip(), openrouter_api_key,
+                                                                user_id=user_id, cancel=cancel))
+
+                            @st.fragment(run_every=0.3)
+                            def follow_up_progress():
+                                render_job(follow_up_job)
+                                if follow_up_job.done:
+                                    st.rerun()
+
+                            if not follow_up_job.done:
+                                follow_up_progress()
+                            elif isinstance(follow_up_job.error, RateLimitExceeded):
+                                st.warning(str(follow_up_job.error))
+                            elif follow_up_job.error is not None:
+                                st.error(f"Could not answer the follow-up: {str(follow_up_job.error)}")
+                            elif len(conversation.transcript) > asked:
+                                st.rerun()
+                            else:
+                                st.error("Could not answer the follow-up. Please try again.")
 
                     # Notes section
                     st.markdown("---")
@@ -163,8 +313,24 @@ if not st.session_state.get("main_content_hidden", False):
                     from feedback import feedback_component
                     feedback_component()
 
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+        except RateLimitExceeded as e:
+            # Cached answers are never limited, so earlier questions still work
+            st.warning(f"{str(e)}. Questions you've asked before are still answered instantly.")
+            if st.button("Try again"):
+                st.session_state["retry_explanation"] = True
+                st.rerun()
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            if st.button("Try again", key="retry_after_error"):
+                st.session_state["retry_explanation"] = True
+                st.rerun()
+    else:
+        explanation_jobs.cancel(session_id)
+        explanation_jobs.cancel(f"{session_id}:follow-up")
 
     st.markdown("---")
     st.markdown("Made with ❤️ by Tejas · ")
+
+if os.environ.get("EXPLAINMATE_DEBUG_PANEL") == "1":
+    render_debug_panel(session_id)
+profiler.end_rerun()
@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from profiler import count, record
+
+DEFAULT_MODEL = "nvidia/llama-3.3-nemotron-super-49b-v1:free"
+# Models tried in order for each explanation style; the first one names the cached answers
+DEFAULT_TIERS = {
+    "Simple": [
+        DEFAULT_MODEL,
+        "mistralai/mistral-small-3.1-24b-instruct:free",
+        "meta-llama/llama-3.2-3b-instruct:free",
+    ],
+    # Technical answers are longer and denser in math, so the larger models lead and the default follows
+    "Technical": [
+        "meta-llama/llama-3.3-70b-instruct:free",
+        "qwen/qwen-2.5-72b-instruct:free",
+        DEFAULT_MODEL,
+    ],
+}
+# Seconds a model gets to produce its first delta (or answer) before the next model is tried
+FIRST_TOKEN_TIMEOUT = float(os.environ.get("EXPLAINMATE_MODEL_TIMEOUT", 20))
+# A model is demoted behind the rest of its tier while its p95 is above this or its error rate above that
+SLOW_P95 = float(os.environ.get("EXPLAINMATE_MODEL_SLOW_P95", 15))
+MAX_ERROR_RATE = float(os.environ.get("EXPLAINMATE_MODEL_MAX_ERROR_RATE", 0.5))
+# Only attempts from the last WINDOW seconds count, so a demoted model is retried once it ages out
+WINDOW = 300
+MIN_SAMPLES = 5
+MAX_SAMPLES = 200
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+class ModelStats:
+    """Rolling latencies and outcomes of one model's recent attempts"""
+
+    def __init__(self, window=WINDOW, max_samples=MAX_SAMPLES):
+        self.window = window
+        self._samples = deque(maxlen=max_samples)
+
+    def add(self, now, seconds, ok):
+        self._samples.append((now, seconds, ok))
+
+    def _recent(self, now):
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def summary(self, now):
+        samples = self._recent(now)
+        latencies = sorted(seconds for _, seconds, _ in samples)
+        errors = sum(not ok for _, _, ok in samples)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] if latencies else None
+
+        return {
+            "requests": len(samples),
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "error_rate": errors / len(samples) if samples else 0.0,
+        }
+
+
+class ModelRouter:
+    """Picks the OpenRouter model for each request and falls back along the style's tier.
+
+    ``tiers`` maps an explanation style to its models in order of preference.
+    Each attempt's latency (time to the first delta for streams, to the answer
+    otherwise) and outcome is kept per model. Models whose recent p95 is above
+    ``slow_p95`` or whose error rate is above ``max_error_rate`` are moved
+    behind the healthy ones until their bad samples age out of the window.
+    A model that fails, or is silent for ``first_token_timeout`` seconds,
+    before its first delta is replaced by the next one in the order.
+    """
+
+    def __init__(self, tiers=None, first_token_timeout=FIRST_TOKEN_TIMEOUT, slow_p95=SLOW_P95,
+                 max_error_rate=MAX_ERROR_RATE, window=WINDOW, min_samples=MIN_SAMPLES, trace_path=None,
+                 clock=time.monotonic):
+        self.tiers = {style: list(models) for style, models in (tiers or DEFAULT_TIERS).items()}
+        self.first_token_timeout = first_token_timeout
+        self.slow_p95 = slow_p95
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.trace_path = trace_path
+        self.clock = clock
+        self.fallbacks = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def tier(self, style):
+        return self.tiers.get(style) or self.tiers.get("Simple") or [DEFAULT_MODEL]
+
+    def primary(self, style):
+        """The model whose name keys cached answers for the style, whichever model wrote them"""
+        return self.tier(style)[0]
+
+    def _healthy(self, summary):
+        if summary["requests"] < self.min_samples:
+            return True
+        return summary["error_rate"] <= self.max_error_rate and summary["p95"] <= self.slow_p95
+
+    def candidates(self, style, model=None):
+        """Models to try for one request, best first; ``model`` pins a single model"""
+        if model:
+            return [model]
+        now = self.clock()
+        with self._lock:
+            summaries = [(name, self._stats_for(name).summary(now)) for name in self.tier(style)]
+        healthy = [name for name, summary in summaries if self._healthy(summary)]
+        degraded = sorted((s["error_rate"], s["p95"] or 0.0, position, name)
+                          for position, (name, s) in enumerate(summaries) if name not in healthy)
+        return healthy + [name for *_, name in degraded]
+
+    def _stats_for(self, model):
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats(self.window)
+        return stats
+
+    def record(self, model, seconds, ok, style=None):
+        now = self.clock()
+        with self._lock:
+            self._stats_for(model).add(now, seconds, ok)
+        if ok:
+            record(f"model.{model}", seconds)
+        else:
+            count(f"model.{model}.failed")
+        if self.trace_path:
+            self._append_trace({"time": time.time(), "model": model, "style": style,
+                                "seconds": round(seconds, 4), "ok": ok})
+
+    def _append_trace(self, entry):
+        try:
+            with open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing model trace: {str(e)}")
+
+    def _failed(self, model, error, last):
+        if last:
+            print(f"Model {model} failed: {str(error)}")
+            return
+        self.fallbacks += 1
+        count("model.fallbacks")
+        print(f"Model {model} failed, trying the next one: {str(error)}")
+
+    def timeout_for(self, models, index):
+        """First-token timeout for streaming attempt ``index``; the last model gets the request's whole deadline"""
+        return self.first_token_timeout if index < len(models) - 1 else None
+
+    def complete(self, style, call, model=None):
+        """Return ``call(model)`` from the first model that answers.
+
+        A non-streaming answer arrives all at once, so it cannot be judged by
+        its first token: each call gets the client's full completion timeout
+        and the next model is only tried after a failure.
+        """
+        models = self.candidates(style, model)
+        error = None
+        for index, candidate in enumerate(models):
+            start = self.clock()
+            try:
+                result = call(candidate)
+            except Exception as e:
+                self.record(candidate, self.clock() - start, False, style)
+                self._failed(candidate, e, index == len(models) - 1)
+                error = e
+                continue
+            self.record(candidate, self.clock() - start, True, style)
+            return result
+        raise error
+
+    def stream(self, style, open_stream, model=None):
+        """Yield the deltas of ``open_stream(model, first_token_timeout)`` from the first model that streams.
+
+        Models are only switched before the first delta; a stream that fails
+        part-way raises, since its start has already been shown.
+        """
+        models = self.candidates(style, model)
+        error = None
+        for index, candidate in enumerate(models):
+            start = self.clock()
+            deltas = open_stream(candidate, self.timeout_for(models, index))
+            try:
+                first = next(deltas)
+            except Exception as e:
+                if isinstance(e, StopIteration):
+                    e = ValueError(f"{candidate} returned an empty answer")
+                self.record(candidate, self.clock() - start, False, style)
+                self._failed(candidate, e, index == len(models) - 1)
+                error = e
+                continue
+            self.record(candidate, self.clock() - start, True, style)
+            yield first
+            yield from deltas
+            return
+        raise error
+
+    async def astream(self, style, open_stream, model=None):
+        """``stream`` for async iterators"""
+        models = self.candidates(style, model)
+        error = None
+        for index, candidate in enumerate(models):
+            start = self.clock()
+            deltas = open_stream(candidate, self.timeout_for(models, index))
+            try:
+                first = await deltas.__anext__()
+            except Exception as e:
+                if isinstance(e, StopAsyncIteration):
+                    e = ValueError(f"{candidate} returned an empty answer")
+                self.record(candidate, self.clock() - start, False, style)
+                self._failed(candidate, e, index == len(models) - 1)
+                error = e
+                continue
+            self.record(candidate, self.clock() - start, True, style)
+            yield first
+            async for delta in deltas:
+                yield delta
+            return
+        raise error
+
+    async def acomplete(self, style, call, model=None):
+        """``complete`` for coroutines"""
+        models = self.candidates(style, model)
+        error = None
+        for index, candidate in enumerate(models):
+            start = self.clock()
+            try:
+                result = await call(candidate)
+            except Exception as e:
+                self.record(candidate, self.clock() - start, False, style)
+                self._failed(candidate, e, index == len(models) - 1)
+                error = e
+                continue
+            self.record(candidate, self.clock() - start, True, style)
+            return result
+        raise error
+
+    def stats(self):
+        """Per-model rolling latency and error rate, for the debug panel and /metrics"""
+        now = self.clock()
+        with self._lock:
+            models = {name: stats.summary(now) for name, stats in self._stats.items()}
+        for summary in models.values():
+            summary["healthy"] = self._healthy(summary)
+        return models
+
+
+def _tiers_from_env():
+    tiers = {}
+    for style, models in DEFAULT_TIERS.items():
+        configured = os.environ.get(f"EXPLAINMATE_MODELS_{style.upper()}")
+        tiers[style] = [m.strip() for m in configured.split(",") if m.strip()] if configured else models
+    return tiers
+
+
+def get_router():
+    """Return the process-wide ModelRouter, with tiers from ``EXPLAINMATE_MODELS_SIMPLE``/``_TECHNICAL``"""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = ModelRouter(_tiers_from_env(), trace_path=os.environ.get("EXPLAINMATE_MODEL_TRACE"))
+        return _default_router
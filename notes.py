@@ -1,13 +1,18 @@
-from datetime import datetime
-from supabase_config import supabase, get_user_id, refresh_session
+import notes_store
+from supabase_config import get_user_session, refresh_session
+from session_manager import is_auth_error
+
+# Streamlit-side notes functions: the notes_store operations for the current
+# browser session's user
+
 
 def handle_auth_error(func):
-    """Decorator to handle authentication errors and session refresh"""
+    """Decorator to refresh the session once if Supabase rejects the access token"""
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            if "JWT" in str(e) or "authentication" in str(e).lower():
+            if is_auth_error(e):
                 # Try to refresh the session
                 if refresh_session():
                     # Retry the operation
@@ -18,77 +23,63 @@ def handle_auth_error(func):
 @handle_auth_error
 def save_note(question, note_content):
     """Save a note with the given question and content"""
-    try:
-        user_id = get_user_id()
-        if not user_id:
-            raise Exception("User not authenticated")
-            
-        note_entry = {
-            "user_id": user_id,
-            "created_at": datetime.now().isoformat(),
-            "content": note_content.strip()
-        }
-        
-        result = supabase.table('notes').insert(note_entry).execute()
-        return len(result.data) > 0
-    except Exception as e:
-        print(f"Error saving note: {str(e)}")
+    session = get_user_session()
+    if session is None:
+        print("Error saving note: User not authenticated")
         return False
+    return notes_store.save_note(session, question, note_content)
 
 @handle_auth_error
 def load_notes():
     """Load all saved notes for the current user"""
-    try:
-        user_id = get_user_id()
-        if not user_id:
-            return []
-            
-        result = supabase.table('notes')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .execute()
-            
-        return result.data if result.data else []
-    except Exception as e:
-        print(f"Error loading notes: {str(e)}")
+    session = get_user_session()
+    if session is None:
         return []
+    return notes_store.load_notes(session)
+
+def all_notes_loader():
+    """A callable loading all of the current user's notes later, e.g. when a deferred download is clicked.
+
+    The session is taken now, since the callable may run outside the script
+    thread where the browser session is not available.
+    """
+    session = get_user_session()
+    return lambda: notes_store.load_notes(session) if session is not None else []
+
+@handle_auth_error
+def load_notes_page(count):
+    """Load the newest `count` notes for the current user.
+
+    Returns:
+        tuple: (notes, has_more) where has_more is True if older notes exist
+    """
+    session = get_user_session()
+    if session is None:
+        return [], False
+    return notes_store.load_notes_page(session, count)
 
 @handle_auth_error
 def update_note(note_id, new_content):
     """Update a note's content by its ID (as bullet points)"""
-    try:
-        user_id = get_user_id()
-        if not user_id:
-            raise Exception("User not authenticated")
-            
-        points = [line.strip() for line in new_content.split('\n') if line.strip()]
-        result = supabase.table('notes')\
-            .update({"content": points})\
-            .eq('id', note_id)\
-            .eq('user_id', user_id)\
-            .execute()
-            
-        return len(result.data) > 0
-    except Exception as e:
-        print(f"Error updating note: {str(e)}")
+    session = get_user_session()
+    if session is None:
+        print("Error updating note: User not authenticated")
         return False
+    return notes_store.update_note(session, note_id, new_content)
 
 @handle_auth_error
 def delete_note(note_id):
     """Delete a note by its ID"""
-    try:
-        user_id = get_user_id()
-        if not user_id:
-            raise Exception("User not authenticated")
-            
-        result = supabase.table('notes')\
-            .delete()\
-            .eq('id', note_id)\
-            .eq('user_id', user_id)\
-            .execute()
-            
-        return len(result.data) > 0
-    except Exception as e:
-        print(f"Error deleting note: {str(e)}")
-        return False
\ No newline at end of file
+    session = get_user_session()
+    if session is None:
+        print("Error deleting note: User not authenticated")
+        return False
+    return notes_store.delete_note(session, note_id)
+
+@handle_auth_error
+def search_notes(query, limit=20):
+    """Search the current user's notes, best matches first"""
+    session = get_user_session()
+    if session is None:
+        return []
+    return notes_store.search_notes(session, query, limit)
@@ -0,0 +1,510 @@
+"""Local-first notes: a SQLite replica of each user's notes, synced to Supabase in the background.
+
+Usage:
+    python notes_replica.py import saved_notes.json --user USER_ID [--push]
+    python notes_replica.py status
+
+``import`` loads the legacy ``saved_notes.json`` (``question``, ``timestamp``
+and a list ``content``) into the replica for one user. The notes are pushed
+the next time the app syncs that user, or right away with ``--push``, which
+uses the key in SUPABASE_KEY (it must be allowed to write that user's notes).
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from llm_client import backoff_delay
+from notes_search import get_search_index
+from profiler import count
+
+# With EXPLAINMATE_NOTES_REPLICA=1, notes_store reads and writes the replica and NotesSync mirrors it
+ENABLED = os.environ.get("EXPLAINMATE_NOTES_REPLICA") == "1"
+DEFAULT_REPLICA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "notes_replica.db")
+SYNC_INTERVAL = float(os.environ.get("EXPLAINMATE_NOTES_SYNC_INTERVAL", 10))
+PUSH_BATCH = 50
+# Remote deletions don't show up in the delta pull; every this many pulls the remote ids are compared
+RECONCILE_EVERY = 10
+# A pushed change is claimed for this long, so two processes sharing the file don't both push it
+CLAIM_SECONDS = 60
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 300.0
+REMOTE_COLUMNS = "id, created_at, updated_at, synced_at, content"
+# Pulls re-read this many seconds before the cursor, for writes whose transaction committed late
+PULL_OVERLAP = 5.0
+
+_default_sync = None
+_default_sync_lock = threading.Lock()
+
+
+def now_timestamp():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_timestamp(value):
+    """Aware datetime for an ISO timestamp; naive ones (as saved by older versions) are taken as UTC"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class NotesReplica:
+    """SQLite copy of users' notes plus an outbox of changes not yet in Supabase.
+
+    Local notes have their own integer ids, which the app uses; ``remote_id``
+    is the Supabase id once the note has been pushed. A change puts the note
+    in the outbox (one entry per note, so repeated edits are pushed once),
+    and deletes leave a tombstone until the delete has been pushed.
+    """
+
+    def __init__(self, path=DEFAULT_REPLICA_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS notes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    remote_id,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id, created_at)")
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_notes_remote ON notes(user_id, remote_id)")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS outbox (
+                    note_id INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    queued_at REAL NOT NULL,
+                    claimed_until REAL NOT NULL DEFAULT 0
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sync_state (
+                    user_id TEXT PRIMARY KEY,
+                    cursor TEXT,
+                    pulls INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+
+    @staticmethod
+    def _note(row):
+        note_id, created_at, content = row
+        return {"id": note_id, "created_at": created_at, "content": json.loads(content)}
+
+    def _enqueue(self, user_id, note_id):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO outbox (note_id, user_id, queued_at) VALUES (?, ?, ?)",
+            (note_id, user_id, time.time()))
+
+    def list_notes(self, user_id, limit=None):
+        """The user's notes, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, created_at, content FROM notes WHERE user_id = ? AND NOT deleted "
+                "ORDER BY created_at DESC, id DESC LIMIT ?", (user_id, -1 if limit is None else limit)).fetchall()
+        return [self._note(row) for row in rows]
+
+    def get_page(self, user_id, count):
+        """Return (the newest ``count`` notes, whether older notes exist)"""
+        notes = self.list_notes(user_id, count + 1)
+        return notes[:count], len(notes) > count
+
+    def add(self, user_id, content, created_at=None):
+        created_at = created_at or datetime.now().isoformat()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO notes (user_id, created_at, updated_at, content) VALUES (?, ?, ?, ?)",
+                (user_id, created_at, now_timestamp(), json.dumps(content, ensure_ascii=False)))
+            self._enqueue(user_id, cursor.lastrowid)
+        return {"id": cursor.lastrowid, "created_at": created_at, "content": content}
+
+    def update(self, user_id, note_id, content):
+        with self._lock, self._conn:
+            changed = self._conn.execute(
+                "UPDATE notes SET content = ?, updated_at = ? WHERE id = ? AND user_id = ? AND NOT deleted",
+                (json.dumps(content, ensure_ascii=False), now_timestamp(), note_id, user_id)).rowcount
+            if changed:
+                self._enqueue(user_id, note_id)
+        return bool(changed)
+
+    def delete(self, user_id, note_id):
+        with self._lock, self._conn:
+            changed = self._conn.execute(
+                "UPDATE notes SET deleted = 1, updated_at = ? WHERE id = ? AND user_id = ? AND NOT deleted",
+                (now_timestamp(), note_id, user_id)).rowcount
+            if changed:
+                self._enqueue(user_id, note_id)
+        return bool(changed)
+
+    def claim(self, user_id, limit=PUSH_BATCH):
+        """Claim up to ``limit`` of the user's queued changes for pushing"""
+        now = time.time()
+        with self._lock, self._conn:
+            # Taking the write lock before reading keeps another process from claiming the same changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT n.id, n.remote_id, n.created_at, n.updated_at, n.content, n.deleted, o.queued_at "
+                "FROM outbox o JOIN notes n ON n.id = o.note_id "
+                "WHERE o.user_id = ? AND o.claimed_until < ? ORDER BY o.queued_at LIMIT ?",
+                (user_id, now, limit)).fetchall()
+            self._conn.executemany("UPDATE outbox SET claimed_until = ? WHERE note_id = ?",
+                                   [(now + CLAIM_SECONDS, row[0]) for row in rows])
+        columns = ("id", "remote_id", "created_at", "updated_at", "content", "deleted", "queued_at")
+        changes = [dict(zip(columns, row)) for row in rows]
+        for change in changes:
+            change["content"] = json.loads(change["content"])
+        return changes
+
+    def mark_pushed(self, change, remote_id=None):
+        """Record a pushed change; a note changed again meanwhile stays queued"""
+        with self._lock, self._conn:
+            if remote_id is not None:
+                self._conn.execute("UPDATE notes SET remote_id = ? WHERE id = ?", (remote_id, change["id"]))
+            removed = self._conn.execute("DELETE FROM outbox WHERE note_id = ? AND queued_at = ?",
+                                         (change["id"], change["queued_at"])).rowcount
+            if removed and change["deleted"]:
+                self._conn.execute("DELETE FROM notes WHERE id = ?", (change["id"],))
+            elif not removed:
+                self._conn.execute("UPDATE outbox SET claimed_until = 0 WHERE note_id = ?", (change["id"],))
+
+    def release(self, change):
+        """Put back a change whose push failed"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outbox SET claimed_until = 0 WHERE note_id = ?", (change["id"],))
+
+    def apply_remote(self, user_id, rows):
+        """Merge notes pulled from Supabase, last write wins.
+
+        A note with a queued local change keeps it unless the remote copy
+        was written later, in which case the local change is dropped.
+        Returns the ids of local notes that changed.
+        """
+        changed = []
+        with self._lock, self._conn:
+            for row in rows:
+                remote_updated = row.get("updated_at") or row.get("created_at")
+                content = json.dumps(row.get("content"), ensure_ascii=False)
+                local = self._conn.execute(
+                    "SELECT n.id, n.updated_at, n.content, o.note_id IS NOT NULL FROM notes n "
+                    "LEFT JOIN outbox o ON o.note_id = n.id WHERE n.user_id = ? AND n.remote_id = ?",
+                    (user_id, row["id"])).fetchone()
+                if local is None:
+                    cursor = self._conn.execute(
+                        "INSERT INTO notes (user_id, remote_id, created_at, updated_at, content) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, row["id"], row.get("created_at") or remote_updated, remote_updated, content))
+                    changed.append(cursor.lastrowid)
+                    continue
+                note_id, local_updated, local_content, pending = local
+                if pending and _parse_timestamp(local_updated) >= _parse_timestamp(remote_updated):
+                    continue
+                if pending:
+                    self._conn.execute("DELETE FROM outbox WHERE note_id = ?", (note_id,))
+                    count("notes_sync.conflicts")
+                if local_content != content or pending:
+                    self._conn.execute(
+                        "UPDATE notes SET content = ?, updated_at = ?, deleted = 0 WHERE id = ?",
+                        (content, remote_updated, note_id))
+                    changed.append(note_id)
+        return changed
+
+    def reconcile(self, user_id, remote_ids):
+        """Drop synced notes that no longer exist in Supabase; returns how many"""
+        remote_ids = set(remote_ids)
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT n.id, n.remote_id FROM notes n LEFT JOIN outbox o ON o.note_id = n.id "
+                "WHERE n.user_id = ? AND n.remote_id IS NOT NULL AND o.note_id IS NULL", (user_id,)).fetchall()
+            gone = [(note_id,) for note_id, remote_id in rows if remote_id not in remote_ids]
+            self._conn.executemany("DELETE FROM notes WHERE id = ?", gone)
+        return len(gone)
+
+    def sync_state(self, user_id):
+        """(pull cursor, number of pulls so far) for the user"""
+        with self._lock:
+            row = self._conn.execute("SELECT cursor, pulls FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+        return row or (None, 0)
+
+    def set_cursor(self, user_id, cursor):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (user_id, cursor, pulls) VALUES (?, ?, 1) ON CONFLICT(user_id) "
+                "DO UPDATE SET cursor = COALESCE(excluded.cursor, cursor), pulls = pulls + 1", (user_id, cursor))
+
+    def pending_count(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def import_legacy(self, user_id, path):
+        """Queue the notes of a legacy saved_notes.json for the user; returns how many were imported.
+
+        Each note's question becomes its first point, and entries already
+        imported (same timestamp and content) are skipped.
+        """
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        with self._lock:
+            existing = {(created_at, content) for created_at, content in self._conn.execute(
+                "SELECT created_at, content FROM notes WHERE user_id = ?", (user_id,))}
+        imported = 0
+        for entry in entries:
+            content = entry.get("content") or []
+            if isinstance(content, str):
+                content = [line for line in content.split("\n") if line.strip()]
+            content = [entry.get("question", "")] + content if entry.get("question") else content
+            created_at = (entry.get("timestamp") or datetime.now().isoformat()).replace(" ", "T")
+            if (created_at, json.dumps(content, ensure_ascii=False)) in existing:
+                continue
+            self.add(user_id, content, created_at)
+            imported += 1
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class NotesSync:
+    """Background worker that keeps the replica and Supabase in step.
+
+    Every ``interval`` seconds, or soon after a local change, each watched
+    user's notes are pulled and then the user's outbox is pushed. Pulls read
+    rows by ``synced_at``, which Supabase sets on every write, so a device
+    that pushes old edits late is still seen by the others; rows are merged
+    last-write-wins on ``updated_at``. A user
+    whose sync fails is retried with exponential backoff; the app keeps
+    reading and writing the replica meanwhile.
+    """
+
+    def __init__(self, replica, interval=SYNC_INTERVAL):
+        self.replica = replica
+        self.interval = interval
+        self._sessions = {}
+        self._retry_at = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._stats = {"pushed": 0, "pulled": 0, "failed_syncs": 0}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notes-sync", daemon=True)
+        self._thread.start()
+
+    def watch(self, session):
+        """Sync this user's notes with ``session``'s client from now on; returns the replica"""
+        with self._lock:
+            self._sessions[session.user_id] = session
+        return self.replica
+
+    def notify(self):
+        """Sync soon, e.g. after a local change"""
+        self._wake.set()
+
+    def ensure_pulled(self, session):
+        """Pull a user's notes once before their first read, so a new replica isn't empty.
+
+        If that pull fails the local and queued notes are served as they are,
+        and the background thread retries with backoff rather than every read.
+        """
+        if self.replica.sync_state(session.user_id)[1]:
+            return
+        self.watch(session)
+        with self._lock:
+            if time.monotonic() < self._retry_at.get(session.user_id, 0):
+                return
+        try:
+            self.pull(session)
+        except Exception as e:
+            self._failed(session.user_id)
+            print(f"Error pulling notes: {str(e)}")
+
+    def _failed(self, user_id):
+        """Back off before syncing the user again"""
+        with self._lock:
+            failures = self._failures.get(user_id, 0)
+            self._failures[user_id] = failures + 1
+            self._retry_at[user_id] = time.monotonic() + backoff_delay(failures, BACKOFF_BASE, BACKOFF_CAP)
+            self._stats["failed_syncs"] += 1
+        count("notes_sync.failed")
+
+    def pull(self, session):
+        """Merge the user's remote changes into the replica; returns the ids of local notes that changed"""
+        cursor, pulls = self.replica.sync_state(session.user_id)
+        query = session.client.table('notes').select(REMOTE_COLUMNS).eq('user_id', session.user_id)
+        if cursor:
+            # The overlap is pulled again; apply_remote leaves notes that are already up to date alone
+            since = _parse_timestamp(cursor) - timedelta(seconds=PULL_OVERLAP)
+            query = query.gt('synced_at', since.isoformat())
+        rows = query.order('synced_at').execute().data or []
+        changed = self.replica.apply_remote(session.user_id, rows)
+        if pulls and pulls % RECONCILE_EVERY == 0:
+            remote = session.client.table('notes').select('id').eq('user_id', session.user_id).execute()
+            self.replica.reconcile(session.user_id, [row['id'] for row in remote.data or []])
+        timestamps = [row.get("synced_at") for row in rows if row.get("synced_at")]
+        self.replica.set_cursor(session.user_id, max(timestamps, key=_parse_timestamp) if timestamps else None)
+        if changed or not pulls:
+            _invalidate_search(session.user_id)
+        with self._lock:
+            self._stats["pulled"] += len(rows)
+        return changed
+
+    def push(self, session):
+        """Send the user's queued changes to Supabase; returns how many were pushed"""
+        pushed = 0
+        while True:
+            changes = self.replica.claim(session.user_id)
+            if not changes:
+                return pushed
+            for change in changes:
+                try:
+                    remote_id = self._push_change(session, change)
+                except Exception:
+                    self.replica.release(change)
+                    raise
+                self.replica.mark_pushed(change, remote_id)
+                pushed += 1
+                with self._lock:
+                    self._stats["pushed"] += 1
+
+    def _push_change(self, session, change):
+        notes = session.client.table('notes')
+        if change["deleted"]:
+            if change["remote_id"] is not None:
+                notes.delete().eq('id', change["remote_id"]).eq('user_id', session.user_id).execute()
+            return None
+        if change["remote_id"] is None:
+            result = notes.insert({
+                "user_id": session.user_id,
+                "created_at": change["created_at"],
+                "updated_at": change["updated_at"],
+                "content": change["content"],
+            }).execute()
+            return result.data[0]["id"]
+        notes.update({"content": change["content"], "updated_at": change["updated_at"]})\
+            .eq('id', change["remote_id"])\
+            .eq('user_id', session.user_id)\
+            .execute()
+        return None
+
+    def sync_user(self, session):
+        """Pull, then push, one user's notes now"""
+        self.pull(session)
+        return self.push(session)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                sessions = list(self._sessions.values())
+            for session in sessions:
+                with self._lock:
+                    if time.monotonic() < self._retry_at.get(session.user_id, 0):
+                        continue
+                try:
+                    self.sync_user(session)
+                except Exception as e:
+                    self._failed(session.user_id)
+                    print(f"Error syncing notes: {str(e)}")
+                else:
+                    with self._lock:
+                        self._failures.pop(session.user_id, None)
+                        self._retry_at.pop(session.user_id, None)
+
+    def flush(self, timeout=10.0):
+        """Block until every watched user's outbox is empty, or ``timeout`` passes"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                users = list(self._sessions)
+            if not any(self.replica.pending_count(user) for user in users):
+                return True
+            self._wake.set()
+            time.sleep(0.05)
+        return False
+
+    def close(self, timeout=2.0):
+        """Try to push what is queued, then stop; the rest is pushed on the next run"""
+        self.flush(timeout)
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["users"] = len(self._sessions)
+        stats["pending"] = self.replica.pending_count()
+        return stats
+
+
+def _invalidate_search(user_id):
+    # Local ids replace remote ones and pulled notes are new to the index, so it is rebuilt on the next search
+    try:
+        get_search_index().invalidate(user_id)
+    except Exception as e:
+        print(f"Error invalidating notes search index: {str(e)}")
+
+
+def get_notes_sync():
+    """Return the process-wide NotesSync over the replica at ``EXPLAINMATE_NOTES_REPLICA_PATH``"""
+    global _default_sync
+    with _default_sync_lock:
+        if _default_sync is None:
+            replica = NotesReplica(os.environ.get("EXPLAINMATE_NOTES_REPLICA_PATH", DEFAULT_REPLICA_PATH))
+            _default_sync = NotesSync(replica)
+            atexit.register(_default_sync.close)
+        return _default_sync
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="import a legacy saved_notes.json for one user")
+    importer.add_argument("path")
+    importer.add_argument("--user", required=True, help="Supabase user id the notes belong to")
+    importer.add_argument("--push", action="store_true", help="push the imported notes to Supabase now")
+    commands.add_parser("status", help="show queued changes per user")
+    args = parser.parse_args()
+
+    replica = NotesReplica(os.environ.get("EXPLAINMATE_NOTES_REPLICA_PATH", DEFAULT_REPLICA_PATH))
+    if args.command == "status":
+        with replica._lock:
+            rows = replica._conn.execute(
+                "SELECT n.user_id, COUNT(*), COUNT(o.note_id) FROM notes n "
+                "LEFT JOIN outbox o ON o.note_id = n.id GROUP BY n.user_id").fetchall()
+        for user_id, notes, pending in rows:
+            print(f"{user_id}: {notes} notes, {pending} changes not yet pushed")
+        return
+
+    imported = replica.import_legacy(args.user, args.path)
+    print(f"Imported {imported} notes for {args.user}")
+    if args.push:
+        from session_manager import UserSession, get_default_client
+        sync = NotesSync(replica, interval=3600)
+        try:
+            pushed = sync.push(UserSession(args.user, get_default_client()))
+        except Exception as e:
+            sys.exit(f"Error pushing notes: {str(e)}")
+        print(f"Pushed {pushed} changes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Only the columns the notes list and export need
+LIST_COLUMNS = "id, created_at, content"
+PAGE_SIZE = 20
+REFRESH_INTERVAL = 30
+# Seconds before the cached notes are fetched again in full, to drop notes deleted or edited elsewhere
+RELOAD_INTERVAL = float(os.environ.get("EXPLAINMATE_NOTES_RELOAD_INTERVAL", 300))
+# Users whose notes are cached per process; the least recently used are evicted past this
+MAX_REPOSITORIES = int(os.environ.get("EXPLAINMATE_NOTES_CACHE_USERS", 256))
+
+
+class NotesRepository:
+    """Cached, paginated view of one user's notes, newest first.
+
+    Older notes are fetched a page at a time with keyset pagination on
+    ``(created_at, id)``, so notes sharing a timestamp are neither skipped
+    nor repeated at a page boundary, and ``refresh()`` fetches only rows
+    from the newest cached timestamp on. Writes made through notes.py patch
+    the cache in place, so a refresh is only needed to pick up notes saved
+    elsewhere and is rate limited to once per ``REFRESH_INTERVAL`` seconds.
+    That only sees new notes, so every ``RELOAD_INTERVAL`` seconds the
+    cached pages are fetched again in full instead.
+    """
+
+    def __init__(self, user_id, client, page_size=PAGE_SIZE):
+        self.user_id = user_id
+        self.client = client
+        self.page_size = page_size
+        self.notes = []
+        self.exhausted = False
+        self._refreshed_at = None
+        self._reloaded_at = None
+        self._lock = threading.RLock()
+
+    def _select(self):
+        return self.client.table('notes')\
+            .select(LIST_COLUMNS)\
+            .eq('user_id', self.user_id)
+
+    def _fetch_older(self):
+        query = self._select()
+        if self.notes:
+            last = self.notes[-1]
+            query = query.or_(f'created_at.lt."{last["created_at"]}",'
+                              f'and(created_at.eq."{last["created_at"]}",id.lt.{last["id"]})')
+        result = query.order('created_at', desc=True).order('id', desc=True).limit(self.page_size).execute()
+        rows = result.data or []
+        self.notes.extend(rows)
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        if self._refreshed_at is None:
+            self._refreshed_at = self._reloaded_at = time.monotonic()
+
+    def _reload(self):
+        """Replace the cached pages with the current newest rows"""
+        count = max(len(self.notes), self.page_size)
+        result = self._select().order('created_at', desc=True).order('id', desc=True).limit(count).execute()
+        rows = result.data or []
+        self.notes = rows
+        # Pages beyond the cached ones were never fetched, so only a short result means there are none
+        self.exhausted = len(rows) < count
+        self._refreshed_at = self._reloaded_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """Prepend notes created since the newest cached one, or reload them all once due"""
+        with self._lock:
+            if self._refreshed_at is None:
+                # Nothing loaded yet, the first page fetch gets the newest notes anyway
+                return
+            now = time.monotonic()
+            if now - self._reloaded_at >= RELOAD_INTERVAL:
+                self._reload()
+                return
+            if not force and now - self._refreshed_at < REFRESH_INTERVAL:
+                return
+            query = self._select()
+            if self.notes:
+                # gte: a note saved elsewhere in the same instant as the newest one is not missed
+                query = query.gte('created_at', self.notes[0]['created_at'])
+            result = query.order('created_at', desc=True).order('id', desc=True).execute()
+            known = {note['id'] for note in self.notes}
+            self.notes[:0] = [row for row in result.data or [] if row['id'] not in known]
+            self._refreshed_at = time.monotonic()
+
+    def get_page(self, count):
+        """Return (the newest ``count`` notes, whether older notes exist)"""
+        with self._lock:
+            self.refresh()
+            while len(self.notes) < count and not self.exhausted:
+                self._fetch_older()
+            return list(self.notes[:count]), len(self.notes) > count or not self.exhausted
+
+    def get_all(self):
+        with self._lock:
+            self.refresh()
+            while not self.exhausted:
+                self._fetch_older()
+            return list(self.notes)
+
+    def add(self, note):
+        with self._lock:
+            if self.notes or self.exhausted:
+                # Keep newest-first order even if the clock went backwards
+                index = 0
+                while index < len(self.notes) and self.notes[index]['created_at'] > note['created_at']:
+                    index += 1
+                self.notes.insert(index, {column: note.get(column) for column in ('id', 'created_at', 'content')})
+
+    def update(self, note_id, content):
+        with self._lock:
+            for note in self.notes:
+                if note['id'] == note_id:
+                    note['content'] = content
+
+    def remove(self, note_id):
+        with self._lock:
+            self.notes = [note for note in self.notes if note['id'] != note_id]
+
+
+_repositories = OrderedDict()
+_repositories_lock = threading.Lock()
+
+
+def get_repository(user_id, client=None):
+    """Return the process-wide cached repository for a user.
+
+    ``client`` is the caller's session client; the repository queries with
+    the most recent one so requests carry a current token for that user.
+    It is required the first time a user's repository is created. At most
+    ``MAX_REPOSITORIES`` users are kept, least recently used first out.
+    """
+    with _repositories_lock:
+        repository = _repositories.get(user_id)
+        if repository is None:
+            repository = _repositories[user_id] = NotesRepository(user_id, client)
+            if len(_repositories) > MAX_REPOSITORIES:
+                _repositories.popitem(last=False)
+        else:
+            _repositories.move_to_end(user_id)
+            if client is not None:
+                repository.client = client
+        return repository
+
+
+def drop_repository(user_id):
+    """Forget a user's cached notes, e.g. when they sign out"""
+    with _repositories_lock:
+        _repositories.pop(user_id, None)
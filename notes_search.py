@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "notes_search.db")
+DEFAULT_LIMIT = 20
+# Seconds before a user's index is rebuilt on their next search, to pick up notes written by other processes
+INDEX_TTL = float(os.environ.get("EXPLAINMATE_SEARCH_TTL", 300))
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def note_text(content):
+    """Searchable text of a note; update_note stores content as a list of points"""
+    if isinstance(content, list):
+        return "\n".join(str(point) for point in content)
+    return content or ""
+
+
+def owner_token(user_id):
+    """Single FTS5 token identifying a user, whatever characters their id contains"""
+    return "u" + hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()[:20]
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    terms = re.findall(r"\w+", query.lower())
+    # Quoting keeps FTS5 operators and column filters typed by the user literal
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+class NotesSearchIndex:
+    """Full-text index over saved notes in a local SQLite FTS5 table.
+
+    A user's notes are indexed in full the first time they search, after
+    which notes.py keeps the index in step with every save, update and
+    delete made by this process. Notes written by other workers or the API
+    service are picked up when the index is rebuilt, on the first search
+    after it is older than ``INDEX_TTL`` seconds. Results are ranked by BM25 and every query word matches as a
+    prefix, so results show up while a word is still being typed. Worker
+    processes pointing at the same file share one index.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS notes (
+                    rowid INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    note_id TEXT NOT NULL,
+                    created_at TEXT,
+                    content TEXT,
+                    text TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    UNIQUE (user_id, note_id)
+                )"""
+            )
+            # External-content table: the text lives in `notes`, FTS5 keeps only the index.
+            # Matching on the owner column restricts a query to one user inside FTS5
+            # itself, instead of ranking every user's matches and filtering afterwards.
+            conn.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                    text, owner, content='notes', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2', prefix='3'
+                )"""
+            )
+            conn.execute(
+                """CREATE TRIGGER IF NOT EXISTS notes_ai AFTER INSERT ON notes BEGIN
+                    INSERT INTO notes_fts(rowid, text, owner) VALUES (new.rowid, new.text, new.owner);
+                END"""
+            )
+            conn.execute(
+                """CREATE TRIGGER IF NOT EXISTS notes_ad AFTER DELETE ON notes BEGIN
+                    INSERT INTO notes_fts(notes_fts, rowid, text, owner) VALUES ('delete', old.rowid, old.text, old.owner);
+                END"""
+            )
+            conn.execute(
+                """CREATE TRIGGER IF NOT EXISTS notes_au AFTER UPDATE ON notes BEGIN
+                    INSERT INTO notes_fts(notes_fts, rowid, text, owner) VALUES ('delete', old.rowid, old.text, old.owner);
+                    INSERT INTO notes_fts(rowid, text, owner) VALUES (new.rowid, new.text, new.owner);
+                END"""
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS indexed_users (user_id TEXT PRIMARY KEY, built_at REAL NOT NULL)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(user_id, note):
+        content = note.get("content")
+        return (
+            str(user_id),
+            str(note["id"]),
+            note.get("created_at"),
+            _stored_content(content),
+            note_text(content),
+            owner_token(user_id),
+        )
+
+    def is_indexed(self, user_id, max_age=None):
+        """Whether the user's notes are indexed, and were built less than ``max_age`` seconds ago if given"""
+        row = self._connect().execute("SELECT built_at FROM indexed_users WHERE user_id = ?",
+                                      (str(user_id),)).fetchone()
+        return row is not None and (max_age is None or time.time() - row[0] < max_age)
+
+    def build(self, user_id, notes):
+        """Replace the user's indexed notes with ``notes``"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM notes WHERE user_id = ?", (str(user_id),))
+            conn.executemany(
+                "INSERT OR IGNORE INTO notes (user_id, note_id, created_at, content, text, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                (self._row(user_id, note) for note in notes),
+            )
+            conn.execute("INSERT OR REPLACE INTO indexed_users VALUES (?, ?)", (str(user_id), time.time()))
+
+    def add(self, user_id, note):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """INSERT INTO notes (user_id, note_id, created_at, content, text, owner) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, note_id) DO UPDATE SET
+                   created_at = excluded.created_at, content = excluded.content, text = excluded.text""",
+                self._row(user_id, note),
+            )
+
+    def update(self, user_id, note_id, content):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE notes SET content = ?, text = ? WHERE user_id = ? AND note_id = ?",
+                (_stored_content(content), note_text(content), str(user_id), str(note_id)),
+            )
+
+    def remove(self, user_id, note_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM notes WHERE user_id = ? AND note_id = ?", (str(user_id), str(note_id)))
+
+    def invalidate(self, user_id):
+        """Forget that the user is indexed so their next search rebuilds the index"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM indexed_users WHERE user_id = ?", (str(user_id),))
+
+    def search(self, user_id, query, limit=DEFAULT_LIMIT):
+        """Return the user's best matching notes as {"id", "created_at", "content"} dicts"""
+        match = build_match_query(query)
+        if not match:
+            return []
+        rows = self._connect().execute(
+            """SELECT notes.note_id, notes.created_at, notes.content, notes.text
+               FROM notes_fts JOIN notes ON notes.rowid = notes_fts.rowid
+               WHERE notes_fts MATCH ?
+               ORDER BY bm25(notes_fts, 1.0, 0.0) LIMIT ?""",
+            (f"owner:{owner_token(user_id)} AND text:({match})", limit),
+        ).fetchall()
+        return [{"id": _note_id(note_id), "created_at": created_at,
+                 "content": text if content is None else json.loads(content)}
+                for note_id, created_at, content, text in rows]
+
+
+def _stored_content(content):
+    # Plain-text notes are already stored as their search text
+    return None if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+def _note_id(note_id):
+    # Ids are stored as text; give integer ids back their type so they match the repository's
+    return int(note_id) if note_id.isdigit() else note_id
+
+
+def get_search_index():
+    """Return the process-wide notes index, stored at ``EXPLAINMATE_SEARCH_PATH``"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = NotesSearchIndex(os.environ.get("EXPLAINMATE_SEARCH_PATH", DEFAULT_INDEX_PATH))
+        return _default_index
@@ -0,0 +1,176 @@
+from datetime import datetime
+
+from session_manager import is_auth_error
+from notes_repository import get_repository
+from notes_replica import ENABLED as REPLICA_ENABLED, get_notes_sync
+from notes_search import INDEX_TTL, get_search_index
+from profiler import timed
+
+# Notes operations for an explicit UserSession (see session_manager.py), shared by
+# the Streamlit app (through notes.py) and the API service. Errors that mean the
+# access token was rejected are raised so the caller can refresh the session or
+# answer 401; any other failure is printed and reported as False or empty results.
+# With EXPLAINMATE_NOTES_REPLICA=1 they read and write the local replica in
+# notes_replica.py instead, which syncs with Supabase in the background.
+
+
+def _replica(session):
+    """The notes replica, with ``session``'s user registered for background sync"""
+    return get_notes_sync().watch(session)
+
+
+def _all_notes(session):
+    if REPLICA_ENABLED:
+        get_notes_sync().ensure_pulled(session)
+        return _replica(session).list_notes(session.user_id)
+    return get_repository(session.user_id, session.client).get_all()
+
+
+def _update_search_index(user_id, action, *args):
+    """Apply a write to the search index; if that fails, the next search rebuilds it"""
+    try:
+        index = get_search_index()
+        if index.is_indexed(user_id):
+            getattr(index, action)(user_id, *args)
+    except Exception as e:
+        print(f"Error updating notes search index: {str(e)}")
+        try:
+            get_search_index().invalidate(user_id)
+        except Exception:
+            pass
+
+
+@timed("notes.save")
+def save_note(session, question, note_content):
+    """Save a note with the given question and content"""
+    try:
+        note_entry = {
+            "user_id": session.user_id,
+            "created_at": datetime.now().isoformat(),
+            "content": note_content.strip()
+        }
+
+        if REPLICA_ENABLED:
+            note = _replica(session).add(session.user_id, note_entry["content"], note_entry["created_at"])
+            get_notes_sync().notify()
+            _update_search_index(session.user_id, 'add', note)
+            return True
+
+        result = session.client.table('notes').insert(note_entry).execute()
+        if result.data:
+            get_repository(session.user_id, session.client).add(result.data[0])
+            _update_search_index(session.user_id, 'add', result.data[0])
+        return len(result.data) > 0
+    except Exception as e:
+        if is_auth_error(e):
+            raise
+        print(f"Error saving note: {str(e)}")
+        return False
+
+
+@timed("notes.load_all")
+def load_notes(session):
+    """Load all of the user's saved notes, newest first"""
+    try:
+        return _all_notes(session)
+    except Exception as e:
+        if is_auth_error(e):
+            raise
+        print(f"Error loading notes: {str(e)}")
+        return []
+
+
+@timed("notes.load_page")
+def load_notes_page(session, count):
+    """Load the user's newest `count` notes.
+
+    Returns:
+        tuple: (notes, has_more) where has_more is True if older notes exist
+    """
+    try:
+        if REPLICA_ENABLED:
+            get_notes_sync().ensure_pulled(session)
+            return _replica(session).get_page(session.user_id, count)
+        return get_repository(session.user_id, session.client).get_page(count)
+    except Exception as e:
+        if is_auth_error(e):
+            raise
+        print(f"Error loading notes: {str(e)}")
+        return [], False
+
+
+@timed("notes.update")
+def update_note(session, note_id, new_content):
+    """Update a note's content by its ID (as bullet points)"""
+    try:
+        points = [line.strip() for line in new_content.split('\n') if line.strip()]
+        if REPLICA_ENABLED:
+            updated = _replica(session).update(session.user_id, note_id, points)
+            if updated:
+                get_notes_sync().notify()
+                _update_search_index(session.user_id, 'update', note_id, points)
+            return updated
+
+        result = session.client.table('notes')\
+            .update({"content": points})\
+            .eq('id', note_id)\
+            .eq('user_id', session.user_id)\
+            .execute()
+
+        if result.data:
+            get_repository(session.user_id, session.client).update(note_id, points)
+            _update_search_index(session.user_id, 'update', note_id, points)
+        return len(result.data) > 0
+    except Exception as e:
+        if is_auth_error(e):
+            raise
+        print(f"Error updating note: {str(e)}")
+        return False
+
+
+@timed("notes.delete")
+def delete_note(session, note_id):
+    """Delete a note by its ID"""
+    try:
+        if REPLICA_ENABLED:
+            deleted = _replica(session).delete(session.user_id, note_id)
+            if deleted:
+                get_notes_sync().notify()
+                _update_search_index(session.user_id, 'remove', note_id)
+            return deleted
+
+        result = session.client.table('notes')\
+            .delete()\
+            .eq('id', note_id)\
+            .eq('user_id', session.user_id)\
+            .execute()
+
+        if result.data:
+            get_repository(session.user_id, session.client).remove(note_id)
+            _update_search_index(session.user_id, 'remove', note_id)
+        return len(result.data) > 0
+    except Exception as e:
+        if is_auth_error(e):
+            raise
+        print(f"Error deleting note: {str(e)}")
+        return False
+
+
+@timed("notes.search")
+def search_notes(session, query, limit=20):
+    """Search the user's notes, best matches first.
+
+    The first search indexes all of the user's notes; after that the index
+    is kept up to date by save_note, update_note and delete_note, and
+    rebuilt once it is older than notes_search.INDEX_TTL.
+    """
+    try:
+        index = get_search_index()
+        if not index.is_indexed(session.user_id, INDEX_TTL):
+            index.build(session.user_id, _all_notes(session))
+        return index.search(session.user_id, query, limit)
+    except Exception as e:
+        if is_auth_error(e):
+            raise
+        print(f"Error searching notes: {str(e)}")
+        return []
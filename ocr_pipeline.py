@@ -0,0 +1,179 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from profiler import count
+
+# numpy, Pillow and pytesseract are imported by the functions that use them,
+# so importing this module (e.g. for content_hash) stays cheap until an image is OCR'd
+
+TARGET_DPI = 300
+# Phone photos carry no useful DPI, so assume the page is about letter width
+ASSUMED_PAGE_WIDTH_INCHES = 8.5
+TILE_HEIGHT = 1200
+THRESHOLD_BLOCK = 31
+THRESHOLD_OFFSET = 10
+MAX_SKEW_DEGREES = 5.0
+CACHE_SIZE = 64
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def downscale(img, target_dpi=TARGET_DPI):
+    """Shrink the image to about ``target_dpi``; upscaling never helps Tesseract here"""
+    from PIL import Image
+
+    dpi = img.info.get("dpi", (0, 0))[0]
+    if dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+    else:
+        scale = ASSUMED_PAGE_WIDTH_INCHES * target_dpi / img.width
+    if scale >= 1:
+        return img
+    return img.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.LANCZOS)
+
+
+def adaptive_threshold(gray, block=THRESHOLD_BLOCK, offset=THRESHOLD_OFFSET):
+    """Binarize against the local mean, which copes with uneven phone-camera lighting.
+
+    Returns a uint8 array with ink as 0 and paper as 255.
+    """
+    import numpy as np
+
+    pad = block // 2
+    padded = np.pad(gray.astype(np.float64), pad + 1, mode="edge")
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    h, w = gray.shape
+    total = (integral[block:block + h, block:block + w]
+             - integral[:h, block:block + w]
+             - integral[block:block + h, :w]
+             + integral[:h, :w])
+    local_mean = total / (block * block)
+    return np.where(gray < local_mean - offset, 0, 255).astype(np.uint8)
+
+
+def estimate_skew(binary, max_degrees=MAX_SKEW_DEGREES, step=0.25):
+    """Angle (degrees) that makes text rows most horizontal, by projection-profile variance"""
+    import numpy as np
+
+    # A reduced copy is plenty to find the angle
+    factor = max(1, binary.shape[1] // 800)
+    ys, xs = np.nonzero(binary[::factor, ::factor] == 0)
+    if len(ys) < 100:
+        return 0.0
+    xs = xs - xs.mean()
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_degrees, max_degrees + step, step):
+        rows = np.round(ys - xs * np.tan(np.radians(angle))).astype(np.int64)
+        profile = np.bincount(rows - rows.min())
+        score = float(np.var(profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(binary):
+    import numpy as np
+    from PIL import Image
+
+    angle = estimate_skew(binary)
+    if abs(angle) < 0.1:
+        return binary
+    rotated = Image.fromarray(binary).rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+    return np.asarray(rotated)
+
+
+def preprocess(img, target_dpi=TARGET_DPI):
+    """Grayscale, downscale, binarize and deskew a page; returns a uint8 array"""
+    import numpy as np
+
+    gray = np.asarray(downscale(img.convert("L"), target_dpi))
+    return deskew(adaptive_threshold(gray))
+
+
+def split_tiles(binary, tile_height=TILE_HEIGHT):
+    """Cut a tall page into horizontal strips, cutting in the gaps between text lines"""
+    import numpy as np
+
+    height = binary.shape[0]
+    if height <= tile_height * 1.5:
+        return [binary]
+    ink_per_row = (binary == 0).sum(axis=1)
+    window = tile_height // 8
+    cuts = [0]
+    while height - cuts[-1] > tile_height * 1.5:
+        target = cuts[-1] + tile_height
+        lo, hi = target - window, min(height, target + window)
+        cuts.append(lo + int(np.argmin(ink_per_row[lo:hi])))
+    cuts.append(height)
+    return [binary[top:bottom] for top, bottom in zip(cuts, cuts[1:])]
+
+
+def _ocr_tile(tile):
+    import pytesseract
+    from PIL import Image
+
+    return pytesseract.image_to_string(Image.fromarray(tile)).strip()
+
+
+def _get_executor():
+    """Shared pool for tile OCR.
+
+    pytesseract runs the tesseract binary as a subprocess, so threads already
+    run tiles in parallel without pickling images to worker processes.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # One tesseract thread per tile; parallelism comes from the pool
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+            workers = int(os.environ.get("EXPLAINMATE_OCR_WORKERS", min(4, os.cpu_count() or 1)))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+        return _executor
+
+
+def ocr_image(img, target_dpi=TARGET_DPI):
+    """OCR a PIL image through the preprocessing and tiling pipeline"""
+    from PIL import ImageOps
+
+    # Phone cameras store orientation in EXIF rather than rotating the pixels
+    img = ImageOps.exif_transpose(img)
+    tiles = split_tiles(preprocess(img, target_dpi))
+    if len(tiles) == 1:
+        return _ocr_tile(tiles[0])
+    texts = _get_executor().map(_ocr_tile, tiles)
+    # map() preserves tile order, which is reading order for horizontal strips
+    return "\n".join(text for text in texts if text)
+
+
+def cached_result(key, compute):
+    """Return the cached OCR text for ``key``, computing and storing it on a miss"""
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            count("ocr_cache.hits")
+            return _cache[key]
+    count("ocr_cache.misses")
+    text = compute()
+    with _cache_lock:
+        _cache[key] = text
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return text
+
+
+def extract_text(data):
+    """OCR image bytes, serving repeated uploads of the same content from the cache"""
+    from PIL import Image
+
+    return cached_result(content_hash(data), lambda: ocr_image(Image.open(io.BytesIO(data))))
@@ -0,0 +1,205 @@
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PROFILE_LOG = os.environ.get("EXPLAINMATE_PROFILE_LOG")
+MAX_TRACES = 200
+# Upper bounds (seconds) of the Prometheus duration histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+_traces = deque(maxlen=MAX_TRACES)
+_rerun_ids = itertools.count(1)
+# Each rerun can run on a new thread, so unfinished traces are also tracked by session
+_open_traces = {}
+# Process-wide totals: stage -> [count, total seconds, bucket counts], counter -> value
+_stage_totals = {}
+_counters = {}
+
+
+class RerunTrace:
+    """Time spent per stage during one run of the Streamlit script"""
+
+    def __init__(self, session=None):
+        self.id = next(_rerun_ids)
+        self.session = session
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.duration = None
+        self.interrupted = False
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, name, seconds):
+        stage = self.stages.setdefault(name, [0, 0.0])
+        stage[0] += 1
+        stage[1] += seconds
+        self.last = time.perf_counter()
+
+    def summary(self):
+        return {
+            "rerun": self.id,
+            "session": self.session,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": round((self.duration or 0) * 1000, 2),
+            "interrupted": self.interrupted,
+            "stages": {name: {"count": count, "ms": round(total * 1000, 2)}
+                       for name, (count, total) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+def _record(name, seconds, in_trace=True):
+    with _lock:
+        stage = _stage_totals.get(name)
+        if stage is None:
+            stage = _stage_totals[name] = [0, 0.0, [0] * len(BUCKETS)]
+        stage[0] += 1
+        stage[1] += seconds
+        for index, upper in enumerate(BUCKETS):
+            if seconds <= upper:
+                stage[2][index] += 1
+                break
+    trace = getattr(_local, "trace", None) if in_trace else None
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def _finish(trace, interrupted):
+    if interrupted:
+        # The script was stopped by st.stop()/st.rerun(); count up to its last recorded stage
+        trace.duration = trace.last - trace.start
+    else:
+        trace.duration = time.perf_counter() - trace.start
+    trace.interrupted = interrupted
+    _record("rerun", trace.duration, in_trace=False)
+    with _lock:
+        _traces.append(trace)
+    if PROFILE_LOG:
+        try:
+            with open(PROFILE_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.summary()) + "\n")
+        except OSError as e:
+            print(f"Error writing profile log: {str(e)}")
+
+
+def start_rerun(session=None):
+    """Start timing a script run on this thread.
+
+    A run that never reached ``end_rerun()`` (st.stop() and st.rerun() end
+    the script with an exception) is closed here and marked interrupted.
+    """
+    trace = RerunTrace(session)
+    with _lock:
+        previous = _open_traces.pop(session, None)
+        _open_traces[session] = trace
+    if previous is not None:
+        _finish(previous, interrupted=True)
+    _local.trace = trace
+    return trace
+
+
+def end_rerun():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    if trace is not None:
+        with _lock:
+            if _open_traces.get(trace.session) is trace:
+                del _open_traces[trace.session]
+        _finish(trace, interrupted=False)
+    return trace
+
+
+def record(name, seconds):
+    """Record an already measured duration as stage ``name``"""
+    _record(name, seconds)
+
+
+@contextmanager
+def span(name):
+    """Time a block as stage ``name``; repeated spans within a rerun add up"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of ``span``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    """Bump a counter, e.g. ``pdf_cache.hits``, for the process and the current rerun"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + amount
+
+
+def recent(limit=20, session=None):
+    """Summaries of the latest finished reruns, newest first"""
+    with _lock:
+        traces = [trace for trace in _traces if session is None or trace.session == session]
+    return [trace.summary() for trace in reversed(traces[-limit:])]
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def hit_rates():
+    """Hit rate for every ``<name>.hits``/``<name>.misses`` counter pair"""
+    values = counters()
+    rates = {}
+    for name, hits in values.items():
+        if name.endswith(".hits"):
+            prefix = name[:-len(".hits")]
+            total = hits + values.get(prefix + ".misses", 0)
+            rates[prefix] = hits / total if total else 0.0
+    return rates
+
+
+def to_jsonl(summaries):
+    return "".join(json.dumps(summary) + "\n" for summary in summaries)
+
+
+def prometheus_text():
+    """Process-wide stage timings and counters in the Prometheus text format"""
+    with _lock:
+        stages = {name: (calls, total, list(buckets)) for name, (calls, total, buckets) in _stage_totals.items()}
+        values = dict(_counters)
+    lines = [
+        "# HELP explainmate_stage_seconds Time spent per app stage",
+        "# TYPE explainmate_stage_seconds histogram",
+    ]
+    for name in sorted(stages):
+        stage_count, total, buckets = stages[name]
+        cumulative = 0
+        for upper, bucket in zip(BUCKETS, buckets):
+            cumulative += bucket
+            lines.append(f'explainmate_stage_seconds_bucket{{stage="{name}",le="{upper}"}} {cumulative}')
+        lines.append(f'explainmate_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage_count}')
+        lines.append(f'explainmate_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'explainmate_stage_seconds_count{{stage="{name}"}} {stage_count}')
+    lines.append("# HELP explainmate_events_total App event counters (cache hits, misses, ...)")
+    lines.append("# TYPE explainmate_events_total counter")
+    for name in sorted(values):
+        lines.append(f'explainmate_events_total{{name="{name}"}} {values[name]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import re
+
+# Extra room over a style's token budget before max_tokens cuts an answer off
+MAX_TOKENS_HEADROOM = 1.3
+
+_TUTOR_PROMPT = """You are an expert tutor that explains concepts clearly and precisely. 
+    When explaining mathematical concepts:
+    important = Never show your thought process, reasoning steps, or any chain-of-thought. Only output the final explanation in clear paragraphs.
+    1. Write in a discrete paragraph format, do not output your thought process
+    2. For mathematical formulas, enclose them in ```latex ... ``` tags
+    3. use separate blocks or bullet points
+    4. Keep explanations flowing naturally with formulas with latex.
+    5. Use proper LaTeX syntax for formulas
+    when explaining other concepts:
+    6. Use clear and detailed explaination with headings and points
+    7. Avoid jargon and complex terms
+    8. Provide examples and analogies to illustrate points
+    9. Use simple language and focus on intuitive understanding
+    10. Keep explanations flowing naturally with examples integrated into the text
+    11. {length}"""
+
+_STYLE_SUFFIXES = {
+    "Simple": "\nUse simple language and focus on intuitive understanding.",
+    "Technical": "\nUse technical language and provide detailed mathematical explanations.",
+}
+
+# Prompt versions: the length instruction and max_tokens per style. "v1" is the
+# original prompt, which asked for 512 tokens in prose but allowed 800.
+VERSIONS = {
+    "v1": {
+        "Simple": {"length": "explain in just {budget} tokens", "budget": 512, "max_tokens": 800},
+        "Technical": {"length": "explain in just {budget} tokens", "budget": 512, "max_tokens": 800},
+    },
+    "v2": {
+        "Simple": {"length": "explain in at most {budget} tokens", "budget": 400},
+        "Technical": {"length": "explain in at most {budget} tokens", "budget": 700},
+    },
+}
+DEFAULT_VERSION = "v2"
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+
+
+class PromptTemplate:
+    """A compiled system prompt and the request parameters that go with it.
+
+    ``version`` is a hash of everything that shapes the answer (text,
+    max_tokens, temperature), so changing any of them gives new cache keys.
+    """
+
+    def __init__(self, name, style, text, max_tokens, temperature=0.4, budget=None):
+        self.name = name
+        self.style = style
+        self.text = text
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.budget = budget
+        self.version = hashlib.sha256(json.dumps([text, max_tokens, temperature]).encode("utf-8")).hexdigest()
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        """Estimated tokens of the system prompt"""
+        if self._tokens is None:
+            self._tokens = estimate_tokens(self.text)
+        return self._tokens
+
+    def messages(self, prompt):
+        return [
+            {"role": "system", "content": self.text},
+            {"role": "user", "content": f"Explain this concept: {prompt}"},
+        ]
+
+
+def _tiktoken_encoding():
+    """tiktoken's cl100k_base encoding if the package (and its data) is available, else False"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+
+def estimate_tokens(text):
+    """Local estimate of the tokens in ``text``.
+
+    Uses tiktoken when it is installed; otherwise counts each punctuation
+    mark as one token and each word as one token per 8 characters, which is
+    close enough to size budgets and fill in missing usage.
+    """
+    encoding = _tiktoken_encoding()
+    if encoding:
+        return len(encoding.encode(text or ""))
+    return sum((len(token) + 7) // 8 if token[0].isalnum() else 1 for token in _TOKEN.findall(text or ""))
+
+
+def max_tokens_for(budget, headroom=MAX_TOKENS_HEADROOM):
+    """max_tokens for an answer budget: the budget plus headroom, rounded up to a multiple of 64"""
+    return -(-int(budget * headroom) // 64) * 64
+
+
+def compile_prompts(name):
+    """Compile every style's PromptTemplate of version ``name``"""
+    templates = {}
+    for style, spec in VERSIONS[name].items():
+        budget = spec.get("budget")
+        text = _TUTOR_PROMPT.format(length=spec["length"].format(budget=budget)) + _STYLE_SUFFIXES[style]
+        max_tokens = spec.get("max_tokens") or max_tokens_for(budget)
+        templates[style] = PromptTemplate(name, style, text, max_tokens, budget=budget)
+    return templates
+
+
+_compiled = {name: compile_prompts(name) for name in VERSIONS}
+ACTIVE_VERSION = os.environ.get("EXPLAINMATE_PROMPT_VERSION", DEFAULT_VERSION)
+
+
+def get_prompt(style, version=None):
+    """The compiled PromptTemplate for a style, from the active version by default"""
+    templates = _compiled.get(version or ACTIVE_VERSION) or _compiled[DEFAULT_VERSION]
+    return templates.get(style) or templates["Simple"]
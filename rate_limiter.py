@@ -0,0 +1,184 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from profiler import count
+from usage_ledger import get_usage_ledger, seconds_until_tomorrow
+
+# Fresh (uncached) explanations each user may start per minute, and how many at once after idling
+USER_RATE = float(os.environ.get("EXPLAINMATE_USER_RATE", 10))
+USER_BURST = int(os.environ.get("EXPLAINMATE_USER_BURST", 5))
+# Upstream calls in flight across all users, and how long a call may queue for one
+MAX_CONCURRENT = int(os.environ.get("EXPLAINMATE_MAX_CONCURRENT_LLM", 16))
+QUEUE_TIMEOUT = float(os.environ.get("EXPLAINMATE_QUEUE_TIMEOUT", 30))
+# Tokens per user per UTC day; 0 disables the budget
+DAILY_TOKEN_BUDGET = int(os.environ.get("EXPLAINMATE_DAILY_TOKEN_BUDGET", 0))
+MAX_BUCKETS = 10000
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+class RateLimitExceeded(Exception):
+    """Raised before an upstream call that a limit does not allow.
+
+    ``reason`` is "user" (too many requests from this user), "budget" (the
+    user's daily token budget is spent) or "busy" (no upstream slot freed up
+    within the queue timeout); ``retry_after`` is in seconds.
+    """
+
+    MESSAGES = {
+        "user": "You're asking faster than explanations can be generated",
+        "budget": "You've used today's explanation budget",
+        "busy": "ExplainMate is busy right now",
+    }
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{self.MESSAGES.get(reason, 'Rate limited')}, try again in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``capacity`` requests at once, refilled at ``rate`` requests per second"""
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, now=None):
+        """Take one token; returns 0 on success, otherwise seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        # Callers may pass a time read before another thread's later one, so never refill backwards
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """Per-user token buckets, a daily token budget and a global cap on upstream calls.
+
+    ``check(user_id)`` is called before starting an upstream call and raises
+    RateLimitExceeded instead of waiting. ``slot()``/``aslot()`` hold one of
+    ``max_concurrent`` upstream slots for the length of a call, queueing up to
+    ``queue_timeout`` seconds for one. Cached answers never touch the limiter.
+    """
+
+    def __init__(self, rate_per_minute=USER_RATE, burst=USER_BURST, max_concurrent=MAX_CONCURRENT,
+                 queue_timeout=QUEUE_TIMEOUT, daily_token_budget=DAILY_TOKEN_BUDGET, ledger=None):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.daily_token_budget = daily_token_budget
+        self.ledger = ledger
+        self.active = 0
+        self.waiting = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+
+    def check(self, user_id):
+        if user_id is None:
+            return
+        if self.daily_token_budget:
+            ledger = self.ledger or get_usage_ledger()
+            if ledger.tokens_today(user_id) >= self.daily_token_budget:
+                count("rate_limit.budget")
+                raise RateLimitExceeded("budget", seconds_until_tomorrow())
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    # A full bucket is the same as a new one, so idle users can be forgotten
+                    self._buckets = {uid: b for uid, b in self._buckets.items() if not b.is_full(now)}
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst, now)
+            wait = bucket.take(now)
+        if wait:
+            count("rate_limit.user")
+            raise RateLimitExceeded("user", wait)
+
+    def _try_acquire(self):
+        if self.active < self.max_concurrent:
+            self.active += 1
+            return True
+        return False
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+            self._slot_freed.notify()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._lock:
+            if not self._try_acquire():
+                self.waiting += 1
+                try:
+                    acquired = self._slot_freed.wait_for(self._try_acquire, timeout)
+                finally:
+                    self.waiting -= 1
+                if not acquired:
+                    count("rate_limit.busy")
+                    raise RateLimitExceeded("busy", timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, timeout=None, poll_interval=0.05):
+        """``slot()`` for the event loop: polls instead of blocking the thread"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            acquired = self._try_acquire()
+            if not acquired:
+                self.waiting += 1
+        if not acquired:
+            try:
+                while True:
+                    await asyncio.sleep(poll_interval)
+                    with self._lock:
+                        if self._try_acquire():
+                            break
+                    if time.monotonic() >= deadline:
+                        count("rate_limit.busy")
+                        raise RateLimitExceeded("busy", timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "max_concurrent": self.max_concurrent,
+                "users": len(self._buckets),
+            }
+
+
+def get_rate_limiter():
+    """Return the process-wide RateLimiter configured from the environment"""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
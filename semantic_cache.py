@@ -0,0 +1,337 @@
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from explanation_cache import normalize_prompt
+
+DEFAULT_DIM = 256
+DEFAULT_THRESHOLD = 0.85
+# Seconds between dropping indexed keys the exact cache no longer has
+PRUNE_INTERVAL = float(os.environ.get("EXPLAINMATE_SEMANTIC_PRUNE_INTERVAL", 600))
+
+# Words that carry no topic information in student questions
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "what", "whats", "how", "does", "do", "why",
+    "explain", "describe", "define", "definition", "tell", "me", "about", "of", "in",
+    "concept", "this", "please", "can", "you", "meaning", "mean", "means", "s",
+    "work", "works", "say", "says", "with",
+}
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class HashedNgramVectorizer:
+    """Dependency-free embedding: signed feature hashing of words and character trigrams"""
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        words = [w for w in _TOKEN.findall(normalize_prompt(text)) if w not in _STOPWORDS]
+        features = list(words)
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text):
+        features = self._features(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+        hashes = np.array([zlib.crc32(f.encode("utf-8")) for f in features], dtype=np.uint64)
+        signs = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)
+        vector = np.bincount((hashes >> 1) % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SentenceTransformerVectorizer:
+    """Small CPU sentence-transformers model, used when the package is installed"""
+
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, text):
+        vector = self.model.encode(normalize_prompt(text), normalize_embeddings=True)
+        return np.asarray(vector, dtype=np.float32)
+
+
+def get_vectorizer():
+    """Use the model named by EXPLAINMATE_SEMANTIC_MODEL if available, else feature hashing"""
+    model_name = os.environ.get("EXPLAINMATE_SEMANTIC_MODEL")
+    if model_name:
+        try:
+            return SentenceTransformerVectorizer(model_name)
+        except Exception as e:
+            print(f"Falling back to hashed n-gram vectorizer: {str(e)}")
+    return HashedNgramVectorizer()
+
+
+class VectorIndex:
+    """Inverted-file nearest-neighbour index over unit vectors.
+
+    Vectors are grouped into clusters around k-means centroids and stored
+    contiguously per cluster, so a search scores the centroids and then only
+    the members of the ``nprobe`` closest clusters. Vectors added after the
+    last build are appended to their nearest cluster's overflow list, and the
+    whole index is re-clustered once the overflow grows past ``rebuild_ratio``.
+    Removed vectors are skipped by searches and dropped at the next build,
+    which is also triggered once they pass ``rebuild_ratio`` of the index.
+    """
+
+    def __init__(self, dim, nprobe=8, min_build_size=2048, rebuild_ratio=0.2):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_build_size = min_build_size
+        self.rebuild_ratio = rebuild_ratio
+        self.centroids = None
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(2, dtype=np.int64)
+        self._overflow = {}
+        self._overflow_count = 0
+        self._removed = set()
+        self._removed_ids = None
+
+    def __len__(self):
+        return len(self.ids) + self._overflow_count - len(self._removed)
+
+    def add(self, vector, item_id):
+        cluster = int(np.argmax(self.centroids @ vector)) if self.centroids is not None else 0
+        vectors, ids = self._overflow.setdefault(cluster, ([], []))
+        vectors.append(vector)
+        ids.append(item_id)
+        self._overflow_count += 1
+        if self._overflow_count >= self.min_build_size and self._overflow_count > self.rebuild_ratio * len(self.ids):
+            self.build()
+
+    def add_batch(self, vectors, item_ids):
+        self.build(extra=(vectors, item_ids))
+
+    def remove(self, item_id):
+        self._removed.add(item_id)
+        self._removed_ids = None
+        if len(self._removed) > self.rebuild_ratio * len(self):
+            self.build()
+
+    def build(self, extra=None, iterations=6, seed=0):
+        """Re-cluster every stored vector (plus ``extra`` (vectors, ids)) into roughly sqrt(n) lists"""
+        vectors, ids = [self.vectors], [self.ids]
+        if extra is not None:
+            self._overflow[None] = extra
+        for extra_vectors, extra_ids in self._overflow.values():
+            vectors.append(np.asarray(extra_vectors, dtype=np.float32).reshape(-1, self.dim))
+            ids.append(np.asarray(extra_ids, dtype=np.int64))
+        vectors, ids = np.concatenate(vectors), np.concatenate(ids)
+        if self._removed:
+            keep = ~np.isin(ids, np.fromiter(self._removed, dtype=np.int64))
+            vectors, ids = vectors[keep], ids[keep]
+        self._overflow, self._overflow_count = {}, 0
+        self._removed, self._removed_ids = set(), None
+        if len(ids) < self.min_build_size:
+            self.centroids = None
+            self.vectors, self.ids = vectors, ids
+            self.offsets = np.array([0, len(ids)], dtype=np.int64)
+            return
+
+        rng = np.random.default_rng(seed)
+        n_lists = int(np.sqrt(len(ids)))
+        sample = vectors[rng.choice(len(ids), size=min(len(ids), n_lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.where(norms == 0, 1, norms))
+
+        assignment = _nearest(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        self.centroids = centroids
+        self.vectors = vectors[order]
+        self.ids = ids[order]
+        counts = np.bincount(assignment, minlength=n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def search(self, vector):
+        """Return (item_id, similarity) of the closest stored vector, or (None, 0.0)"""
+        if self.centroids is None:
+            probes = [0]
+        else:
+            probes = np.argsort(self.centroids @ vector)[-self.nprobe:]
+        if self._removed and self._removed_ids is None:
+            self._removed_ids = np.fromiter(self._removed, dtype=np.int64)
+        best_id, best_score = None, 0.0
+        for cluster in probes:
+            start, end = self.offsets[cluster], self.offsets[cluster + 1]
+            candidates = [(self.vectors[start:end], self.ids[start:end])]
+            if cluster in self._overflow:
+                extra_vectors, extra_ids = self._overflow[cluster]
+                candidates.append((np.asarray(extra_vectors, dtype=np.float32), extra_ids))
+            for matrix, ids in candidates:
+                if not len(ids):
+                    continue
+                scores = matrix @ vector
+                if self._removed:
+                    scores = np.where(np.isin(ids, self._removed_ids), -np.inf, scores)
+                i = int(np.argmax(scores))
+                if scores[i] > best_score:
+                    best_id, best_score = int(ids[i]), float(scores[i])
+        return best_id, best_score
+
+
+def _nearest(vectors, centroids, chunk_size=65536):
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        assignment[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignment
+
+
+class SemanticCache:
+    """Near-duplicate lookup tier that maps paraphrased queries to existing cache keys.
+
+    Only cache keys are stored here; the explanation text stays in the exact
+    cache, so expired or evicted entries are never served from this tier.
+    A key the exact cache no longer has should be ``discard()``-ed so its
+    vector stops matching, and ``prune()`` drops every such key at once.
+    """
+
+    def __init__(self, vectorizer=None, threshold=DEFAULT_THRESHOLD):
+        self.vectorizer = vectorizer or HashedNgramVectorizer()
+        self.threshold = threshold
+        self._indexes = {}
+        self._keys = []
+        self._item_ids = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _index_for(self, style, model):
+        index = self._indexes.get((style, model))
+        if index is None:
+            index = self._indexes[(style, model)] = VectorIndex(self.vectorizer.dim)
+        return index
+
+    def _new_item(self, cache_key, style, model):
+        self._keys.append((cache_key, (style, model)))
+        item_id = len(self._keys) - 1
+        self._item_ids[cache_key] = item_id
+        return item_id
+
+    def add(self, prompt, style, model, cache_key):
+        with self._lock:
+            if cache_key in self._item_ids:
+                return
+        vector = self.vectorizer.embed(prompt)
+        with self._lock:
+            if cache_key not in self._item_ids:
+                self._index_for(style, model).add(vector, self._new_item(cache_key, style, model))
+
+    def load(self, entries):
+        """Bulk-load (prompt, style, model, cache_key) tuples and build the indexes once"""
+        grouped = {}
+        with self._lock:
+            for prompt, style, model, cache_key in entries:
+                if cache_key in self._item_ids:
+                    continue
+                vectors, ids = grouped.setdefault((style, model), ([], []))
+                vectors.append(self.vectorizer.embed(prompt))
+                ids.append(self._new_item(cache_key, style, model))
+            for (style, model), (vectors, ids) in grouped.items():
+                self._index_for(style, model).add_batch(vectors, ids)
+
+    def _discard(self, cache_key):
+        item_id = self._item_ids.pop(cache_key, None)
+        if item_id is None:
+            return False
+        self._indexes[self._keys[item_id][1]].remove(item_id)
+        self._keys[item_id] = None
+        return True
+
+    def discard(self, cache_key):
+        """Forget a key returned by lookup() that the exact cache no longer has.
+
+        The lookup that returned it is recounted as stale rather than a hit.
+        """
+        with self._lock:
+            if self._discard(cache_key):
+                self.hits -= 1
+                self.stale += 1
+
+    def prune_due(self, interval=PRUNE_INTERVAL):
+        """True at most once per ``interval`` seconds, for the caller to run prune()"""
+        with self._lock:
+            if time.monotonic() - self._pruned_at < interval:
+                return False
+            self._pruned_at = time.monotonic()
+            return True
+
+    def prune(self, live_keys):
+        """Drop every indexed key not in ``live_keys`` (the exact cache's keys); returns how many"""
+        live_keys = set(live_keys)
+        with self._lock:
+            dead = [key for key in self._item_ids if key not in live_keys]
+            for key in dead:
+                self._discard(key)
+            self._pruned_at = time.monotonic()
+        return len(dead)
+
+    def lookup(self, prompt, style, model):
+        """Return the cache key of the closest earlier query above the threshold, or None"""
+        vector = self.vectorizer.embed(prompt)
+        with self._lock:
+            index = self._indexes.get((style, model))
+            item_id, score = index.search(vector) if index is not None else (None, 0.0)
+            if item_id is None or score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._keys[item_id][0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "entries": len(self._item_ids),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_default_semantic_cache = None
+_default_semantic_lock = threading.Lock()
+
+
+def get_default_semantic_cache(cache=None):
+    """Return the process-wide semantic tier, or None unless EXPLAINMATE_SEMANTIC_CACHE is set.
+
+    When ``cache`` can enumerate its entries the index is warmed from it,
+    and every ``EXPLAINMATE_SEMANTIC_PRUNE_INTERVAL`` seconds keys that have
+    since expired or been evicted from it are dropped.
+    """
+    global _default_semantic_cache
+    if os.environ.get("EXPLAINMATE_SEMANTIC_CACHE", "").lower() not in ("1", "true", "yes"):
+        return None
+    enumerable = cache is not None and hasattr(cache, "iter_entries")
+    with _default_semantic_lock:
+        if _default_semantic_cache is None:
+            threshold = float(os.environ.get("EXPLAINMATE_SEMANTIC_THRESHOLD", DEFAULT_THRESHOLD))
+            semantic = SemanticCache(get_vectorizer(), threshold)
+            if enumerable:
+                semantic.load(cache.iter_entries())
+            _default_semantic_cache = semantic
+        semantic = _default_semantic_cache
+    if enumerable and semantic.prune_due():
+        semantic.prune(key for _, _, _, key in cache.iter_entries())
+    return semantic
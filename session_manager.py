@@ -0,0 +1,262 @@
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app_config import get_config
+from local_stubs import OFFLINE, get_local_supabase
+from single_flight import SingleFlight
+
+# Refresh this many seconds before the access token expires
+REFRESH_MARGIN = int(os.environ.get("EXPLAINMATE_AUTH_REFRESH_MARGIN", 120))
+# PostgREST codes for a missing, invalid or expired JWT
+AUTH_ERROR_CODES = ("PGRST301", "PGRST302", "PGRST303")
+# Verified bearer tokens kept by session_for_token(), at most this many and this long
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 300
+
+_http_client = None
+_http_client_lock = threading.Lock()
+_default_client = None
+_default_client_lock = threading.Lock()
+_token_sessions = OrderedDict()
+_token_sessions_lock = threading.Lock()
+# Supabase refresh tokens are single use, so concurrent refreshes must share one request
+_refreshes = SingleFlight()
+
+
+def token_expiry(access_token):
+    """Expiry (unix time) from a JWT's payload, or None if it can't be read.
+
+    The signature is not checked; Supabase verifies the token on every
+    request, this only decides when to refresh.
+    """
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def is_auth_error(error):
+    """True if a Supabase error means the access token was rejected"""
+    code = getattr(error, "code", None)
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return code in AUTH_ERROR_CODES or status == 401
+
+
+def _shared_http_client():
+    """One connection pool for every session's client.
+
+    Supabase clients send their auth headers with each request rather than
+    storing them on the HTTP client, so sharing the pool is safe and makes a
+    per-session client nearly free to create.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(timeout=30, follow_redirects=True)
+        return _http_client
+
+
+def _create_client(url, key, http_client=None, headers=None):
+    """A supabase-py client sharing the connection pool, or the in-memory stand-in in offline mode.
+
+    supabase-py is imported here rather than at module level, since it takes
+    longer to import than the rest of the app's startup.
+    """
+    if OFFLINE:
+        return get_local_supabase().client()
+    from supabase import ClientOptions, create_client
+
+    extra = {"headers": headers} if headers else {}
+    options = ClientOptions(persist_session=False, auto_refresh_token=False,
+                            httpx_client=http_client or _shared_http_client(), **extra)
+    return create_client(url, key, options=options)
+
+
+def get_default_client():
+    """Process-wide client with the anon key, for work outside any user's session"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            config = get_config()
+            config.require("supabase_url", "supabase_key")
+            _default_client = _create_client(config.supabase_url, config.supabase_key)
+        return _default_client
+
+
+def client_for_token(access_token):
+    """A client that queries as the user the access token belongs to, so row-level security applies"""
+    config = get_config()
+    return _create_client(config.supabase_url, config.supabase_key,
+                          headers={"Authorization": f"Bearer {access_token}"})
+
+
+class UserSession:
+    """A signed-in user's id and a Supabase client that queries as that user.
+
+    This is what the notes functions in notes_store.py take, so they work the
+    same for a Streamlit session and for a request to the API service.
+    ``access_token`` is the user's current token, for work done as the user
+    after the request, such as the feedback events the event writer sends.
+    """
+
+    def __init__(self, user_id, client, access_token=None):
+        self.user_id = user_id
+        self.client = client
+        self.access_token = access_token
+
+
+def verify_token(access_token):
+    """Return the user id an access token was issued to, or None if it isn't valid.
+
+    With ``SUPABASE_JWT_SECRET`` configured the signature is checked locally;
+    otherwise Supabase is asked who the token belongs to.
+    """
+    config = get_config()
+    try:
+        if config.supabase_jwt_secret:
+            import jwt
+            claims = jwt.decode(access_token, config.supabase_jwt_secret,
+                                algorithms=["HS256"], audience="authenticated")
+            return claims.get("sub")
+        user = get_default_client().auth.get_user(access_token)
+        return user.user.id if user and user.user else None
+    except Exception as e:
+        print(f"Error verifying access token: {str(e)}")
+        return None
+
+
+def session_for_token(access_token):
+    """UserSession for a bearer token sent to the API service, or None if it isn't valid.
+
+    Verified tokens are cached until they expire (at most ``TOKEN_CACHE_TTL``
+    seconds), so a client's requests reuse one session and Supabase client.
+    """
+    now = time.time()
+    with _token_sessions_lock:
+        cached = _token_sessions.get(access_token)
+        if cached is not None:
+            valid_until, session = cached
+            if valid_until > now:
+                _token_sessions.move_to_end(access_token)
+                return session
+            del _token_sessions[access_token]
+
+    user_id = verify_token(access_token)
+    if not user_id:
+        return None
+    session = UserSession(user_id, client_for_token(access_token), access_token)
+    valid_until = min(token_expiry(access_token) or now, now + TOKEN_CACHE_TTL)
+    with _token_sessions_lock:
+        _token_sessions[access_token] = (valid_until, session)
+        while len(_token_sessions) > TOKEN_CACHE_SIZE:
+            _token_sessions.popitem(last=False)
+    return session
+
+
+class SessionManager:
+    """Auth state and Supabase client for one browser session.
+
+    Kept in ``st.session_state``, so every browser session signs in and
+    queries with its own client and token instead of sharing the module
+    client. Checking whether the user is signed in is a local JWT expiry
+    check; the token is refreshed in the background once it is within
+    ``REFRESH_MARGIN`` seconds of expiring, and only a token that has
+    already expired makes the caller wait for a refresh.
+    """
+
+    def __init__(self, url, key, http_client=None):
+        self.client = _create_client(url, key, http_client)
+        self.user = None
+        self.session = None
+        self.expires_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _set_session(self, session):
+        with self._lock:
+            self.session = session
+            self.user = session.user if session else None
+            if session is None:
+                self.expires_at = None
+            else:
+                self.expires_at = token_expiry(session.access_token) or session.expires_at
+
+    def user_session(self):
+        """UserSession for the signed-in user, or None"""
+        user, session = self.user, self.session
+        return UserSession(user.id, self.client, session.access_token if session else None) if user else None
+
+    def sign_in(self, email, password):
+        res = self.client.auth.sign_in_with_password({"email": email, "password": password})
+        self._set_session(res.session)
+        return res
+
+    def sign_up(self, email, password):
+        return self.client.auth.sign_up({"email": email, "password": password})
+
+    def sign_out(self):
+        try:
+            if self.session is not None:
+                self.client.auth.sign_out()
+        except Exception as e:
+            print(f"Error signing out: {str(e)}")
+        self._set_session(None)
+
+    def is_authenticated(self):
+        """Whether there is a usable session, without a network call unless the token has expired"""
+        if self.session is None:
+            return False
+        remaining = (self.expires_at or 0) - time.time()
+        if remaining <= 0:
+            return self.refresh()
+        if remaining < REFRESH_MARGIN:
+            self._refresh_in_background()
+        return True
+
+    def refresh(self):
+        """Exchange the refresh token for a new session; returns True on success"""
+        session = self.session
+        if session is None:
+            return False
+        refresh_token = session.refresh_token
+
+        def do_refresh():
+            if self.session is None or self.session.refresh_token != refresh_token:
+                # Another caller already used this token
+                return self.session
+            return self.client.auth.refresh_session(refresh_token).session
+
+        try:
+            new_session = _refreshes.do(refresh_token, do_refresh)
+        except Exception as e:
+            print(f"Error refreshing session: {str(e)}")
+            if (self.expires_at or 0) <= time.time():
+                self._set_session(None)
+            return False
+        if new_session is None:
+            return False
+        if new_session is not self.session:
+            self._set_session(new_session)
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="auth-refresh", daemon=True).start()
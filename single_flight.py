@@ -0,0 +1,264 @@
+import asyncio
+import threading
+
+# How often a reader waiting for a chunk checks whether it was cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _SharedStream:
+    """Buffers the chunks of one upstream stream so any number of readers can replay it"""
+
+    def __init__(self, cancel_abandoned=False):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+        self.cancel_abandoned = cancel_abandoned
+        self.cancelled = False
+        self.condition = threading.Condition()
+
+    def attach(self):
+        """Count a new reader; False if the stream was already cancelled"""
+        with self.condition:
+            if self.cancelled:
+                return False
+            self.readers += 1
+            return True
+
+    def detach(self):
+        """Count a reader out; returns True if that cancelled the stream"""
+        with self.condition:
+            self.readers -= 1
+            if self.readers or self.done or not self.cancel_abandoned:
+                return False
+            self.cancelled = True
+            return True
+
+    def pump(self, source, on_finish):
+        try:
+            for chunk in source:
+                with self.condition:
+                    if self.cancelled:
+                        break
+                    self.chunks.append(chunk)
+                    self.condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.cancelled and hasattr(source, "close"):
+                # Closing the generator ends the upstream request and frees its slot
+                source.close()
+            on_finish()
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def reader(self, on_cancel, cancel=None):
+        index = 0
+        try:
+            while True:
+                with self.condition:
+                    while index >= len(self.chunks) and not self.done:
+                        if cancel is not None and cancel.is_set():
+                            return
+                        self.condition.wait(CANCEL_POLL_INTERVAL if cancel is not None else None)
+                    chunks = self.chunks[index:]
+                    finished = self.done
+                for chunk in chunks:
+                    if cancel is not None and cancel.is_set():
+                        return
+                    yield chunk
+                index += len(chunks)
+                if finished and index >= len(self.chunks):
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            if self.detach():
+                on_cancel()
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one upstream call.
+
+    The first caller for a key originates the call; callers arriving while it
+    is in flight wait for and share its result (``do``) or replay its chunks
+    as they arrive (``stream``). Once the call finishes the key is released,
+    so later callers start a fresh call (normally answered by the cache).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.originated = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            owner = call is None
+            if owner:
+                call = self._calls[key] = _Call()
+                self.originated += 1
+            else:
+                self.coalesced += 1
+
+        if owner:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self, key):
+        """Whether a call or stream for ``key`` is running (a new caller would join it)"""
+        with self._lock:
+            return key in self._calls or key in self._streams
+
+    def stream(self, key, fn, cancel=None):
+        """Return an iterator over the chunks of ``fn()``, shared with concurrent callers.
+
+        The upstream iterator is drained on a background thread, so it runs to
+        completion (and its result can be cached) even if the caller that
+        started it stops reading. ``cancel`` is an optional threading.Event:
+        once it is set the returned iterator ends, even while waiting for a
+        chunk, and if the stream was started with one and nobody else is still
+        reading, ``fn()``'s iterator is closed at its next chunk. Later callers
+        for the key then start a fresh stream.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is not None and shared.attach():
+                self.coalesced += 1
+                return shared.reader(lambda: self._cancelled(key, shared), cancel)
+            shared = self._streams[key] = _SharedStream(cancel_abandoned=cancel is not None)
+            shared.attach()
+            self.originated += 1
+
+        def release():
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+
+        thread = threading.Thread(target=shared.pump, args=(fn(), release), daemon=True)
+        thread.start()
+        return shared.reader(lambda: self._cancelled(key, shared), cancel)
+
+    def _cancelled(self, key, shared):
+        with self._lock:
+            self.cancelled += 1
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def stats(self):
+        total = self.originated + self.coalesced
+        return {
+            "originated": self.originated,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._calls) + len(self._streams),
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
+
+
+class _AsyncSharedStream:
+    """asyncio counterpart of ``_SharedStream`` for async iterators"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()
+
+    def _notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def pump(self, source, on_finish):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            on_finish()
+            self.done = True
+            self._notify()
+
+    async def reader(self):
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                index += 1
+                yield self.chunks[index - 1]
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self.changed.wait()
+
+
+class AsyncSingleFlight:
+    """``SingleFlight.stream`` for coroutines: concurrent streams of a key share one upstream stream.
+
+    Use one instance per event loop.
+    """
+
+    def __init__(self):
+        self._streams = {}
+        self._tasks = set()
+        self.originated = 0
+        self.coalesced = 0
+
+    def in_flight(self, key):
+        return key in self._streams
+
+    def stream(self, key, fn):
+        """Return an async iterator over the chunks of ``fn()``, shared with concurrent callers.
+
+        The upstream iterator is drained by its own task, so it runs to
+        completion even if the caller that started it disconnects.
+        """
+        shared = self._streams.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            return shared.reader()
+        shared = self._streams[key] = _AsyncSharedStream()
+        self.originated += 1
+
+        def release():
+            self._streams.pop(key, None)
+
+        task = asyncio.ensure_future(shared.pump(fn(), release))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return shared.reader()
+
+    def stats(self):
+        total = self.originated + self.coalesced
+        return {
+            "originated": self.originated,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._streams),
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
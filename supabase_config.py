@@ -1,31 +1,48 @@
 import streamlit as st
-from supabase import create_client, Client
 
-# Get Supabase credentials from Streamlit secrets
-SUPABASE_URL = st.secrets["SUPABASE_URL"]
-SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
+from app_config import get_config
+from session_manager import SessionManager
 
-# Initialize Supabase client
+# Supabase credentials from the environment or .streamlit/secrets.toml
+SUPABASE_URL = get_config().supabase_url
+SUPABASE_KEY = get_config().supabase_key
+
+# Clients are created on first use: the process-wide one (session_manager.get_default_client)
+# for background event writes, and each browser session's own from get_client()
 try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-except Exception as e:
+    get_config().require("supabase_url", "supabase_key")
+except KeyError as e:
     st.error(f"Failed to initialize Supabase client. Please check your credentials in secrets.toml. Error: {str(e)}")
     st.stop()
 
+def get_session_manager():
+    """Return this browser session's SessionManager, creating it on first use"""
+    manager = st.session_state.get('session_manager')
+    if manager is None:
+        manager = st.session_state['session_manager'] = SessionManager(SUPABASE_URL, SUPABASE_KEY)
+    return manager
+
+
+def get_client():
+    """Supabase client authenticated as the current browser session's user"""
+    return get_session_manager().client
+
+
+def get_user_session():
+    """UserSession for the current browser session's user, or None if not signed in"""
+    if get_user_id() is None:
+        return None
+    return get_session_manager().user_session()
+
+
 def init_session():
-    """Initialize or restore user session"""
+    """Initialize or restore user session (a local token check, no network call)"""
     try:
-        # Check if we have a stored session first
-        if 'user' in st.session_state and st.session_state['user']:
-            return True
-            
-        # Try to get session from Supabase
-        session = supabase.auth.get_session()
-        if session and session.user:
-            st.session_state['user'] = session.user
-            st.session_state['session'] = session
+        manager = get_session_manager()
+        if manager.is_authenticated():
+            st.session_state['user'] = manager.user
+            st.session_state['session'] = manager.session
             return True
-            
         return False
     except Exception as e:
         print(f"Error initializing session: {str(e)}")
@@ -49,19 +66,13 @@ def get_user_id():
 
 
 def refresh_session():
-    """Refresh the user's session if needed"""
+    """Refresh the user's session now, e.g. after the server rejected the token"""
     try:
-        if 'session' in st.session_state:
-            # Get fresh session
-            session = supabase.auth.get_session()
-            if session:
-                # Update session in session state
-                st.session_state['session'] = session
-                return True
+        manager = get_session_manager()
+        if manager.refresh():
+            st.session_state['session'] = manager.session
+            return True
         return False
     except Exception as e:
         print(f"Error refreshing session: {str(e)}")
         return False
-
-# Initialize session when module is imported
-init_session()
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""Per-day LLM token usage, by user and model.
+
+Usage:
+    python usage_ledger.py [--day 2024-05-01] [--user <user id>] [--days 7]
+
+Prints the recorded usage, one row per day, user and model.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "usage.db")
+# Recorded for calls made outside any user's session, e.g. batch_explain.py
+ANONYMOUS = "anonymous"
+COLUMNS = ("day", "user_id", "model", "requests", "prompt_tokens", "completion_tokens", "total_tokens")
+
+_default_ledger = None
+_default_ledger_lock = threading.Lock()
+
+
+def today():
+    """Current accounting day (UTC) as YYYY-MM-DD"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def seconds_until_tomorrow():
+    now = datetime.now(timezone.utc)
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+class UsageLedger:
+    """SQLite totals of requests and tokens per (day, user, model).
+
+    Each call adds to its day's row, so the file stays small however many
+    calls are made and any worker process can read the same totals.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS usage (
+                    day TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    requests INTEGER NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    total_tokens INTEGER NOT NULL,
+                    PRIMARY KEY (day, user_id, model)
+                )"""
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, user_id, model, prompt_tokens, completion_tokens, day=None):
+        prompt_tokens, completion_tokens = int(prompt_tokens or 0), int(completion_tokens or 0)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """INSERT INTO usage VALUES (?, ?, ?, 1, ?, ?, ?)
+                   ON CONFLICT (day, user_id, model) DO UPDATE SET
+                       requests = requests + 1,
+                       prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                       completion_tokens = completion_tokens + excluded.completion_tokens,
+                       total_tokens = total_tokens + excluded.total_tokens""",
+                (day or today(), user_id or ANONYMOUS, model or "", prompt_tokens, completion_tokens,
+                 prompt_tokens + completion_tokens),
+            )
+
+    def tokens_today(self, user_id):
+        """Total tokens the user has used today, across models"""
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(total_tokens), 0) FROM usage WHERE day = ? AND user_id = ?",
+            (today(), user_id or ANONYMOUS),
+        ).fetchone()
+        return row[0]
+
+    def rows(self, day=None, user_id=None, days=None):
+        """Usage rows as dicts, newest day first.
+
+        Args:
+            day: Only this day (YYYY-MM-DD)
+            user_id: Only this user
+            days: Only the last ``days`` days, including today
+        """
+        query, params = "SELECT * FROM usage WHERE 1 = 1", []
+        if day:
+            query += " AND day = ?"
+            params.append(day)
+        if days:
+            since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+            query += " AND day >= ?"
+            params.append(since)
+        if user_id:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        query += " ORDER BY day DESC, total_tokens DESC"
+        return [dict(zip(COLUMNS, row)) for row in self._connect().execute(query, params).fetchall()]
+
+
+def get_usage_ledger():
+    """Return the process-wide ledger, stored at ``EXPLAINMATE_USAGE_PATH``"""
+    global _default_ledger
+    with _default_ledger_lock:
+        if _default_ledger is None:
+            _default_ledger = UsageLedger(os.environ.get("EXPLAINMATE_USAGE_PATH", DEFAULT_LEDGER_PATH))
+        return _default_ledger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--day", help="only this day (YYYY-MM-DD, UTC)")
+    parser.add_argument("--user", help="only this user id")
+    parser.add_argument("--days", type=int, help="only the last N days")
+    args = parser.parse_args()
+
+    rows = get_usage_ledger().rows(day=args.day, user_id=args.user, days=args.days)
+    print(f"{'day':10}  {'user':36}  {'model':44}  {'requests':>8}  {'prompt':>9}  {'completion':>10}  {'total':>9}")
+    for row in rows:
+        print(f"{row['day']:10}  {row['user_id']:36}  {row['model'][:44]:44}  {row['requests']:8d}  "
+              f"{row['prompt_tokens']:9d}  {row['completion_tokens']:10d}  {row['total_tokens']:9d}")
+
+
+if __name__ == "__main__":
+    main()